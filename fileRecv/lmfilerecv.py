@@ -4,70 +4,802 @@
 
 import os
 import sys
+import gzip
 import json
+import time
+import zlib
+import socket
+import hashlib
+import operator
+import re
+import tarfile
+import threading
 import traceback
-from flask import Flask, request, jsonify
+from collections import OrderedDict
+from flask import Flask, request, jsonify, g, Response
+
+# 성능 지표는 워커와 같은 구현(worker/metrics.py)을 사용
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker'))
+from metrics import Metrics
+
+# 운영용 WSGI 서버 (설치되어 있지 않으면 Flask 개발 서버로 실행)
+try:
+    from waitress import serve  # pip install waitress
+except ImportError:
+    serve = None
 
 # --- 전역 설정 변수 ---
 CONFIG = {}
 
+# --- 성능 지표 ---
+
+# 지표 이름 -> (Prometheus 타입, 설명)
+METRIC_HELP = {
+    'filerecv_requests_total': ('counter', '처리한 HTTP 요청 수. route: 경로, status: 응답 코드'),
+    'filerecv_request_seconds': ('histogram', 'HTTP 요청 하나의 처리 시간(초)'),
+    'filerecv_save_seconds': ('histogram', '수신한 파일을 디스크에 저장하는 데 걸린 시간(초)'),
+    'filerecv_received_bytes_total': ('counter', '저장한 파일의 총 바이트 수'),
+    'filerecv_transfer_bytes_total': ('counter', '파일 업로드 요청으로 수신한 본문 바이트 수. mode: full(전체 파일), delta(변경분), batch(묶음)'),
+    'filerecv_chunk_bytes_total': ('counter', '분할 업로드로 수신한 조각의 바이트 수'),
+    'filerecv_batch_files_total': ('counter', '묶음 업로드로 저장한 파일 수'),
+    'filerecv_agent_last_seen_timestamp': ('gauge', 'lmagent의 마지막 heartbeat 시각(유닉스 시간). deviceid: 장비 ID'),
+    'filerecv_agent_pending_files': ('gauge', 'lmagent가 heartbeat 시점에 아직 전송하지 못한 파일 수'),
+    'filerecv_agent_lag_seconds': ('gauge', 'lmagent가 아직 전송하지 못한 가장 오래된 파일의 수정 시간부터 heartbeat까지의 시간(초)'),
+}
+
+METRICS = Metrics(METRIC_HELP)
+
+# --- 워커 알림 ---
+
+def notify_worker(filepath):
+    """
+    config.json에 worker_notify_port가 설정된 경우, 저장된 파일 경로를 로컬 UDP로 워커에 알림.
+    (워커의 이벤트 기반 모드에서 즉시 처리하기 위함. 실패해도 워커의 보정 스캔에서 처리됩니다.)
+    """
+    port = CONFIG.get('worker_notify_port')
+    if not port:
+        return
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(os.path.abspath(filepath).encode('utf-8'), ('127.0.0.1', int(port)))
+    except Exception as e:
+        print(f"[WARNING] 워커 알림 전송 실패: {e}")
+
+# --- 에이전트 상태 ---
+
+# deviceid -> 마지막 heartbeat 정보 (프로세스별로 유지되며, 재시작하면 다음 heartbeat부터 다시 기록)
+AGENT_STATUS = {}
+_AGENT_STATUS_LOCK = threading.Lock()
+
+
+def record_heartbeat(deviceid, pending=0, lag=0.0):
+    """
+    lmagent의 heartbeat(살아있음, 미전송 파일 수, 지연 시간)를 기록하고 성능 지표에 반영.
+    """
+    now = time.time()
+    status = {
+        'deviceid': deviceid,
+        'last_seen': now,
+        'remote_addr': request.remote_addr,
+        'pending': pending,
+        'lag_seconds': lag,
+    }
+    with _AGENT_STATUS_LOCK:
+        AGENT_STATUS[deviceid] = status
+    METRICS.set('filerecv_agent_last_seen_timestamp', now, deviceid=deviceid)
+    METRICS.set('filerecv_agent_pending_files', pending, deviceid=deviceid)
+    METRICS.set('filerecv_agent_lag_seconds', lag, deviceid=deviceid)
+    return status
+
+# --- 델타 전송 ---
+
+# 델타/압축 전송에 사용하는 폼 필드 (워커가 읽는 파라미터 .json에는 저장하지 않음)
+TRANSFER_FIELDS = ('delta', 'ops', 'sha1', 'base_sha1', 'encoding')
+
+
+class UploadError(ValueError):
+    """
+    수신한 델타/압축 본문이 올바르지 않은 경우. (400 응답)
+    """
+
+
+def remove_file(filepath):
+    """
+    파일을 삭제. (이미 없으면 무시)
+    """
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
+
+# 저장 중에 만드는 임시 파일({경로}.{pid}.{스레드}[.{순번}].tmp)과 묶음 업로드 교체 중의 이전 내용 하드 링크(.tmp.bak)
+STAGED_FILE_PATTERN = re.compile(r'\.(\d+)\.\d+(?:\.\d+)?\.tmp(?:\.bak)?$')
+
+
+def is_process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # Windows에서는 waitress 단일 프로세스로 실행하므로, 시작할 때 남아 있는 다른 pid의 파일은 모두 종료된 프로세스의 것
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def cleanup_staged_files(save_path):
+    """
+    저장 도중(묶음 업로드의 rename 도중 포함) 프로세스가 종료되어 남은 임시 파일과 .bak 하드 링크를 삭제.
+    (교체가 끝난 파일은 이미 SHA-1을 확인한 새 내용이며, 묶음 전체는 lmagent가 응답을 받지 못해 다시 전송합니다)
+    여러 프로세스로 실행 중일 때 다른 프로세스가 쓰고 있는 파일은 지우지 않도록, 실행 중이 아닌 pid의 파일만 삭제합니다.
+    """
+    removed = 0
+    for dirpath, dirnames, filenames in os.walk(save_path):
+        # .uploads(분할 업로드), .leases(워커 lease) 등 .으로 시작하는 폴더는 다른 방식으로 관리
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for filename in filenames:
+            match = STAGED_FILE_PATTERN.search(filename)
+            if match and not is_process_alive(int(match.group(1))):
+                remove_file(os.path.join(dirpath, filename))
+                removed += 1
+    if removed:
+        print(f"[INFO] 이전 실행에서 남은 임시 파일 {removed}개를 삭제했습니다.")
+    return removed
+
+
+def file_sha1(filepath):
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def rolling_checksum(block):
+    """
+    rsync 방식의 약한 체크섬 ((b << 16) | a). lmagent의 rolling_checksum과 같은 값을 계산해야 합니다.
+    """
+    a = sum(block) % 65536
+    b = sum(map(operator.mul, range(len(block), 0, -1), block)) % 65536
+    return (b << 16) | a
+
+
+def block_signatures(filepath, block_size):
+    """
+    저장된 파일을 block_size 단위로 나눈 블록별 [약한 체크섬, MD5] 목록. (마지막 블록은 block_size보다 짧을 수 있음)
+    """
+    signatures = []
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            signatures.append([rolling_checksum(block), hashlib.md5(block).hexdigest()])
+    return signatures
+
+
+# 파일 경로 -> (크기, mtime_ns, SHA-1, {블록 크기: 블록 체크섬 목록}). 파일이 바뀌지 않았으면 다시 계산하지 않음
+SIGNATURE_CACHE = OrderedDict()
+_SIGNATURE_CACHE_LOCK = threading.Lock()
+
+
+def get_signature(filepath, block_size=0):
+    """
+    저장된 파일의 (SHA-1, 블록별 체크섬 목록)을 반환. (block_size가 0이면 블록 목록은 None)
+    같은 파일에 대한 조회는 크기와 mtime이 같은 동안 캐시된 값을 사용하며, 캐시는 최근 signature_cache_size개 파일만 보관합니다.
+    """
+    st = os.stat(filepath)
+    with _SIGNATURE_CACHE_LOCK:
+        entry = SIGNATURE_CACHE.get(filepath)
+        if entry is not None and entry[:2] == (st.st_size, st.st_mtime_ns):
+            SIGNATURE_CACHE.move_to_end(filepath)
+        else:
+            entry = None
+    if entry is None:
+        entry = (st.st_size, st.st_mtime_ns, file_sha1(filepath), {})
+    blocks = None
+    if block_size > 0:
+        blocks = entry[3].get(block_size)
+        if blocks is None:
+            blocks = entry[3][block_size] = block_signatures(filepath, block_size)
+    with _SIGNATURE_CACHE_LOCK:
+        SIGNATURE_CACHE[filepath] = entry
+        SIGNATURE_CACHE.move_to_end(filepath)
+        while len(SIGNATURE_CACHE) > int(CONFIG.get('signature_cache_size', 256)):
+            SIGNATURE_CACHE.popitem(last=False)
+    return entry[2], blocks
+
+
+def read_exact(stream, length):
+    data = stream.read(length)
+    if len(data) != length:
+        raise UploadError("델타 본문이 명령보다 짧음")
+    return data
+
+
+def write_upload(stream, temp_filepath, encoding=None, ops=None, base_filepath=None):
+    """
+    수신한 본문을 (encoding이 gzip이면 압축을 풀어) 임시 파일에 쓰고, 기록한 파일의 (SHA-1, 크기)를 반환.
+    ops가 주어지면 본문은 델타이며, 기존 파일(base_filepath)의 구간 복사(["copy", 위치, 길이])와
+    본문의 새 데이터(["data", 길이])를 순서대로 이어 붙여 전체 파일을 재구성합니다.
+    기록 중 오류(본문 오류, 디스크 부족 등)가 나면 임시 파일을 지우고 예외를 다시 발생시킵니다.
+    """
+    try:
+        return _write_upload(stream, temp_filepath, encoding, ops, base_filepath)
+    except BaseException:
+        remove_file(temp_filepath)
+        raise
+
+
+def _write_upload(stream, temp_filepath, encoding, ops, base_filepath):
+    if encoding == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream)
+    digest = hashlib.sha1()
+    size = 0
+    with open(temp_filepath, 'wb') as out:
+        def emit(chunk):
+            nonlocal size
+            out.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+
+        if ops is None:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                emit(chunk)
+        else:
+            with open(base_filepath, 'rb') as base:
+                base_size = os.fstat(base.fileno()).st_size
+                for op in ops:
+                    if op[0] == 'copy':
+                        offset, length = int(op[1]), int(op[2])
+                        if offset < 0 or length < 0 or offset + length > base_size:
+                            raise UploadError(f"기존 파일 범위를 벗어난 복사 명령: {op}")
+                        base.seek(offset)
+                        while length > 0:
+                            chunk = base.read(min(length, 1024 * 1024))
+                            emit(chunk)
+                            length -= len(chunk)
+                    elif op[0] == 'data':
+                        length = int(op[1])
+                        while length > 0:
+                            chunk = read_exact(stream, min(length, 1024 * 1024))
+                            emit(chunk)
+                            length -= len(chunk)
+                    else:
+                        raise UploadError(f"알 수 없는 델타 명령: {op}")
+            if stream.read(1):
+                raise UploadError("델타 본문이 명령보다 김")
+        # rename 전에 디스크에 기록되었음을 보장 (전원 장애 시 빈 파일로 교체되는 것을 방지)
+        out.flush()
+        os.fsync(out.fileno())
+    return digest.hexdigest(), size
+
+
+def fsync_dir(dirpath):
+    """
+    폴더를 fsync하여 rename 결과가 디스크에 기록되었음을 보장. (폴더를 열 수 없는 Windows에서는 건너뜀)
+    """
+    if os.name == 'nt':
+        return
+    fd = os.open(dirpath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def save_received_file(params, transfer, stream, transfer_bytes):
+    """
+    수신한 본문(stream)을 [save_path]/[deviceid]/[dataid]/[orgfilename]에 저장하고 파라미터 .json을 기록.
+    /opcFileSave와 분할 업로드 완료(/opcUpload/<id>/commit)가 함께 사용하며, (응답 dict, 상태 코드)를 반환합니다.
+    """
+    deviceid = params.get('deviceid')
+    dataid = params.get('dataid')
+    org_filename = params.get('orgfilename')
+
+    if not deviceid or not dataid or not org_filename:
+        return {"success": False, "error": "deviceid, dataid 또는 orgfilename이 누락됨"}, 400
+
+    # 파일 저장 경로 설정
+    save_path = CONFIG.get('save_path')
+    if not save_path:
+        return {"success": False, "error": "서버에 save_path가 설정되지 않음"}, 500
+
+    target_dir = os.path.join(save_path, deviceid, dataid)
+    os.makedirs(target_dir, exist_ok=True) # 폴더가 없으면 생성
+
+    filepath = os.path.join(target_dir, org_filename)
+    param_filepath = filepath + '.json'
+
+    # 파일 저장 시 충돌을 피하기 위해 임시 파일명 사용 후 rename (같은 파일을 동시에 받는 요청끼리도 겹치지 않도록 스레드/프로세스별 이름 사용)
+    temp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    save_started = time.perf_counter()
+    is_delta = transfer.get('delta') == '1'
+    ops = None
+    if is_delta:
+        # 기존 파일이 lmagent가 델타를 만든 기준 파일과 다르면 전체 파일을 다시 보내도록 409 응답
+        if not os.path.isfile(filepath) or get_signature(filepath)[0] != transfer.get('base_sha1'):
+            return {"success": False, "error": "기준 파일이 일치하지 않음"}, 409
+        ops = json.loads(transfer.get('ops', '[]'))
+    try:
+        sha1, size = write_upload(stream, temp_filepath, transfer.get('encoding'), ops, filepath)
+    except (UploadError, EOFError, gzip.BadGzipFile, zlib.error) as e:
+        print(f"[WARNING] 수신한 본문이 올바르지 않음: {filepath} ({e})")
+        return {"success": False, "error": str(e)}, 400
+    if transfer.get('sha1') and sha1 != transfer['sha1']:
+        # 재구성(또는 전송)된 파일이 lmagent의 파일과 다르면 기존 파일을 그대로 두고 409 응답
+        remove_file(temp_filepath)
+        print(f"[WARNING] 파일 검증 실패 (SHA-1 불일치): {filepath}")
+        return {"success": False, "error": "SHA-1 불일치"}, 409
+    try:
+        os.replace(temp_filepath, filepath)
+    except OSError:
+        remove_file(temp_filepath)
+        raise
+    METRICS.observe('filerecv_save_seconds', time.perf_counter() - save_started)
+    METRICS.inc('filerecv_received_bytes_total', size)
+    METRICS.inc('filerecv_transfer_bytes_total', transfer_bytes, mode='delta' if is_delta else 'full')
+    if is_delta:
+        print(f"[INFO] 델타 수신 및 파일 재구성 완료: {filepath} (수신 {transfer_bytes}바이트, 파일 {size}바이트)")
+    else:
+        print(f"[INFO] 파일 수신 및 저장 완료: {filepath}")
+
+    # 파라미터 .json 파일로 저장 (워커가 쓰는 도중의 파일을 읽지 않도록 임시 파일 사용 후 rename)
+    temp_param_filepath = f"{param_filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_param_filepath, 'w', encoding='utf-8') as f:
+            json.dump(params, f, indent=2)
+        os.replace(temp_param_filepath, param_filepath)
+    except OSError:
+        remove_file(temp_param_filepath)
+        raise
+
+    notify_worker(filepath)
+
+    return {"success": True, "message": f"{org_filename} 저장 완료"}, 200
+
+# --- 분할 업로드 ---
+
+# 분할 업로드 열기 요청에서 파라미터 .json에 저장하지 않는 필드
+UPLOAD_FIELDS = ('size', 'payload_sha1')
+UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{40}')
+
+_UPLOAD_LOCKS = {}
+_UPLOAD_LOCKS_LOCK = threading.Lock()
+
+
+def get_upload_dir():
+    """
+    분할 업로드 중인 본문(.part)과 정보(.json)를 보관하는 폴더. (기본: [save_path]/.uploads, 워커는 .으로 시작하는 폴더를 스캔하지 않음)
+    """
+    upload_dir = CONFIG.get('upload_dir') or os.path.join(CONFIG.get('save_path', ''), '.uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    return upload_dir
+
+
+def get_upload_lock(upload_id):
+    """
+    같은 업로드에 대한 조각 추가/완료 요청을 순서대로 처리하기 위한 잠금. (같은 프로세스 안에서만 유효하며,
+    여러 프로세스로 실행할 때 겹친 요청은 조각/전체 SHA-1 확인으로 걸러집니다)
+    """
+    with _UPLOAD_LOCKS_LOCK:
+        return _UPLOAD_LOCKS.setdefault(upload_id, threading.Lock())
+
+
+def upload_paths(upload_id):
+    upload_dir = get_upload_dir()
+    return os.path.join(upload_dir, upload_id + '.json'), os.path.join(upload_dir, upload_id + '.part')
+
+
+def load_upload(upload_id):
+    """
+    분할 업로드 정보를 읽어 (정보 dict, .part 경로)를 반환. 없는 업로드면 (None, None).
+    """
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        return None, None
+    meta_path, part_path = upload_paths(upload_id)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f), part_path
+    except FileNotFoundError:
+        return None, None
+
+
+def remove_upload(upload_id):
+    for path in upload_paths(upload_id):
+        remove_file(path)
+    with _UPLOAD_LOCKS_LOCK:
+        _UPLOAD_LOCKS.pop(upload_id, None)
+
+
+def expire_uploads():
+    """
+    upload_expire(초, 기본 1일) 동안 이어서 전송되지 않은 분할 업로드를 삭제.
+    """
+    expire = float(CONFIG.get('upload_expire', 86400))
+    now = time.time()
+    upload_dir = get_upload_dir()
+    for name in os.listdir(upload_dir):
+        path = os.path.join(upload_dir, name)
+        try:
+            if now - os.path.getmtime(path) > expire:
+                os.remove(path)
+                print(f"[INFO] 만료된 분할 업로드 삭제: {path}")
+        except FileNotFoundError:
+            pass
+
 # --- 웹 서버 (파일 수신) ---
 app = Flask(__name__)
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    /metrics 이외의 요청마다 경로와 응답 코드별 요청 수, 처리 시간을 기록.
+    """
+    route = request.url_rule.rule if request.url_rule is not None else 'unknown'
+    if route != '/metrics':
+        METRICS.inc('filerecv_requests_total', route=route, status=response.status_code)
+        METRICS.observe('filerecv_request_seconds', time.perf_counter() - g.request_started, route=route)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    수신 서버의 성능 지표를 Prometheus 텍스트 형식으로 반환.
+    """
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/opcFileSignature', methods=['POST'])
+def file_signature():
+    """
+    lmagent가 델타 전송 전에 호출. 저장된 파일의 크기와 SHA-1, lmagent가 마지막으로 보낸 버전(base_sha1)과의 일치 여부,
+    (block_size를 주면) 블록별 체크섬을 반환합니다.
+    """
+    try:
+        deviceid = request.form.get('deviceid')
+        dataid = request.form.get('dataid')
+        org_filename = request.form.get('orgfilename')
+        if not deviceid or not dataid or not org_filename:
+            return jsonify({"success": False, "error": "deviceid, dataid 또는 orgfilename이 누락됨"}), 400
+
+        filepath = os.path.join(CONFIG.get('save_path', ''), deviceid, dataid, org_filename)
+        if not os.path.isfile(filepath):
+            return jsonify({"success": True, "exists": False})
+
+        block_size = int(request.form.get('block_size') or 0)
+        sha1, blocks = get_signature(filepath, block_size)
+        result = {
+            "success": True,
+            "exists": True,
+            "size": os.path.getsize(filepath),
+            "sha1": sha1,
+            "match": sha1 == request.form.get('base_sha1'),
+        }
+        if blocks is not None:
+            result["blocks"] = blocks
+        return jsonify(result)
+
+    except Exception as e:
+        print(f"[ERROR] 파일 정보 조회 중 오류 발생: {e}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @app.route('/opcFileSave', methods=['POST'])
 def file_receiver():
     """
     lmagent로부터 파일 및 파라미터를 수신하여 저장.
+    delta가 '1'이면 본문은 기존 파일(base_sha1)에 대한 델타이며, 전체 파일을 재구성하여 sha1을 확인한 뒤 교체합니다.
+    (encoding이 'gzip'이면 본문의 압축을 풀어 저장)
     """
     try:
         # 폼 데이터에서 파라미터 추출
-        params = {key: request.form[key] for key in request.form}
-        deviceid = params.get('deviceid')
-        dataid = params.get('dataid')
-        org_filename = params.get('orgfilename')
-
-        if not deviceid or not dataid or not org_filename:
-            return jsonify({"success": False, "error": "deviceid, dataid 또는 orgfilename이 누락됨"}), 400
-
-        # 파일 저장 경로 설정
-        save_path = CONFIG.get('save_path')
-        if not save_path:
-            return jsonify({"success": False, "error": "서버에 save_path가 설정되지 않음"}), 500
-            
-        target_dir = os.path.join(save_path, deviceid, dataid)
-        os.makedirs(target_dir, exist_ok=True) # 폴더가 없으면 생성
-        
-        filepath = os.path.join(target_dir, org_filename)
-        param_filepath = filepath + '.json'
-
-        # 파일 저장
+        params = {key: request.form[key] for key in request.form if key not in TRANSFER_FIELDS}
+        transfer = {key: request.form[key] for key in TRANSFER_FIELDS if key in request.form}
+        if params.get('dataid') == '-' and params.get('deviceid'):
+            # 이전 버전 lmagent의 live-check (파일 없이 dataid '-'로 전송). 폴더를 만들지 않고 heartbeat로 기록.
+            record_heartbeat(params['deviceid'])
+            return jsonify({"success": True, "message": "live-check"})
         file = request.files.get('filename')
-        if file:
-            # 파일 저장 시 충돌을 피하기 위해 임시 파일명 사용 후 rename
-            temp_filepath = filepath + ".tmp"
-            file.save(temp_filepath)
-            os.rename(temp_filepath, filepath)
-            print(f"[INFO] 파일 수신 및 저장 완료: {filepath}")
-        else:
+        if not file:
             return jsonify({"success": False, "error": "파일 데이터가 없음"}), 400
 
-        # 파라미터 .json 파일로 저장
-        with open(param_filepath, 'w', encoding='utf-8') as f:
-            json.dump(params, f, indent=2)
-        
-        return jsonify({"success": True, "message": f"{org_filename} 저장 완료"})
+        result, status = save_received_file(params, transfer, file.stream, request.content_length or 0)
+        return jsonify(result), status
 
     except Exception as e:
         print(f"[ERROR] 파일 수신 중 오류 발생: {e}")
         traceback.print_exc()
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/opcHeartbeat', methods=['POST'])
+def heartbeat():
+    """
+    lmagent의 heartbeat 수신. deviceid와 선택적으로 미전송 파일 수(pending), 지연 시간(lag, 초)을 받아 기록합니다.
+    """
+    deviceid = request.form.get('deviceid')
+    if not deviceid:
+        return jsonify({"success": False, "error": "deviceid가 누락됨"}), 400
+    try:
+        pending = int(request.form.get('pending') or 0)
+        lag = float(request.form.get('lag') or 0)
+    except ValueError:
+        return jsonify({"success": False, "error": "pending 또는 lag가 올바르지 않음"}), 400
+    record_heartbeat(deviceid, pending, lag)
+    return jsonify({"success": True})
+
+
+@app.route('/opcHeartbeat', methods=['GET'])
+def agent_status():
+    """
+    heartbeat를 보낸 lmagent 목록과 마지막 heartbeat 이후 경과 시간(초)을 반환.
+    """
+    now = time.time()
+    with _AGENT_STATUS_LOCK:
+        agents = [dict(status, seconds_since_seen=round(now - status['last_seen'], 1)) for status in AGENT_STATUS.values()]
+    return jsonify({"success": True, "agents": sorted(agents, key=lambda status: status['deviceid'])})
+
+
+def replace_staged(staged):
+    """
+    (임시 파일, 최종 경로) 목록을 순서대로 rename. 도중에 실패하면 이미 교체한 파일을 이전 내용으로 되돌리고
+    (이전 파일이 없었으면 삭제) 예외를 다시 발생시킵니다. 이전 내용은 교체 전에 하드 링크로 보관합니다.
+    """
+    replaced = []  # (최종 경로, 이전 파일의 하드 링크 또는 None)
+    try:
+        for temp_filepath, filepath in staged:
+            backup_filepath = temp_filepath + '.bak'
+            try:
+                os.link(filepath, backup_filepath)
+            except FileNotFoundError:
+                backup_filepath = None
+            replaced.append((filepath, backup_filepath))
+            os.replace(temp_filepath, filepath)
+    except OSError:
+        for filepath, backup_filepath in reversed(replaced):
+            try:
+                if backup_filepath:
+                    os.replace(backup_filepath, filepath)
+                elif os.path.exists(filepath):
+                    os.remove(filepath)
+            except OSError as e:
+                print(f"[ERROR] 묶음 업로드 되돌리기 실패: {filepath} ({e})")
+        raise
+    finally:
+        for _, backup_filepath in replaced:
+            if backup_filepath:
+                remove_file(backup_filepath)
+
+
+@app.route('/opcFileBatch', methods=['POST'])
+def file_batch():
+    """
+    여러 파일을 하나의 tar 스트림으로 수신하여 함께 저장. (encoding=gzip 쿼리 시 tar.gz)
+    각 tar 항목의 pax 헤더 'LM.params'에 /opcFileSave와 같은 파라미터(JSON, sha1 포함)를 담습니다.
+    모든 파일을 임시 파일에 기록(fsync)하고 SHA-1을 확인한 뒤에만 rename하므로, 수신이나 검증에 실패하면 아무 파일도 교체하지 않습니다.
+    rename 도중 오류가 나면 이미 교체한 파일을 이전 내용으로 되돌립니다. (프로세스가 rename 도중 중단된 경우는 되돌리지 못하며,
+    남은 임시 파일과 .bak 하드 링크는 다음 시작 시 cleanup_staged_files가 삭제)
+    """
+    save_path = CONFIG.get('save_path')
+    if not save_path:
+        return jsonify({"success": False, "error": "서버에 save_path가 설정되지 않음"}), 500
+
+    staged = []  # (임시 파일, 최종 경로) 목록 (데이터 파일과 파라미터 .json)
+    saved = []
+    save_started = time.perf_counter()
+    try:
+        mode = 'r|gz' if request.args.get('encoding') == 'gzip' else 'r|'
+        with tarfile.open(fileobj=request.stream, mode=mode) as archive:
+            for index, member in enumerate(archive):
+                if not member.isfile():
+                    continue
+                form = json.loads(member.pax_headers.get('LM.params', '{}'))
+                params = {key: value for key, value in form.items() if key not in TRANSFER_FIELDS}
+                deviceid = params.get('deviceid')
+                dataid = params.get('dataid')
+                org_filename = params.get('orgfilename')
+                if not deviceid or not dataid or not org_filename:
+                    raise UploadError(f"{member.name}: deviceid, dataid 또는 orgfilename이 누락됨")
+
+                target_dir = os.path.join(save_path, deviceid, dataid)
+                os.makedirs(target_dir, exist_ok=True)
+                filepath = os.path.join(target_dir, org_filename)
+                temp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.{index}.tmp"
+                staged.append((temp_filepath, filepath))
+                digest = hashlib.sha1()
+                with archive.extractfile(member) as source, open(temp_filepath, 'wb') as out:
+                    for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                        out.write(chunk)
+                        digest.update(chunk)
+                    out.flush()
+                    os.fsync(out.fileno())
+                if form.get('sha1') and digest.hexdigest() != form['sha1']:
+                    raise UploadError(f"{org_filename}: SHA-1 불일치")
+
+                temp_param_filepath = f"{filepath}.json.{os.getpid()}.{threading.get_ident()}.{index}.tmp"
+                staged.append((temp_param_filepath, filepath + '.json'))
+                with open(temp_param_filepath, 'w', encoding='utf-8') as f:
+                    json.dump(params, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                saved.append(filepath)
+
+        # 데이터 파일을 먼저, 파라미터 .json을 나중에 교체 (staged는 파일마다 데이터, .json 순서)
+        replace_staged(staged)
+        staged = []
+        for target_dir in {os.path.dirname(filepath) for filepath in saved}:
+            fsync_dir(target_dir)
+
+    except (UploadError, tarfile.TarError, EOFError, gzip.BadGzipFile, zlib.error, json.JSONDecodeError) as e:
+        print(f"[WARNING] 묶음 업로드가 올바르지 않아 저장하지 않았습니다: {e}")
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] 묶음 업로드 수신 중 오류 발생: {e}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        for temp_filepath, _ in staged:
+            remove_file(temp_filepath)
+
+    METRICS.observe('filerecv_save_seconds', time.perf_counter() - save_started)
+    METRICS.inc('filerecv_batch_files_total', len(saved))
+    METRICS.inc('filerecv_transfer_bytes_total', request.content_length or 0, mode='batch')
+    print(f"[INFO] 묶음 업로드 수신 및 저장 완료: 파일 {len(saved)}개")
+    for filepath in saved:
+        notify_worker(filepath)
+    return jsonify({"success": True, "saved": len(saved)})
+
+
+@app.route('/opcUpload', methods=['POST'])
+def upload_open():
+    """
+    분할 업로드 열기. lmagent가 보낼 본문의 크기(size)와 SHA-1(payload_sha1), /opcFileSave와 같은 파라미터를 받아
+    업로드 ID와 이어서 보낼 위치(offset)를 반환합니다. 같은 파일의 같은 본문은 항상 같은 업로드 ID가 되므로,
+    연결이 끊기거나 lmagent가 재시작되어도 마지막으로 확인된 위치부터 이어서 보낼 수 있습니다.
+    """
+    try:
+        form = {key: request.form[key] for key in request.form}
+        params = {key: value for key, value in form.items() if key not in TRANSFER_FIELDS + UPLOAD_FIELDS}
+        transfer = {key: form[key] for key in TRANSFER_FIELDS if key in form}
+        payload_sha1 = form.get('payload_sha1', '')
+        if not params.get('deviceid') or not params.get('dataid') or not params.get('orgfilename') or not payload_sha1:
+            return jsonify({"success": False, "error": "deviceid, dataid, orgfilename 또는 payload_sha1이 누락됨"}), 400
+        size = int(form.get('size', -1))
+        if size < 0:
+            return jsonify({"success": False, "error": "size가 올바르지 않음"}), 400
+
+        expire_uploads()
+        key = '\0'.join([params['deviceid'], params['dataid'], params['orgfilename'], payload_sha1, transfer.get('base_sha1', '')])
+        upload_id = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        meta_path, part_path = upload_paths(upload_id)
+        with get_upload_lock(upload_id):
+            if not os.path.exists(meta_path):
+                try:
+                    with open(part_path, 'wb'):
+                        pass
+                    with open(meta_path, 'w', encoding='utf-8') as f:
+                        json.dump({'params': params, 'transfer': transfer, 'size': size, 'payload_sha1': payload_sha1}, f, indent=2)
+                except OSError:
+                    # 정보가 일부만 기록된 업로드가 남지 않도록 삭제
+                    remove_upload(upload_id)
+                    raise
+            offset = os.path.getsize(part_path)
+        return jsonify({"success": True, "upload_id": upload_id, "offset": offset, "size": size})
+
+    except Exception as e:
+        print(f"[ERROR] 분할 업로드 열기 중 오류 발생: {e}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/opcUpload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """
+    분할 업로드에서 수신 서버가 확인한 위치(offset)를 반환.
+    """
+    meta, part_path = load_upload(upload_id)
+    if meta is None:
+        return jsonify({"success": False, "error": "업로드를 찾을 수 없음"}), 404
+    return jsonify({"success": True, "upload_id": upload_id, "offset": os.path.getsize(part_path), "size": meta['size']})
+
+
+@app.route('/opcUpload/<upload_id>', methods=['PUT'])
+def upload_append(upload_id):
+    """
+    분할 업로드에 조각 추가. 요청 본문은 조각의 바이트 그대로이며, offset(쿼리)이 수신 서버가 확인한 위치와 같아야 합니다.
+    본문은 메모리에 모으지 않고 .part 파일에 바로 기록하며, X-Chunk-SHA1 헤더가 있으면 조각의 SHA-1을 확인한 뒤 fsync합니다.
+    위치가 다르면 409와 함께 이어서 보낼 위치를, 조각이 손상되었으면 400을 반환합니다.
+    """
+    try:
+        meta, part_path = load_upload(upload_id)
+        if meta is None:
+            return jsonify({"success": False, "error": "업로드를 찾을 수 없음"}), 404
+        offset = int(request.args.get('offset', -1))
+        with get_upload_lock(upload_id):
+            current = os.path.getsize(part_path)
+            if offset != current:
+                return jsonify({"success": False, "error": "위치가 일치하지 않음", "offset": current}), 409
+
+            digest = hashlib.sha1()
+            written = 0
+            try:
+                with open(part_path, 'r+b') as f:
+                    f.seek(offset)
+                    for chunk in iter(lambda: request.stream.read(1024 * 1024), b''):
+                        if offset + written + len(chunk) > meta['size']:
+                            f.truncate(offset)
+                            return jsonify({"success": False, "error": "본문이 업로드 크기를 넘음", "offset": offset}), 400
+                        f.write(chunk)
+                        digest.update(chunk)
+                        written += len(chunk)
+                    expected = request.headers.get('X-Chunk-SHA1')
+                    if expected and digest.hexdigest() != expected:
+                        f.truncate(offset)
+                        return jsonify({"success": False, "error": "조각 SHA-1 불일치", "offset": offset}), 400
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception:
+                # 연결 끊김이나 디스크 오류로 일부만 기록된 조각은 버리고, 확인된 위치부터 다시 받음
+                os.truncate(part_path, offset)
+                raise
+        METRICS.inc('filerecv_chunk_bytes_total', written)
+        return jsonify({"success": True, "upload_id": upload_id, "offset": offset + written})
+
+    except Exception as e:
+        print(f"[ERROR] 분할 업로드 조각 수신 중 오류 발생: {e}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/opcUpload/<upload_id>/commit', methods=['POST'])
+def upload_commit(upload_id):
+    """
+    분할 업로드 완료. 모든 조각을 받았고 전체 SHA-1(payload_sha1)이 맞으면 /opcFileSave와 같은 방식으로
+    (델타면 재구성 후) 파일을 저장하고, 임시 본문을 삭제합니다.
+    """
+    try:
+        meta, part_path = load_upload(upload_id)
+        if meta is None:
+            return jsonify({"success": False, "error": "업로드를 찾을 수 없음"}), 404
+        with get_upload_lock(upload_id):
+            received = os.path.getsize(part_path)
+            if received != meta['size']:
+                return jsonify({"success": False, "error": "아직 받지 못한 조각이 있음", "offset": received}), 409
+            if file_sha1(part_path) != meta['payload_sha1']:
+                # 받은 본문이 손상된 경우 처음부터 다시 받도록 업로드를 삭제
+                remove_upload(upload_id)
+                print(f"[WARNING] 분할 업로드 본문 검증 실패 (SHA-1 불일치): {upload_id}")
+                return jsonify({"success": False, "error": "본문 SHA-1 불일치"}), 409
+            with open(part_path, 'rb') as stream:
+                result, status = save_received_file(meta['params'], meta['transfer'], stream, meta['size'])
+        if status != 500:
+            remove_upload(upload_id)
+        return jsonify(result), status
+
+    except Exception as e:
+        print(f"[ERROR] 분할 업로드 완료 중 오류 발생: {e}")
+        traceback.print_exc()
+        return jsonify({"success": False, "error": str(e)}), 500
+
 # --- 메인 실행 블록 ---
-if __name__ == '__main__':
+def load_config(config_file='config.json'):
+    """
+    설정 파일을 읽고 저장 경로를 확인/생성. 실패하면 프로그램을 종료합니다.
+    """
     # 1. 설정 파일 로드
     try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            CONFIG = json.load(f)
+        with open(config_file, 'r', encoding='utf-8') as f:
+            CONFIG.clear()
+            CONFIG.update(json.load(f))
     except FileNotFoundError:
         print("[CRITICAL] 서버 설정 파일(config.json)을 찾을 수 없습니다. 프로그램을 종료합니다.")
         sys.exit(1)
@@ -80,10 +812,31 @@ if __name__ == '__main__':
     if save_path:
         os.makedirs(save_path, exist_ok=True)
         print(f"[INFO] 저장 경로 확인/생성: {save_path}")
+        cleanup_staged_files(save_path)
     else:
         print("[CRITICAL] config.json에 'save_path'가 정의되지 않았습니다. 프로그램을 종료합니다.")
         sys.exit(1)
 
-    # 3. Flask 웹 서버 시작
-    print("[INFO] Flask 웹 서버를 0.0.0.0:8080에서 시작합니다.")
-    app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
+
+def create_app():
+    """
+    gunicorn 등 외부 WSGI 서버에서 사용할 앱 생성 함수. (예: gunicorn -w 4 -b 0.0.0.0:8080 "lmfilerecv:create_app()")
+    """
+    load_config()
+    return app
+
+
+if __name__ == '__main__':
+    load_config()
+
+    # 3. 웹 서버 시작 (waitress가 설치되어 있으면 멀티스레드 운영 서버로 실행)
+    port = int(CONFIG.get('port', 8080))
+    threads = int(CONFIG.get('server_threads', 16))
+    if serve is not None and CONFIG.get('server', 'waitress') == 'waitress':
+        print(f"[INFO] waitress 서버를 0.0.0.0:{port}에서 시작합니다. (스레드: {threads})")
+        serve(app, host='0.0.0.0', port=port, threads=threads)
+    else:
+        if serve is None:
+            print("[WARNING] waitress가 설치되어 있지 않아 Flask 개발 서버로 실행합니다. (pip install waitress)")
+        print(f"[INFO] Flask 웹 서버를 0.0.0.0:{port}에서 시작합니다.")
+        app.run(host='0.0.0.0', port=port, threaded=True)
@@ -0,0 +1,356 @@
+#-*- coding: utf-8 -*-
+# async_engine.py
+# asyncua 기반 비동기 전송 엔진 (config.json의 opc_engine이 'async'일 때 사용).
+
+import time
+import traceback
+import asyncio
+import threading
+from os.path import basename
+from contextlib import asynccontextmanager
+
+import numpy as np
+
+# pip install pandas
+import pandas as pd
+
+# 선택 라이브러리: 비동기 전송 엔진(opc_engine: "async")을 사용하려면 설치
+# pip install asyncua
+try:
+    import asyncua
+except ImportError:
+    asyncua = None
+
+from settings import (CONFIG, DEFAULT_CHECKPOINT_ROWS, DEFAULT_BACKFILL_BATCH_SIZE, DEFAULT_CHECKPOINT_INTERVAL,
+                      get_pipeline_settings)
+from worker_metrics import METRICS
+from scheduler import get_source, get_rate_limiter
+from encoders import iter_row_writes, checkpointable_rows
+from opc_writer import (get_opc_server_url, get_write_batch_size, MISSING_TAG_STATUS_CODES, get_tag_registry, get_value_cache,
+                        WriteBatcher, to_utc_datetimes, get_backfill_mask, forget_cached_values)
+from state_store import commit_loader_state
+
+
+ASYNC_ENGINE = None # 비동기 전송 엔진 (config.json의 opc_engine이 'async'일 때 get_async_engine()으로 생성)
+
+class AsyncOpcEngine:
+    """
+    asyncua 기반 비동기 전송 엔진. (config.json의 opc_engine: "async")
+    - 전용 스레드의 이벤트 루프 하나에서 여러 파일을 동시에 전송하므로, 동시 전송 파일 수만큼 스레드를 만들지 않습니다.
+      동시에 전송하는 파일 수는 write_workers개로 제한하고, 나머지는 이벤트 루프에서 차례를 기다립니다.
+    - 엔드포인트당 sessions개의 세션을 만들어 파일들이 나누어 사용하며, 세션마다 응답을 기다리는 요청을
+      inflight_requests개까지 동시에 보냅니다. (요청 파이프라이닝)
+      endpoint_limits({url: {'async_sessions': n, 'async_inflight_requests': n}})로 엔드포인트마다 다르게 지정할 수 있습니다.
+    - 한 파일 안에서는 행 순서(TIME 마지막)를 지키기 위해 요청을 차례로 보냅니다.
+    - 연결이 끊긴 세션은 폐기하고, 연결 실패 시 지수 백오프(최대 backoff_max초) 동안은 재연결을 시도하지 않습니다.
+    - 백필 구간은 SourceTimestamp를 지정한 Write로 전송합니다. (HistoryUpdate는 스레드 엔진에서만 사용)
+    """
+
+    def __init__(self, sessions=2, inflight_requests=8, backoff_max=60, endpoint_limits=None, write_workers=50):
+        self.sessions = max(1, int(sessions))
+        self.inflight_requests = max(1, int(inflight_requests))
+        self.backoff_max = max(1, int(backoff_max))
+        self.endpoint_limits = endpoint_limits or {}
+        self.write_workers = max(1, int(write_workers))
+        self._file_sem = asyncio.Semaphore(self.write_workers)  # 동시에 전송하는 파일 수 제한
+        self._endpoints = {}  # url -> {'slots': [{'client', 'sem', 'lock', 'users'}], 'backoff', 'retry_at'}
+        self._nodeids = {}  # nodeid 문자열 -> asyncua NodeId
+        self._validated = set()  # 태그 존재 여부를 확인한 (dataid, 시트, NodeId 목록)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="opc-async", daemon=True)
+        self._thread.start()
+
+    def submit(self, parsed, state):
+        """
+        parse_file_task 결과의 전송을 이벤트 루프에 등록하고, write_file_task와 같은 결과를 돌려줄 Future를 반환.
+        """
+        return asyncio.run_coroutine_threadsafe(self._limited_write_file_task(parsed, state), self.loop)
+
+    async def _limited_write_file_task(self, parsed, state):
+        async with self._file_sem:
+            return await self.write_file_task(parsed, state)
+
+    def _get_endpoint(self, url):
+        ep = self._endpoints.get(url)
+        if ep is None:
+            limits = self.endpoint_limits.get(url, {})
+            sessions = max(1, int(limits.get('async_sessions', self.sessions)))
+            inflight_requests = max(1, int(limits.get('async_inflight_requests', self.inflight_requests)))
+            slots = [{'client': None, 'sem': asyncio.Semaphore(inflight_requests), 'lock': asyncio.Lock(), 'users': 0}
+                     for _ in range(sessions)]
+            ep = {'slots': slots, 'backoff': 0, 'retry_at': 0.0}
+            self._endpoints[url] = ep
+        return ep
+
+    @staticmethod
+    async def _disconnect(client):
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
+
+    async def _connect(self, url, ep, slot):
+        async with slot['lock']:
+            if slot['client'] is not None:
+                return slot['client']
+            now = time.time()
+            if now < ep['retry_at']:
+                raise ConnectionError(f"OPC-UA 서버({url}) 재연결 대기 중 ({ep['retry_at'] - now:.1f}초 남음)")
+            client = asyncua.Client(url)
+            try:
+                await client.connect()
+            except Exception:
+                ep['backoff'] = min(self.backoff_max, ep['backoff'] * 2 if ep['backoff'] else 1)
+                ep['retry_at'] = time.time() + ep['backoff']
+                print(f"[WARNING] OPC-UA 서버({url}) 연결 실패. {ep['backoff']}초 후 재연결을 시도합니다.")
+                raise
+            if ep['backoff']:
+                print(f"[INFO] OPC-UA 서버({url})에 다시 연결되었습니다.")
+            ep['backoff'] = 0
+            ep['retry_at'] = 0.0
+            slot['client'] = client
+            return client
+
+    @asynccontextmanager
+    async def session(self, url):
+        """
+        사용 중인 파일이 가장 적은 세션을 (asyncua Client, 요청 세마포어)로 빌려주는 비동기 컨텍스트 매니저.
+        블록 안에서 서비스 오류 이외의 예외가 발생하면 해당 세션은 손상된 것으로 보고 폐기합니다.
+        """
+        ep = self._get_endpoint(url)
+        slot = min(ep['slots'], key=lambda s: (s['users'], s['client'] is None))
+        slot['users'] += 1
+        client = None
+        try:
+            client = await self._connect(url, ep, slot)
+            yield client, slot['sem']
+        except Exception as e:
+            if client is not None and not isinstance(e, asyncua.ua.UaStatusCodeError) and slot['client'] is client:
+                slot['client'] = None
+                await self._disconnect(client)
+            raise
+        finally:
+            slot['users'] -= 1
+
+    def _ua_nodeid(self, nodeid):
+        ua_nodeid = self._nodeids.get(nodeid)
+        if ua_nodeid is None:
+            ua_nodeid = self._nodeids[nodeid] = asyncua.ua.NodeId.from_string(nodeid)
+        return ua_nodeid
+
+    async def validate_tags(self, session, nodeids, batch_size):
+        """
+        TagRegistry.compile(validate=True)와 같이 배치 Read 요청으로 노드가 서버에 존재하는지 확인.
+        """
+        client, sem = session
+        aua = asyncua.ua
+        tag_registry = get_tag_registry()
+        nodeids = [nodeid for nodeid in nodeids if tag_registry.resolve(nodeid) is not None]
+        for start in range(0, len(nodeids), batch_size):
+            chunk = nodeids[start:start + batch_size]
+            params = aua.ReadParameters()
+            params.NodesToRead = [aua.ReadValueId(NodeId=self._ua_nodeid(nodeid), AttributeId=aua.AttributeIds.NodeClass)
+                                  for nodeid in chunk]
+            try:
+                async with sem:
+                    results = await client.uaclient.read(params)
+            except aua.UaStatusCodeError as read_e:
+                print(f"[WARNING] 태그 존재 여부 확인 중 오류: {read_e}")
+                return
+            for nodeid, result in zip(chunk, results):
+                if result.StatusCode.value in MISSING_TAG_STATUS_CODES:
+                    tag_registry.mark_missing(nodeid, result.StatusCode.name)
+
+    async def write_values(self, session, row_writes, batch_size, value_cache=None, float_nodeids=(), row_timestamps=None):
+        """
+        write_values_batched의 비동기 버전. 성공/실패 건수 튜플 (ok_count, fail_count)을 반환.
+        """
+        client, sem = session
+        aua = asyncua.ua
+        batcher = WriteBatcher(batch_size, value_cache, float_nodeids)
+        for batch in batcher.batches(row_writes, row_timestamps):
+            params = aua.WriteParameters()
+            params.NodesToWrite = [
+                aua.WriteValue(NodeId=self._ua_nodeid(nodeid), AttributeId=aua.AttributeIds.Value,
+                               Value=aua.DataValue(aua.Variant(value, aua.VariantType.String), SourceTimestamp=source_timestamp))
+                for nodeid, value, _, source_timestamp in batch
+            ]
+            started = time.perf_counter()
+            try:
+                async with sem:
+                    started = time.perf_counter()  # 세마포어 대기 시간은 제외
+                    results = await client.uaclient.write(params)
+            except aua.UaStatusCodeError as batch_e:
+                batcher.handle_error(batch, batch_e)
+                continue
+            finally:
+                METRICS.observe('worker_opc_write_seconds', time.perf_counter() - started)
+            batcher.handle_results(batch, results)
+        return batcher.finish()
+
+    async def send_chunks(self, session, encoded_columns, time_values, batch_size, chunk_rows, checkpoint_rows,
+                          checkpoint=None, value_cache=None, float_nodeids=(), rate_limiter=None, utc_times=None):
+        """
+        send_encoded/send_backfill의 비동기 버전. chunk_rows행씩 전송하고, checkpoint_rows행 또는
+        checkpoint_interval초가 지날 때마다 체크포인트를 기록합니다. (utc_times가 주어지면 SourceTimestamp로 전송)
+        """
+        row_count = len(time_values)
+        if not np.issubdtype(time_values.dtype, np.datetime64):
+            checkpoint = None
+        if checkpoint is not None:
+            safe, prefix_max = checkpointable_rows(time_values)
+        checkpoint_interval = float(CONFIG.get('checkpoint_interval', DEFAULT_CHECKPOINT_INTERVAL))
+
+        ok_count = fail_count = 0
+        rows_since_checkpoint = 0
+        last_checkpoint_at = time.time()
+        for start in range(0, row_count, chunk_rows):
+            stop = min(start + chunk_rows, row_count)
+            if rate_limiter is not None:
+                await asyncio.sleep(rate_limiter.reserve((stop - start) * len(encoded_columns)))
+            ok, fail = await self.write_values(session, iter_row_writes(encoded_columns, start, stop), batch_size,
+                                               value_cache, float_nodeids,
+                                               utc_times[start:stop] if utc_times is not None else None)
+            ok_count += ok
+            fail_count += fail
+            rows_since_checkpoint += stop - start
+
+            if checkpoint is None:
+                continue
+            due = rows_since_checkpoint >= checkpoint_rows or time.time() - last_checkpoint_at >= checkpoint_interval
+            if due and stop < row_count and safe[stop - 1]:
+                # SQLite 기록은 이벤트 루프를 막지 않도록 별도 스레드에서 수행
+                await asyncio.to_thread(checkpoint, pd.Timestamp(prefix_max[stop - 1]).to_pydatetime())
+                rows_since_checkpoint = 0
+                last_checkpoint_at = time.time()
+
+        return ok_count, fail_count
+
+    async def send_sheet(self, session, sheet, batch_size, checkpoint=None, value_cache=None, rate_limiter=None):
+        """
+        send_sheet의 비동기 버전. backfill_age보다 오래된 행은 SourceTimestamp Write로 먼저 보냅니다. (value_cache 적용 안 함)
+        """
+        encoded_columns = sheet['columns']
+        time_values = sheet['times']
+        float_nodeids = sheet['float_nodeids']
+        column_count = max(1, len(encoded_columns))
+        ok_count = fail_count = 0
+
+        backfill_mask = get_backfill_mask(time_values)
+        if backfill_mask is not None and backfill_mask.any():
+            print(f"[INFO] 시트 '{sheet['sheet_name']}'의 오래된 행 {int(backfill_mask.sum())}개를 백필 모드로 전송합니다.")
+            backfill_batch_size = max(1, int(CONFIG.get('backfill_batch_size', DEFAULT_BACKFILL_BATCH_SIZE)))
+            backfill_times = time_values[backfill_mask]
+            ok_count, fail_count = await self.send_chunks(
+                session, [(nodeid, values[backfill_mask]) for nodeid, values in encoded_columns], backfill_times,
+                backfill_batch_size, max(1, backfill_batch_size // column_count), 0, checkpoint, None,
+                float_nodeids, rate_limiter, to_utc_datetimes(backfill_times))
+            forget_cached_values(value_cache, encoded_columns)
+            live_mask = ~backfill_mask
+            encoded_columns = [(nodeid, values[live_mask]) for nodeid, values in encoded_columns]
+            time_values = time_values[live_mask]
+
+        if len(time_values):
+            checkpoint_rows = max(1, int(CONFIG.get('checkpoint_rows', DEFAULT_CHECKPOINT_ROWS)))
+            ok, fail = await self.send_chunks(session, encoded_columns, time_values, batch_size,
+                                              max(1, min(checkpoint_rows, batch_size // column_count)), checkpoint_rows,
+                                              checkpoint, value_cache, float_nodeids, rate_limiter)
+            ok_count += ok
+            fail_count += fail
+        return ok_count, fail_count
+
+    async def write_file_task(self, parsed, state):
+        """
+        write_file_task의 비동기 버전. 성공 시 (파일-시트 키, 마지막 처리 시간) 튜플의 리스트를 반환하고, 실패 시 None.
+        """
+        filepath = parsed['filepath']
+        if not parsed['sheets']:
+            await asyncio.to_thread(commit_loader_state, state, parsed)
+            return []
+
+        opc_server_url = get_opc_server_url(parsed['dataid'])
+        if not opc_server_url:
+            print(f"[ERROR] config.json에 'opc_server_url'(또는 dataid '{parsed['dataid']}'의 opc_routes)이 설정되지 않았습니다.")
+            return None
+
+        batch_size = get_write_batch_size()
+        value_cache = get_value_cache()
+        rate_limiter = get_rate_limiter(get_source(filepath))
+        tag_registry = get_tag_registry()
+        validate_tags = bool(CONFIG.get('validate_tags', False))
+
+        started = time.perf_counter()
+        try:
+            async with self.session(opc_server_url) as session:
+                results_for_this_file = []
+                for sheet in parsed['sheets']:
+                    file_sheet_key = sheet['key']
+                    nodeids = [nodeid for nodeid, _ in sheet['columns']]
+                    tag_registry.compile(None, parsed['dataid'], sheet['sheet_name'], nodeids)
+                    tag_map_key = (parsed['dataid'], sheet['sheet_name'], tuple(nodeids))
+                    if validate_tags and tag_map_key not in self._validated:
+                        self._validated.add(tag_map_key)
+                        await self.validate_tags(session, nodeids, batch_size)
+                    print(f"[INFO] 비동기 엔진이 '{basename(filepath)}' 시트 '{sheet['sheet_name']}'의 새로운 데이터 {len(sheet['times'])}개를 처리합니다.")
+
+                    def checkpoint(last_time, key=file_sheet_key):
+                        state.commit(last_times={key: last_time.strftime('%Y-%m-%d %H:%M:%S')})
+
+                    await self.send_sheet(session, sheet, batch_size, checkpoint, value_cache, rate_limiter)
+                    results_for_this_file.append((file_sheet_key, sheet['latest_time']))
+
+                await asyncio.to_thread(commit_loader_state, state, parsed)
+                return results_for_this_file
+
+        except Exception as e:
+            print(f"[ERROR] 비동기 전송 중 오류: {filepath}, {e}")
+            traceback.print_exc()
+            return None
+        finally:
+            METRICS.observe('worker_stage_seconds', time.perf_counter() - started, stage='write')
+
+    def close(self):
+        """
+        모든 세션을 종료하고 이벤트 루프를 멈춤.
+        """
+        async def disconnect_all():
+            clients = []
+            for ep in self._endpoints.values():
+                for slot in ep['slots']:
+                    if slot['client'] is not None:
+                        clients.append(slot['client'])
+                        slot['client'] = None
+            await asyncio.gather(*(self._disconnect(client) for client in clients))
+
+        try:
+            asyncio.run_coroutine_threadsafe(disconnect_all(), self.loop).result(timeout=10)
+        except Exception as e:
+            print(f"[WARNING] 비동기 엔진 세션 종료 중 오류: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=10)
+
+
+_ASYNC_ENGINE_LOCK = threading.Lock()
+
+def get_async_engine():
+    """
+    config.json의 opc_engine이 'async'이면 전역 비동기 전송 엔진을 한 번만 생성하여 반환. 사용하지 않으면 None.
+    asyncua가 설치되어 있지 않으면 스레드 엔진을 사용합니다.
+    """
+    global ASYNC_ENGINE
+    if CONFIG.get('opc_engine', 'thread') != 'async':
+        return None
+    with _ASYNC_ENGINE_LOCK:
+        if ASYNC_ENGINE is None:
+            if asyncua is None:
+                print("[WARNING] asyncua가 설치되어 있지 않아 스레드 엔진으로 전송합니다. (pip install asyncua)")
+                CONFIG['opc_engine'] = 'thread'
+                return None
+            ASYNC_ENGINE = AsyncOpcEngine(
+                sessions=CONFIG.get('async_sessions', 2),
+                inflight_requests=CONFIG.get('async_inflight_requests', 8),
+                backoff_max=CONFIG.get('opc_reconnect_backoff_max', 60),
+                endpoint_limits=CONFIG.get('opc_endpoints'),
+                write_workers=get_pipeline_settings()[1],
+            )
+        return ASYNC_ENGINE
@@ -0,0 +1,358 @@
+#-*- coding: utf-8 -*-
+# benchmark.py
+# 실제 보고서와 같은 구조의 엑셀 파일을 생성하고, 로컬 OPC-UA 서버로 worker.py의 처리 성능을 측정합니다.
+# (load_excel_data -> sendopcua_task -> process_all_files 순서로 측정하며, 기준값과 비교하여 성능 저하를 확인)
+#
+# 사용 예:
+#   python benchmark.py                                   # 기본 크기로 측정
+#   python benchmark.py --rows 5000 --files 4             # 파일당 행 수, 레이아웃별 파일 수 지정
+#   python benchmark.py --save-baseline baseline.json     # 결과를 기준값으로 저장
+#   python benchmark.py --baseline baseline.json          # 기준값과 비교 (성능 저하 시 종료 코드 1)
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# 필요한 라이브러리 목록
+# pip install opcua pandas openpyxl simpledbf
+import numpy as np
+from openpyxl import Workbook
+from opcua import Server, ua
+
+# 최대 메모리 사용량(RSS) 측정 (Windows에는 resource 모듈이 없어 측정하지 않음)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import worker
+import loaders
+import opc_writer
+import async_engine
+import state_store
+from metrics import histogram_delta, counter_delta, histogram_quantile
+
+BENCH_DATE = datetime(2025, 9, 15)
+
+# --- 1. 테스트 엑셀 파일 생성 ---
+
+def format_korean_time(t):
+    # '25년9월15일 00시00분00초' 형식 (TIME 파싱 형식 1)
+    return f"{t:%y}년{t.month}월{t.day}일 {t:%H}시{t:%M}분{t:%S}초"
+
+
+# 레이아웃 이름 -> (headerline, columnline, 데이터 컬럼 수, 시트 이름 목록, TIME 형식 함수)
+LAYOUTS = {
+    # 단일 헤더, 'YYYY-MM-DD HH:MM:SS' 형식
+    'single': ('1', '2', 20, ['Sheet1'], lambda t: t.strftime('%Y-%m-%d %H:%M:%S')),
+    # 다중 헤더(그룹명/태그명) + 단위 행, 한글 시간 형식
+    'multi_header': ('[1,2]', '4', 40, ['Sheet1'], format_korean_time),
+    # 넓은 시트, 시간만 있는 형식(파일명의 날짜 사용)
+    'wide': ('1', '2', 300, ['Sheet1'], lambda t: t.strftime('%H:%M:%S')),
+    # 시트가 여러 개인 파일 (시트 이름이 태그 주소에 포함됨)
+    'multi_sheet': ('1', '2', 20, ['LINE1', 'LINE2', 'LINE3'], lambda t: t.strftime('%Y/%m/%d %H:%M')),
+}
+
+
+def write_workbook(filepath, layout, rows, seed):
+    """
+    레이아웃에 맞는 엑셀 파일을 생성. (값은 seed로 고정된 난수이므로 같은 인자로 항상 같은 파일이 만들어짐)
+    """
+    headerline, columnline, column_count, sheet_names, format_time = LAYOUTS[layout]
+    rng = np.random.default_rng(seed)
+    workbook = Workbook(write_only=True)
+    for sheet_name in sheet_names:
+        sheet = workbook.create_sheet(sheet_name)
+        if headerline.startswith('['):
+            # 1행: 그룹명(5개 컬럼마다 한 번, 나머지는 빈 칸), 2행: 태그명, 3행: 단위
+            sheet.append(['시간'] + [f"GRP{i // 5}" if i % 5 == 0 else None for i in range(column_count)])
+            sheet.append([None] + [f"T{i % 5}" for i in range(column_count)])
+            sheet.append([None] + ['℃' if i % 2 else 'bar' for i in range(column_count)])
+        else:
+            sheet.append(['TIME'] + [f"TAG{i:03d}" for i in range(column_count)])
+
+        values = rng.normal(100, 10, size=(rows, column_count)).round(4)
+        for row_index in range(rows):
+            row_time = BENCH_DATE + timedelta(minutes=row_index) if layout != 'wide' else BENCH_DATE + timedelta(seconds=row_index * 10)
+            row = [format_time(row_time)]
+            for column_index in range(column_count):
+                # 정수/실수/문자열 컬럼을 섞어 인코딩 경로를 모두 사용
+                if column_index % 10 == 1:
+                    row.append(int(values[row_index, column_index]))
+                elif column_index % 10 == 2:
+                    row.append('RUN' if row_index % 7 else 'STOP')
+                else:
+                    row.append(float(values[row_index, column_index]))
+            sheet.append(row)
+    workbook.save(filepath)
+    return {'dataid': f"BENCH_{layout.upper()}", 'headerline': headerline, 'columnline': columnline}
+
+
+def generate_files(save_path, rows, files_per_layout):
+    """
+    save_path/BENCH/[dataid]/ 아래에 레이아웃별 엑셀 파일과 .json 메타데이터를 생성하여 (경로, 파라미터) 목록을 반환.
+    """
+    generated = []
+    for layout_index, layout in enumerate(LAYOUTS):
+        for file_index in range(files_per_layout):
+            dataid = f"BENCH_{layout.upper()}"
+            target_dir = os.path.join(save_path, 'BENCH', dataid)
+            os.makedirs(target_dir, exist_ok=True)
+            filepath = os.path.join(target_dir, f"{layout}{file_index}_{BENCH_DATE:%Y-%m-%d}.xlsx")
+            params = write_workbook(filepath, layout, rows, seed=layout_index * 1000 + file_index)
+            params['orgfilename'] = os.path.basename(filepath)
+            with open(filepath + '.json', 'w', encoding='utf-8') as f:
+                json.dump(params, f, indent=2)
+            generated.append((filepath, params))
+    return generated
+
+# --- 2. 로컬 OPC-UA 서버 ---
+
+def start_server(port, nodeids):
+    """
+    ns=2 문자열 NodeId 노드를 만든 로컬 OPC-UA 서버를 시작.
+    """
+    server = Server()
+    server.set_endpoint(f"opc.tcp://127.0.0.1:{port}/")
+    server.register_namespace('opcua-file-gateway-benchmark')
+    objects = server.get_objects_node()
+    for nodeid in sorted(nodeids):
+        node = objects.add_variable(ua.NodeId.from_string(nodeid), nodeid.split(';s=')[-1], "")
+        node.set_writable()
+    server.start()
+    return server
+
+
+def collect_nodeids(generated):
+    """
+    load_excel_data로 각 파일의 컬럼을 읽어 worker가 전송할 NodeId 목록을 만듦.
+    """
+    nodeids = set()
+    for filepath, params in generated:
+        sheets = loaders.load_excel_data(filepath, params['dataid'], params['headerline'], params['columnline'])
+        for sheet_name, df in (sheets or {}).items():
+            nodeids.update(worker.make_nodeid(params['dataid'], sheet_name, col) for col in df.columns)
+    return nodeids
+
+# --- 3. 측정 ---
+
+def peak_rss_mb():
+    """
+    지금까지의 최대 RSS(MB)를 (워커 프로세스, 파싱 프로세스 중 최대) 튜플로 반환. 측정할 수 없으면 None.
+    """
+    if resource is None:
+        return None, None
+    # Linux의 ru_maxrss 단위는 KB (macOS는 바이트)
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1))
+
+
+def summarize(latencies, rows, elapsed):
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    self_rss, children_rss = peak_rss_mb()
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 1),
+        'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 1),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 1),
+        'peak_rss_mb': self_rss,
+        'peak_child_rss_mb': children_rss,
+    }
+
+
+def reset_state(work_dir, name):
+    """
+    측정 단계마다 빈 처리 상태 저장소를 사용하도록 초기화. (모든 행을 처음부터 전송)
+    """
+    if state_store.STATE_STORE is not None:
+        state_store.STATE_STORE.close()
+        state_store.STATE_STORE = None
+    worker.CONFIG['state_db_path'] = os.path.join(work_dir, f"{name}_state.db")
+
+
+def bench_load(generated):
+    """
+    load_excel_data만 측정. (파일 읽기, 헤더 정리, TIME 파싱)
+    """
+    latencies = []
+    rows = 0
+    started = time.perf_counter()
+    for filepath, params in generated:
+        file_started = time.perf_counter()
+        sheets = loaders.load_excel_data(filepath, params['dataid'], params['headerline'], params['columnline'])
+        latencies.append(time.perf_counter() - file_started)
+        rows += sum(len(df) for df in (sheets or {}).values())
+    return summarize(latencies, rows, time.perf_counter() - started)
+
+
+def bench_sendopcua_task(generated, work_dir):
+    """
+    파일 하나씩 sendopcua_task(파싱 + 전송)를 측정. Write 요청 응답 시간은 worker의 성능 지표에서 가져옴.
+    """
+    reset_state(work_dir, 'sendopcua_task')
+    state = worker.get_state_store()
+    before = worker.METRICS.snapshot()
+    latencies = []
+    started = time.perf_counter()
+    for filepath, params in generated:
+        file_started = time.perf_counter()
+        result = worker.sendopcua_task(filepath, params, state)
+        latencies.append(time.perf_counter() - file_started)
+        if result is None:
+            print(f"[WARNING] 전송 실패: {filepath}")
+    elapsed = time.perf_counter() - started
+    rows = counter_delta(before, worker.METRICS.snapshot(), 'worker_rows_total')
+    summary = summarize(latencies, rows, elapsed)
+    summary.update(write_request_summary(before))
+    return summary
+
+
+def bench_process_all_files(work_dir):
+    """
+    process_all_files 한 사이클 전체(스캔, 파싱 프로세스 풀, 전송)를 측정. 파일별 지연은 파일 처리 완료 시각 기준.
+    """
+    reset_state(work_dir, 'process_all_files')
+    before = worker.METRICS.snapshot()
+    started = time.perf_counter()
+    worker.process_all_files()
+    elapsed = time.perf_counter() - started
+    after = worker.METRICS.snapshot()
+    rows = counter_delta(before, after, 'worker_rows_total')
+    buckets, total, count = histogram_delta(before, after, 'worker_stage_seconds', stage='write')
+    summary = summarize([], rows, elapsed)
+    # 파일별 시간 분포는 히스토그램 버킷 상한으로 추정
+    for quantile, key in ((0.5, 'p50_ms'), (0.95, 'p95_ms'), (0.99, 'p99_ms')):
+        summary[key] = round(histogram_quantile(buckets, count, quantile) * 1000, 1) if count else 0.0
+    summary.update(write_request_summary(before))
+    return summary
+
+
+def write_request_summary(before):
+    after = worker.METRICS.snapshot()
+    buckets, total, count = histogram_delta(before, after, 'worker_opc_write_seconds')
+    return {
+        'write_requests': count,
+        'write_avg_ms': round(total / count * 1000, 2) if count else 0.0,
+        'write_p95_ms': round(histogram_quantile(buckets, count, 0.95) * 1000, 1) if count else 0.0,
+    }
+
+# --- 4. 기준값 비교 ---
+
+# 지표 이름 -> 클수록 좋은지 여부
+COMPARED_METRICS = {'rows_per_sec': True, 'p95_ms': False, 'peak_rss_mb': False}
+
+
+def compare_baseline(results, baseline, tolerance):
+    """
+    기준값보다 tolerance(비율) 이상 나빠진 항목을 출력하고, 성능 저하가 있으면 True를 반환.
+    """
+    regressed = False
+    for phase, summary in results['phases'].items():
+        base = baseline.get('phases', {}).get(phase)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            current, previous = summary.get(metric), base.get(metric)
+            if not current or not previous:
+                continue
+            change = (current - previous) / previous
+            worse = -change if higher_is_better else change
+            status = '성능 저하' if worse > tolerance else '정상'
+            regressed |= worse > tolerance
+            print(f"  {phase:<18} {metric:<13} 기준 {previous:>10} -> 현재 {current:>10} ({change:+.1%}) {status}")
+    return regressed
+
+
+def print_report(results):
+    print(f"\n=== 벤치마크 결과 ({results['run_at']}, 파일 {results['files']}개, 파일당 {results['rows_per_file']}행) ===")
+    header = f"{'단계':<18} {'행/초':>10} {'소요(초)':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'RSS(MB)':>8} {'Write 평균(ms)':>15}"
+    print(header)
+    for phase, summary in results['phases'].items():
+        print(f"{phase:<18} {summary['rows_per_sec']:>10} {summary['seconds']:>9} {summary['p50_ms']:>9} "
+              f"{summary['p95_ms']:>9} {summary['p99_ms']:>9} {summary['peak_rss_mb']!s:>8} "
+              f"{summary.get('write_avg_ms', '-')!s:>15}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='worker.py 처리 성능 벤치마크')
+    parser.add_argument('--rows', type=int, default=2000, help='파일(시트)당 행 수 (기본 2000)')
+    parser.add_argument('--files', type=int, default=2, help='레이아웃별 파일 수 (기본 2)')
+    parser.add_argument('--port', type=int, default=48480, help='로컬 OPC-UA 서버 포트 (기본 48480)')
+    parser.add_argument('--parse-workers', type=int, default=None, help='process_all_files의 파싱 프로세스 수 (기본: worker 설정)')
+    parser.add_argument('--write-workers', type=int, default=None, help='process_all_files의 전송 스레드 수 (기본: worker 설정)')
+    parser.add_argument('--work-dir', default=None, help='테스트 파일을 만들 폴더 (기본: 임시 폴더, 종료 시 삭제)')
+    parser.add_argument('--output', default=None, help='결과를 JSON으로 저장할 경로')
+    parser.add_argument('--save-baseline', default=None, help='결과를 기준값 파일로 저장')
+    parser.add_argument('--baseline', default=None, help='비교할 기준값 파일')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='성능 저하로 판단할 변화 비율 (기본 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='opcua-bench-')
+    save_path = os.path.join(work_dir, 'save')
+    server = None
+    try:
+        print(f"[INFO] 테스트 파일 생성 중: {save_path}")
+        generated = generate_files(save_path, args.rows, args.files)
+
+        worker.CONFIG.update({
+            'save_path': save_path,
+            'opc_server_url': f"opc.tcp://127.0.0.1:{args.port}/",
+        })
+        if args.parse_workers is not None:
+            worker.CONFIG['parse_workers'] = args.parse_workers
+        if args.write_workers is not None:
+            worker.CONFIG['write_workers'] = args.write_workers
+
+        print("[INFO] 로컬 OPC-UA 서버 시작 중...")
+        server = start_server(args.port, collect_nodeids(generated))
+
+        results = {
+            'run_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'files': len(generated),
+            'rows_per_file': args.rows,
+            'settings': {key: worker.CONFIG.get(key) for key in ('parse_workers', 'write_workers', 'write_batch_size', 'opc_engine')},
+            'phases': {},
+        }
+        results['phases']['load_excel_data'] = bench_load(generated)
+        results['phases']['sendopcua_task'] = bench_sendopcua_task(generated, work_dir)
+        results['phases']['process_all_files'] = bench_process_all_files(work_dir)
+    finally:
+        if opc_writer.OPC_POOL is not None:
+            opc_writer.OPC_POOL.close()
+        if async_engine.ASYNC_ENGINE is not None:
+            async_engine.ASYNC_ENGINE.close()
+        if worker.PARSE_POOL is not None:
+            worker.PARSE_POOL.shutdown()
+        if state_store.STATE_STORE is not None:
+            state_store.STATE_STORE.close()
+        if server is not None:
+            server.stop()
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            print(f"[INFO] 결과 저장: {path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n=== 기준값 비교 ({args.baseline}, {baseline.get('run_at')}) ===")
+        if compare_baseline(results, baseline, args.tolerance):
+            print(f"[WARNING] 기준값보다 {args.tolerance:.0%} 이상 나빠진 항목이 있습니다.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#-*- coding: utf-8 -*-
+# encoders.py
+# 파싱된 DataFrame을 OPC-UA NodeId와 전송할 값(열 단위)으로 변환합니다.
+
+from datetime import datetime
+
+import numpy as np
+
+# pip install pandas
+import pandas as pd
+
+
+def format_value(value):
+    """
+    단일 값을 OPC-UA로 전송할 문자열로 변환. 결측값(NaN/NaT/None)은 None을 반환.
+    (object 컬럼처럼 값마다 타입이 다른 경우에 사용)
+    """
+    if pd.isna(value):
+        return None
+    if isinstance(value, (int, np.integer)):
+        return str(value)
+    elif isinstance(value, (float, np.floating)):
+        # 소수점 8자리까지 표현하고, 불필요한 0은 제거하여 문자열로 변환
+        return f"{value:.8f}".rstrip('0').rstrip('.')
+    elif isinstance(value, str):
+        return value
+    elif isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        return str(value)
+
+
+def encode_column(series):
+    """
+    컬럼 하나를 dtype에 따라 한 번에 문자열 배열로 변환. (행 단위 isinstance 검사 제거)
+    결과는 object 배열이며, 전송하지 않을 결측값 위치에는 None이 들어갑니다.
+    변환 규칙은 format_value()와 동일합니다.
+    """
+    values = series.to_numpy()
+    dtype = series.dtype
+    result = np.empty(len(values), dtype=object)
+    if len(values) == 0:
+        return result
+
+    if pd.api.types.is_bool_dtype(dtype):
+        mask = series.isna().to_numpy()
+        result[:] = np.where(values.astype(bool), 'True', 'False')
+    elif pd.api.types.is_integer_dtype(dtype):
+        mask = series.isna().to_numpy()
+        result[:] = series.astype(str).to_numpy()
+    elif pd.api.types.is_float_dtype(dtype):
+        mask = series.isna().to_numpy()
+        formatted = np.char.mod('%.8f', values.astype(np.float64))
+        result[:] = np.char.rstrip(np.char.rstrip(formatted, '0'), '.')
+    elif pd.api.types.is_datetime64_any_dtype(dtype):
+        mask = series.isna().to_numpy()
+        result[:] = series.dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy()
+    else:
+        # object 등 값마다 타입이 다를 수 있는 컬럼은 값 단위 규칙을 그대로 적용
+        result[:] = [format_value(v) for v in values]
+        return result
+
+    result[mask] = None
+    return result
+
+
+def make_nodeid(dataid, sheet_name, col_name):
+    """
+    태그 매핑 규칙에 따라 NodeId 문자열을 생성. ('Sheet'로 시작하는 시트 이름은 주소에 포함하지 않음)
+    """
+    if sheet_name.startswith("Sheet"):
+        return f"ns=2;s={dataid}.{col_name}"
+    return f"ns=2;s={dataid}.{sheet_name}.{col_name}"
+
+
+def encode_dataframe(dataid, sheet_name, df_to_send):
+    """
+    전송할 DataFrame을 (NodeId 문자열, 문자열 값 배열) 목록으로 변환.
+    컬럼 순서는 유지하되 TIME 컬럼은 항상 마지막에 위치합니다.
+    """
+    # 전송 순서 조정을 위해 컬럼 목록을 가져와 TIME을 맨 뒤로 보냅니다.
+    column_order = df_to_send.columns.tolist()
+    if 'TIME' in column_order:
+        column_order.remove('TIME')
+        column_order.append('TIME')
+
+    encoded_columns = []
+    for col_name in column_order:
+        nodeid = make_nodeid(dataid, sheet_name, col_name)
+        try:
+            encoded_columns.append((nodeid, encode_column(df_to_send[col_name])))
+        except Exception as node_e:
+            print(f"[WARNING] NodeId {nodeid} 처리 중 오류: {node_e}")
+    return encoded_columns
+
+
+def iter_row_writes(encoded_columns, start, stop):
+    """
+    컬럼 단위로 인코딩된 값을 행 단위 (NodeId 문자열, 값) 목록으로 순서대로 꺼냄. 결측값은 건너뜁니다.
+    """
+    for i in range(start, stop):
+        yield [(nodeid, values[i]) for nodeid, values in encoded_columns if values[i] is not None]
+
+
+def checkpointable_rows(time_values):
+    """
+    각 행 i까지 전송했을 때 그 시점의 최대 TIME을 체크포인트로 저장해도 되는지 여부 배열을 반환.
+    재시작 시 'TIME > 체크포인트' 행만 다시 보내므로, 이후 행 중 체크포인트보다 이른 TIME이 없어야 안전합니다.
+    (시간순으로 정렬된 일반적인 보고서 파일은 모든 행이 True)
+    """
+    prefix_max = np.maximum.accumulate(time_values)
+    suffix_min = np.minimum.accumulate(time_values[::-1])[::-1]
+    safe = np.ones(len(time_values), dtype=bool)
+    safe[:-1] = prefix_max[:-1] < suffix_min[1:]
+    return safe, prefix_max
@@ -0,0 +1,257 @@
+#-*- coding: utf-8 -*-
+# leases.py
+# 여러 워커가 같은 save_path를 처리할 때 deviceid 단위 작업 점유(lease)를 관리합니다.
+
+import os
+import json
+import time
+import hashlib
+import socket
+import threading
+from datetime import datetime
+
+from settings import CONFIG, load_json_file
+
+
+class LeaseManager:
+    """
+    여러 워커 인스턴스가 공유 파일 시스템의 save_path/deviceid 트리를 나누어 처리하기 위한 lease 관리자. (config.json의 partition)
+    - 각 워커는 lease_dir/workers/<worker_id> 파일을 주기적으로 갱신하며, ttl초 안에 갱신된 워커를 살아있는 워커로 봅니다.
+    - deviceid별 담당 워커는 살아있는 워커 목록에 대한 rendezvous 해시로 정하므로, 워커가 늘거나 줄어도 일부 deviceid만 옮겨갑니다.
+    - 담당 워커는 lease_dir/<deviceid>.lease 파일을 임시 파일 + os.link로 원자적으로 만들어 lease를 얻은 뒤에만 처리하며, 백그라운드 스레드가
+      ttl/3초마다 lease를 갱신합니다. ttl초 동안 갱신되지 않은 lease(종료된 워커)는 다른 워커가 가져갈 수 있습니다.
+    - deviceid의 처리 상태는 파일 하나의 처리가 끝날 때마다, 그리고 lease를 내려놓을 때와 매 사이클 끝에
+      lease_dir/<deviceid>.state.json으로 내보내고, lease를 새로 얻은 워커가 가져와 이어서 처리합니다.
+      (파일 경로는 deviceid 폴더 기준의 상대 경로로 저장) 워커가 파일 처리 도중 죽으면 그 파일의 시트 중간 진행 상황은
+      내보내지 않았으므로, 넘겨받은 워커가 해당 파일의 일부 행을 다시 전송할 수 있습니다.
+    """
+
+    def __init__(self, lease_dir, save_path, worker_id, ttl=120):
+        self.lease_dir = lease_dir
+        self.save_path = save_path
+        self.worker_id = worker_id
+        self.ttl = max(3.0, float(ttl))
+        self.owned = set()
+        self._lock = threading.Lock()
+        self._workers_dir = os.path.join(lease_dir, 'workers')
+        os.makedirs(self._workers_dir, exist_ok=True)
+        self._heartbeat()
+        self._stop_event = threading.Event()
+        self._renew_thread = threading.Thread(target=self._renew_loop, name="lease-renew", daemon=True)
+        self._renew_thread.start()
+
+    def _heartbeat(self):
+        with open(os.path.join(self._workers_dir, self.worker_id), 'w', encoding='utf-8') as f:
+            f.write(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+    def _live_workers(self):
+        now = time.time()
+        workers = {self.worker_id}
+        with os.scandir(self._workers_dir) as it:
+            for entry in it:
+                try:
+                    if now - entry.stat().st_mtime < self.ttl:
+                        workers.add(entry.name)
+                except FileNotFoundError:
+                    continue
+        return workers
+
+    @staticmethod
+    def _owner_of(deviceid, workers):
+        return max(workers, key=lambda worker: hashlib.sha1(f"{worker}|{deviceid}".encode('utf-8')).hexdigest())
+
+    def _lease_path(self, deviceid):
+        return os.path.join(self.lease_dir, f"{deviceid}.lease")
+
+    def _read_lease(self, path):
+        """
+        lease 파일의 (워커 ID, 마지막 갱신 시각)을 반환. 없으면 None. (기록 중이라 읽을 수 없으면 워커 ID는 None)
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+            with open(path, 'r', encoding='utf-8') as f:
+                owner = json.load(f).get('worker_id')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            owner = None
+        return owner, mtime
+
+    def _create_lease(self, path):
+        """
+        lease 파일을 원자적으로 새로 만듦. 고유한 임시 파일에 내용을 다 쓴 뒤 os.link로 이름을 붙이므로,
+        이미 lease가 있으면 실패하고(FileExistsError) 다른 워커가 기록 중인 lease를 읽게 되는 일도 없습니다.
+        """
+        tmp_path = f"{path}.{self.worker_id}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'worker_id': self.worker_id, 'acquired_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, f)
+        try:
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def _remove_stale(self, path, lease):
+        """
+        만료된 lease를 고유한 이름으로 옮긴 뒤, 읽었던 내용(워커 ID, 갱신 시각)과 같을 때만 지움.
+        그 사이 다른 워커가 가져갔거나 이전 워커가 갱신한 lease라면 원래 이름으로 되돌리고 False를 반환합니다.
+        """
+        stale_path = f"{path}.{self.worker_id}.stale"
+        try:
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            return True
+        if self._read_lease(stale_path) == lease:
+            os.remove(stale_path)
+            return True
+        try:
+            os.link(stale_path, path)
+        except FileExistsError:
+            pass
+        os.remove(stale_path)
+        return False
+
+    def _try_acquire(self, deviceid):
+        path = self._lease_path(deviceid)
+        lease = self._read_lease(path)
+        if lease is not None:
+            owner, mtime = lease
+            if owner == self.worker_id:
+                os.utime(path)
+                return True
+            if time.time() - mtime < self.ttl:
+                return False
+            if not self._remove_stale(path, lease):
+                return False
+            print(f"[INFO] 만료된 lease({deviceid}, 이전 워커: {owner})를 가져옵니다.")
+        if not self._create_lease(path):
+            return False
+        # 만든 직후 다시 읽어 다른 워커의 만료 처리와 엇갈려 lease가 바뀌었으면 물러남
+        lease = self._read_lease(path)
+        return lease is not None and lease[0] == self.worker_id
+
+    def _state_path(self, deviceid):
+        return os.path.join(self.lease_dir, f"{deviceid}.state.json")
+
+    def _device_prefix(self, deviceid):
+        return os.path.join(self.save_path, deviceid) + os.sep
+
+    def save_state(self, state, deviceids):
+        """
+        담당 중인 deviceid의 처리 상태를 lease_dir/<deviceid>.state.json으로 내보냄.
+        """
+        for deviceid in deviceids:
+            if deviceid not in self.owned:
+                continue
+            try:
+                snapshot = state.export_prefix(self._device_prefix(deviceid))
+                tmp_path = self._state_path(deviceid) + f".{self.worker_id}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self._state_path(deviceid))
+            except OSError as e:
+                print(f"[WARNING] deviceid '{deviceid}'의 처리 상태 내보내기 실패: {e}")
+
+    def _load_state(self, state, deviceid):
+        snapshot = load_json_file(self._state_path(deviceid), None)
+        if snapshot:
+            state.import_prefix(self._device_prefix(deviceid), snapshot)
+
+    def _release(self, state, deviceid):
+        self.save_state(state, [deviceid])
+        with self._lock:
+            self.owned.discard(deviceid)
+        lease = self._read_lease(self._lease_path(deviceid))
+        if lease is not None and lease[0] == self.worker_id:
+            try:
+                os.remove(self._lease_path(deviceid))
+            except FileNotFoundError:
+                pass
+
+    def refresh(self, deviceids, state):
+        """
+        이번 사이클에 처리할 deviceid 집합을 반환. 담당이 바뀐 deviceid의 lease는 내려놓고, 새로 담당할 deviceid의 lease를 얻음.
+        """
+        self._heartbeat()
+        workers = self._live_workers()
+        desired = {deviceid for deviceid in deviceids if self._owner_of(deviceid, workers) == self.worker_id}
+        for deviceid in sorted(self.owned - desired):
+            print(f"[INFO] deviceid '{deviceid}'를 다른 워커에 넘깁니다.")
+            self._release(state, deviceid)
+        for deviceid in sorted(desired - self.owned):
+            if self._try_acquire(deviceid):
+                self._load_state(state, deviceid)
+                with self._lock:
+                    self.owned.add(deviceid)
+        return set(self.owned)
+
+    def _renew_loop(self):
+        while not self._stop_event.wait(self.ttl / 3):
+            try:
+                self._heartbeat()
+            except Exception as e:
+                print(f"[WARNING] 워커 heartbeat 갱신 실패: {e}")
+            with self._lock:
+                owned = list(self.owned)
+            for deviceid in owned:
+                try:
+                    self._renew(deviceid)
+                except Exception as e:
+                    # 갱신 스레드가 멈추면 모든 lease가 만료되므로, 어떤 오류에도 스레드를 계속 실행
+                    print(f"[WARNING] deviceid '{deviceid}'의 lease 갱신 중 오류: {e}")
+                    with self._lock:
+                        self.owned.discard(deviceid)
+
+    def _renew(self, deviceid):
+        """
+        자신의 lease이면 갱신 시각을 바꿈. lease가 없어졌거나 다른 워커의 것이면(다른 워커가 만료 처리 중 삭제/교체)
+        담당 목록에서 빼고, 다음 refresh()에서 다시 얻도록 합니다.
+        """
+        path = self._lease_path(deviceid)
+        try:
+            lease = self._read_lease(path)
+            if lease is not None and lease[0] == self.worker_id:
+                os.utime(path)
+                return
+        except OSError as e:
+            print(f"[WARNING] deviceid '{deviceid}'의 lease 갱신 실패: {e}")
+        # lease 갱신이 늦어 다른 워커가 가져간 경우, 다음 사이클부터 처리하지 않음
+        print(f"[WARNING] deviceid '{deviceid}'의 lease를 잃었습니다.")
+        with self._lock:
+            self.owned.discard(deviceid)
+
+    def close(self, state):
+        """
+        갱신 스레드를 멈추고, 모든 lease를 내려놓은 뒤 heartbeat 파일을 지움.
+        """
+        self._stop_event.set()
+        for deviceid in list(self.owned):
+            self._release(state, deviceid)
+        try:
+            os.remove(os.path.join(self._workers_dir, self.worker_id))
+        except FileNotFoundError:
+            pass
+
+
+LEASE_MANAGER = None
+_LEASE_MANAGER_LOCK = threading.Lock()
+
+def get_lease_manager():
+    """
+    config.json의 partition이 true이면 전역 lease 관리자를 한 번만 생성하여 반환. 사용하지 않으면 None.
+    """
+    global LEASE_MANAGER
+    if not CONFIG.get('partition', False):
+        return None
+    with _LEASE_MANAGER_LOCK:
+        if LEASE_MANAGER is None:
+            save_path = CONFIG.get('save_path')
+            LEASE_MANAGER = LeaseManager(
+                lease_dir=CONFIG.get('lease_dir') or os.path.join(save_path, '.leases'),
+                save_path=save_path,
+                worker_id=CONFIG.get('worker_id') or f"{socket.gethostname()}-{os.getpid()}",
+                ttl=CONFIG.get('lease_ttl', 120),
+            )
+        return LEASE_MANAGER
@@ -0,0 +1,900 @@
+#-*- coding: utf-8 -*-
+# loaders.py
+# 엑셀/CSV/DBF 파일을 읽어 TIME 열이 정규화된 DataFrame으로 변환합니다. (이어 읽기 위치, 파싱 결과 캐시 포함)
+
+import io
+import os
+import json
+import shutil
+import hashlib
+import traceback
+import threading
+from datetime import datetime
+from os.path import basename
+
+import numpy as np
+
+# pip install pandas simpledbf
+import pandas as pd
+from pandas.io.parsers import TextParser
+from simpledbf import Dbf5
+
+# 선택 라이브러리: 파싱 결과를 Parquet 캐시(frame_cache_dir)에 저장하려면 설치
+# pip install pyarrow
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from settings import CONFIG, DEFAULT_FRAME_CACHE_MAX_MB
+from worker_metrics import stage_timer
+
+
+FRAME_CACHE = None # 파싱된 시트 DataFrame의 Parquet 캐시 (config.json의 frame_cache_dir 설정 시 사용)
+
+
+def _replace_all(strings, pairs):
+    for old, new in pairs:
+        strings = strings.str.replace(old, new, regex=False)
+    return strings
+
+
+def _add_date_or_seconds(strings, fdate):
+    # 형식 2의 컬럼 단위 전처리: 날짜가 없는 짧은 시간 문자열에는 파일 날짜를 붙이고, 나머지는 초를 채워 '/'를 '-'로 바꿈
+    processed = _replace_all((strings + ":00").str.slice(0, 19), [("/", "-")])
+    if not fdate:
+        return processed
+    time_only = (strings.str.len() < 12) & strings.str.contains(':', regex=False)
+    return processed.where(~time_only, f"{fdate} " + strings)
+
+
+_KOREAN_TIME_PAIRS = [("년", "-"), ("월", "-"), ("일", " "), ("시", ":"), ("분", ":"), ("초", "")]
+
+# 시도할 TIME 형식과 전처리 로직의 리스트 (앞에서부터 순서대로 시도)
+# 각 항목은 (전처리 함수, strptime 포맷, 컬럼 전처리 함수)의 튜플
+# 전처리 함수는 (원본문자열, 파일날짜)를 인자로 받아 파싱할 문자열을 반환한다. 아무것도 반환하지 못할경우 에러처리.
+# 컬럼 전처리 함수는 같은 변환을 문자열 Series 전체에 .str 메서드로 한 번에 적용한다. (TimeColumnParser에서 사용)
+TIME_PARSING_STRATEGIES = [
+    # 형식 1: '24년1월1일 10시20분30초' -> '24-01-01 10:20:30'
+    (lambda s, d: s.replace("년", "-").replace("월", "-").replace("일", " ").replace("시", ":").replace("분", ":").replace("초", ""), '%y-%m-%d %H:%M:%S',
+     lambda strings, d: _replace_all(strings, _KOREAN_TIME_PAIRS)),
+
+    # 형식 2: '2024/01/01 10:20' 또는 '10:20:30' (날짜가 없는경우 넘겨받은 파일의 날짜를 사용(fdata)
+    (lambda s, d: f"{d} {s}" if d and len(s) < 12 and ':' in s else (s + ":00")[:19].replace("/", "-"), '%Y-%m-%d %H:%M:%S',
+     _add_date_or_seconds),
+
+    # 형식 3: '2024.01.01 10:20:30' 또는 '24.01.01 10:20:30'
+    (lambda s, d: s.replace(".", "-"), '%Y-%m-%d %H:%M:%S', lambda strings, d: _replace_all(strings, [(".", "-")])),
+    (lambda s, d: s.replace(".", "-"), '%y-%m-%d %H:%M:%S', lambda strings, d: _replace_all(strings, [(".", "-")])),
+]
+TIME_SNIFF_SAMPLE_SIZE = 20 # 시트별 TIME 형식 감지에 사용할 샘플 행 수
+STREAM_CHUNK_ROWS = 5000 # 스트리밍 로더가 이미 처리된 행을 걸러낼 때 한 번에 판단하는 행 수
+RESUME_CHECK_BYTES = 4096 # CSV/DBF 이어 읽기 전, 파일이 교체되지 않았는지 확인할 때 비교하는 바이트 수
+CSV_READ_BYTES = 1 << 20 # CSV 파일을 한 번에 읽어 파서에 넘기는 바이트 수
+
+
+def match_time_strategy(time_str, fdate=None):
+    """
+    TIME_PARSING_STRATEGIES를 순서대로 시도하여 (성공한 전략 인덱스, datetime)을 반환.
+    모든 전략이 실패하면 pandas 자동 파싱 결과와 함께 인덱스 None을 반환.
+    """
+    for idx, (preprocess, fmt, _) in enumerate(TIME_PARSING_STRATEGIES):
+        try:
+            processed_str = preprocess(time_str, fdate)
+            return idx, datetime.strptime(processed_str, fmt)
+        except (ValueError, TypeError):
+            continue
+
+    # 모든 형식 변환 실패 시, pandas의 자동 파싱 기능을 마지막으로 시도
+    # errors='coerce'는 파싱 실패 시 NaT (Not a Time)을 반환하여 오류를 방지
+    return None, pd.to_datetime(time_str, errors='coerce')
+
+
+def parse_flexible_time(time_val, fdate=None):
+    """
+    여러 형식의 시간 문자열을 파싱하여 datetime 객체로 변환하는 함수.
+    """
+    if pd.isna(time_val):
+        return pd.NaT
+
+    return match_time_strategy(str(time_val), fdate)[1]
+
+
+class TimeColumnParser:
+    """
+    (dataid, 시트) 단위로 TIME 컬럼의 형식을 기억하여 컬럼 전체를 한 번에 파싱하는 파서.
+    - 처음 파싱할 때 샘플 행마다 셀 단위 파싱(match_time_strategy)에서 처음 맞는 전략을 구하고, 가장 많은 행이 맞은
+      전략 하나만 컬럼 전처리(.str 메서드)와 pd.to_datetime(format=...)으로 컬럼 전체에 적용합니다.
+    - 그 형식에 맞지 않는 행은 parse_flexible_time과 같은 셀 단위 방식(원래 전략 순서, 마지막으로 pandas 자동 파싱)으로 처리합니다.
+    - 감지된 형식에 맞는 행은 그 형식으로 해석합니다. 따라서 결과가 셀 단위 파싱과 같은 것은 그 행에 우선순위가 더 높은
+      전략이 맞지 않는 경우이며(샘플 행에서는 확인됨), 한 컬럼 안에서 형식이 섞이지 않는 일반적인 데이터가 이에 해당합니다.
+    - 셀 단위로 처리한 행이 일괄 처리한 행보다 많으면 다음 파싱에서 형식을 다시 감지합니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.strategy = None  # 감지된 전략 인덱스 (None이면 아직 감지 전, -1이면 맞는 전략 없음)
+        self.stats = {'rows': 0, 'vectorized': 0, 'fallback': 0, 'failed': 0}
+
+    def _sniff(self, time_strs, fdate):
+        counts = {}
+        for time_str in time_strs[:TIME_SNIFF_SAMPLE_SIZE]:
+            idx, _ = match_time_strategy(time_str, fdate)
+            if idx is not None:
+                counts[idx] = counts.get(idx, 0) + 1
+        if not counts:
+            return -1
+        return max(sorted(counts), key=lambda idx: counts[idx])
+
+    def parse(self, time_series, fdate=None):
+        """
+        TIME 컬럼(Series)을 datetime Series로 변환. 파싱 실패 행은 NaT.
+        """
+        row_count = len(time_series)
+        if pd.api.types.is_datetime64_any_dtype(time_series.dtype):
+            # 이미 날짜형인 경우 문자열 변환 후 초 단위로 자르던 기존 결과와 동일하게 처리
+            if getattr(time_series.dt, 'tz', None) is not None:
+                time_series = time_series.dt.tz_localize(None)
+            parsed = time_series.dt.floor('s')
+            self._add_stats(row_count, row_count, 0, int(parsed.isna().sum()))
+            return parsed
+
+        na_mask = time_series.isna().to_numpy()
+        remaining = np.flatnonzero(~na_mask)
+        # 값이 있는 행만 문자열 Series로 변환 (셀 단위 파싱의 str(값)과 같은 결과)
+        time_strs = time_series.iloc[remaining].astype(str).reset_index(drop=True)
+        results = pd.Series(pd.NaT, index=time_series.index, dtype='datetime64[us]')
+
+        with self._lock:
+            if self.strategy is None:
+                self.strategy = self._sniff(time_strs.iloc[:TIME_SNIFF_SAMPLE_SIZE].tolist(), fdate)
+            strategy = self.strategy
+
+        # 1) 감지된 형식을 컬럼 전체에 한 번에 적용
+        vectorized_count = 0
+        if strategy >= 0 and len(remaining):
+            _, fmt, preprocess_column = TIME_PARSING_STRATEGIES[strategy]
+            parsed = pd.to_datetime(preprocess_column(time_strs, fdate), format=fmt, errors='coerce')
+            ok_mask = parsed.notna().to_numpy()
+            results.iloc[remaining[ok_mask]] = parsed.to_numpy()[ok_mask]
+            vectorized_count = int(ok_mask.sum())
+            time_strs = time_strs[~ok_mask]
+            remaining = remaining[~ok_mask]
+
+        # 2) 형식이 맞지 않는 행은 원래 전략 순서대로 셀 단위로 처리
+        failed_count = int(na_mask.sum())
+        if len(remaining):
+            merged = results.astype(object).to_numpy(copy=True)
+            for pos, time_str in zip(remaining, time_strs):
+                value = parse_flexible_time(time_str, fdate)
+                if pd.isna(value):
+                    failed_count += 1
+                merged[pos] = value
+            results = pd.Series(list(merged), index=time_series.index)
+
+        if len(remaining) > vectorized_count:
+            # 형식이 바뀐 파일 등: 다음 파싱에서 다시 감지
+            with self._lock:
+                self.strategy = None
+        self._add_stats(row_count, vectorized_count, len(remaining), failed_count)
+
+        return results
+
+    def _add_stats(self, rows, vectorized, fallback, failed):
+        with self._lock:
+            self.stats['rows'] += rows
+            self.stats['vectorized'] += vectorized
+            self.stats['fallback'] += fallback
+            self.stats['failed'] += failed
+
+
+TIME_PARSER_CACHE = {} # (dataid, 시트) -> TimeColumnParser
+_TIME_PARSER_CACHE_LOCK = threading.Lock()
+
+def get_time_parser(dataid, sheet_name):
+    with _TIME_PARSER_CACHE_LOCK:
+        parser = TIME_PARSER_CACHE.get((dataid, sheet_name))
+        if parser is None:
+            parser = TIME_PARSER_CACHE[(dataid, sheet_name)] = TimeColumnParser()
+        return parser
+
+
+def get_time_parse_stats():
+    """
+    (dataid, 시트)별 TIME 파싱 통계를 반환. (rows: 전체, vectorized: 일괄 파싱, fallback: 셀 단위 파싱, failed: 실패)
+    """
+    with _TIME_PARSER_CACHE_LOCK:
+        parsers = list(TIME_PARSER_CACHE.items())
+    return {key: dict(parser.stats) for key, parser in parsers}
+
+
+def parse_headerline(headerline):
+    """
+    headerline 파라미터('1', '[1,2]' 등)를 (pandas header 설정, 다중 헤더 여부, 마지막 헤더 행 번호)로 변환.
+    """
+    header_str = str(headerline)
+    if header_str.startswith('[') and header_str.endswith(']'):
+        try:
+            header_list = json.loads(header_str)
+            return [h - 1 for h in header_list], True, max(header_list)
+        except (json.JSONDecodeError, ValueError):
+            return 0, False, 1
+    elif header_str.isdigit():
+        return int(header_str) - 1, False, int(header_str)
+    return 0, False, 1
+
+
+def get_rows_to_skip(columnline, effective_header_line_num):
+    """
+    columnline(데이터 시작 행 번호)에 따라 헤더 다음에서 건너뛸 행 수를 계산.
+    """
+    try:
+        columnline_num = int(columnline)
+        df_starts_at_line = effective_header_line_num + 1
+        rows_to_skip = columnline_num - df_starts_at_line
+        if rows_to_skip < 0:
+            rows_to_skip = 0
+        return rows_to_skip, columnline_num
+    except (ValueError, TypeError):
+        return 0, columnline
+
+
+def normalize_columns(sheet_name, sheet_df, is_multi_header, verbose=True):
+    """
+    다중 헤더를 '상위.하위' 형태로 합치고, 'Unnamed' 컬럼과 중복 컬럼을 제거.
+    """
+    if is_multi_header:
+        new_cols = []
+        last_header_part = ""
+        for col in sheet_df.columns:
+            part1 = str(col[0])
+            if 'Unnamed:' in part1 or part1.strip() == '':
+                current_header_part1 = last_header_part
+            else:
+                current_header_part1 = part1
+                last_header_part = part1
+            
+            remaining_parts = [str(p) for p in col[1:] if 'Unnamed:' not in str(p) and str(p).strip() != '']
+            all_parts = [current_header_part1] + remaining_parts
+            combined_col = '.'.join(filter(None, all_parts))
+            new_cols.append(combined_col)
+        sheet_df.columns = new_cols
+
+    cols_to_keep = [col for col in sheet_df.columns if 'Unnamed:' not in str(col)]
+    if len(cols_to_keep) < len(sheet_df.columns) and verbose:
+        dropped_cols = [col for col in sheet_df.columns if 'Unnamed:' in str(col)]
+        print(f"[INFO] 시트 '{sheet_name}'에서 'Unnamed' 컬럼 {dropped_cols}을 무시합니다.")
+    sheet_df = sheet_df[cols_to_keep]
+
+    all_columns = sheet_df.columns.tolist()
+    unique_columns = []
+    seen_originals = set()
+    for column in all_columns:
+        original_col = column
+        if isinstance(column, str) and len(column) > 2 and column[-2] == '.' and column[-1].isdigit():
+            original_col = column[:-2]
+        if original_col not in seen_originals:
+            unique_columns.append(column)
+            seen_originals.add(original_col)
+    
+    if len(all_columns) > len(unique_columns) and verbose:
+        dropped_cols = [col for col in all_columns if col not in unique_columns]
+        print(f"[INFO] 시트 '{sheet_name}'에서 중복 컬럼 {dropped_cols}을 무시합니다.")
+    return sheet_df[unique_columns]
+
+
+def get_file_date(filename, verbose=True):
+    """
+    파일명에서 날짜 추출 (시간만 있는 데이터에 사용). 추출할 수 없으면 None.
+    """
+    try:
+        fname = basename(filename).split(".")
+        fdate_str = fname[0].split("_")[-1]
+        # 'YYYY년MM월DD일' 또는 'YYYY-MM-DD' 같은 형식을 '%Y-%m-%d'로 통일
+        cleaned_fdate_str = fdate_str.replace("년", "-").replace("월", "-").replace("일", "")
+        return datetime.strptime(cleaned_fdate_str, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (ValueError, IndexError):
+        if verbose:
+            print(f"[WARNING] 파일명 '{basename(filename)}'에서 날짜를 추출할 수 없습니다. 시간만 있는 데이터는 파싱에 실패할 수 있습니다.")
+        return None
+
+
+def finalize_sheet(filename, dataid, sheet_name, sheet_df):
+    """
+    컬럼 정리가 끝난 시트의 첫 컬럼을 TIME으로 지정하고 파싱. 유효한 행이 없으면 None.
+    """
+    if sheet_df.empty or sheet_df.columns.empty:
+        return None
+
+    input_df = sheet_df.rename(columns={sheet_df.columns[0]: 'TIME'})
+    
+    # 파싱 전 TIME 컬럼이 비어있는 행을 먼저 제거
+    input_df.dropna(subset=['TIME'], inplace=True)
+    if input_df.empty:
+        print(f"[INFO] 시트 '{sheet_name}'에 유효한 시간 데이터가 없어 건너뜁니다.")
+        return None
+
+    print(f"[DEBUG] 시트 '{sheet_name}'의 TIME 컬럼 파싱 시도 (원본 데이터 예시: {input_df['TIME'].iloc[0]})")
+    
+    original_time_column = input_df['TIME'].copy()
+    
+    # --- 유연한 시간 파싱 로직 ---
+    fdate = get_file_date(filename)
+
+    # (dataid, 시트)별로 감지된 형식을 이용해 TIME 컬럼 전체를 한 번에 파싱한다.
+    with stage_timer('time_parse'):
+        input_df['TIME'] = get_time_parser(dataid, sheet_name).parse(input_df['TIME'], fdate=fdate)
+    
+    # 파싱에 실패한 행(NaT)이 있는지 확인하고 경고
+    failed_mask = input_df['TIME'].isna()
+    if failed_mask.any():
+        failed_count = failed_mask.sum()
+        failed_examples = original_time_column[failed_mask].head(3).tolist()
+        print(f"[WARNING] 시트 '{sheet_name}'에서 TIME 컬럼 파싱 실패 (총 {failed_count}개). 예시: {failed_examples}")
+        # 파싱 실패한 행 최종 제거
+        input_df.dropna(subset=['TIME'], inplace=True)
+
+    return input_df
+
+
+def load_excel_data(filename, dataid, headerline, columnline):
+    """
+    .xls 또는 .xlsx 파일을 읽어 Pandas DataFrame으로 변환.
+    columnline을 사용하여 데이터 시작점 이전의 행을 건너뛰고, 명시된 TIME 포맷으로 파싱합니다.
+    """
+    try:
+        header_config, is_multi_header, effective_header_line_num = parse_headerline(headerline)
+
+        all_sheets_df = pd.read_excel(filename, header=header_config, sheet_name=None)
+        
+        rows_to_skip, columnline_num = get_rows_to_skip(columnline, effective_header_line_num)
+
+        processed_sheets = {}
+        for sheet_name, sheet_df in all_sheets_df.items():
+            if sheet_df.empty:
+                continue
+
+            # columnline 로직 적용: DataFrame의 시작 부분에서 불필요한 행 건너뛰기
+            if rows_to_skip > 0:
+                if len(sheet_df) > rows_to_skip:
+                    print(f"[INFO] 시트 '{sheet_name}'의 시작 데이터 행({columnline_num})에 따라 상위 {rows_to_skip}개 행을 건너뜁니다.")
+                    sheet_df = sheet_df.iloc[rows_to_skip:].reset_index(drop=True)
+                else:
+                    print(f"[WARNING] 시트 '{sheet_name}'에서 건너뛸 행({rows_to_skip})이 전체 행 수({len(sheet_df)})보다 많아 데이터가 없습니다.")
+                    continue
+
+            sheet_df = normalize_columns(sheet_name, sheet_df, is_multi_header)
+            input_df = finalize_sheet(filename, dataid, sheet_name, sheet_df)
+            if input_df is not None:
+                processed_sheets[sheet_name] = input_df
+        
+        return processed_sheets
+
+    except Exception as e:
+        print(f"[ERROR] Excel 파일 로딩 실패: {filename}, {e}")
+        traceback.print_exc()
+        return None
+
+
+def convert_xlsx_cell(cell):
+    """
+    openpyxl 셀 값을 pandas.read_excel과 동일한 규칙으로 변환. (빈 셀은 '', 오류 셀은 NaN, 정수로 표현 가능한 숫자는 int)
+    """
+    value = cell.value
+    if value is None:
+        return ""
+    elif cell.data_type == 'e':
+        return np.nan
+    elif cell.data_type == 'n':
+        int_value = int(value)
+        if int_value == value:
+            return int_value
+        return float(value)
+    return value
+
+
+def rows_to_frame(rows, header_config):
+    """
+    헤더 행과 데이터 행(리스트의 리스트)을 pandas.read_excel과 같은 방식으로 DataFrame으로 변환.
+    """
+    width = max(len(row) for row in rows)
+    data = [row + [""] * (width - len(row)) for row in rows]
+    if isinstance(header_config, list) and len(header_config) > 1:
+        # 다중 헤더의 빈 칸은 같은 상위 헤더 범위 안에서 앞의 값으로 채움 (read_excel과 동일)
+        control_row = [True] * width
+        for header_row in header_config:
+            row = data[header_row]
+            last = row[0]
+            for i in range(1, width):
+                if not control_row[i]:
+                    last = row[i]
+                if row[i] == "" or row[i] is None:
+                    row[i] = last
+                else:
+                    control_row[i] = False
+                    last = row[i]
+    elif isinstance(header_config, list):
+        header_config = header_config[0]
+    return TextParser(data, header=header_config, skip_blank_lines=False).read()
+
+
+def find_time_position(sheet_name, header_rows, header_config, is_multi_header):
+    """
+    헤더 행만으로 컬럼 정리(normalize_columns)를 수행하여, TIME이 될 컬럼의 원래 위치를 찾음.
+    """
+    width = max(len(row) for row in header_rows)
+    probe_df = rows_to_frame([list(row) for row in header_rows] + [list(range(width))], header_config)
+    probe_df = normalize_columns(sheet_name, probe_df, is_multi_header, verbose=False)
+    if probe_df.columns.empty:
+        return None
+    return int(probe_df.iloc[0, 0])
+
+
+def load_excel_streaming(filename, dataid, headerline, columnline, since=None):
+    """
+    .xlsx 파일을 openpyxl read_only 모드로 한 행씩 읽어 load_excel_data와 같은 형태의 DataFrame으로 변환.
+    since(시트명 -> 마지막 처리 시간 또는 None)가 주어지면, 읽는 도중 이미 처리된 행을 버리고
+    새로운 행만 보관하므로 파일 크기와 관계없이 메모리 사용량이 새 행 수에 비례합니다.
+    """
+    try:
+        from openpyxl import load_workbook
+
+        header_config, is_multi_header, effective_header_line_num = parse_headerline(headerline)
+        rows_to_skip, columnline_num = get_rows_to_skip(columnline, effective_header_line_num)
+        header_row_count = (max(header_config) if isinstance(header_config, list) else header_config) + 1
+        fdate = None
+
+        processed_sheets = {}
+        workbook = load_workbook(filename, read_only=True, data_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                sheet_name = worksheet.title
+                since_time = since(sheet_name) if since else None
+                worksheet.reset_dimensions()
+
+                header_rows = []
+                kept_rows = []
+                chunk = []
+                pending_blank = []  # 뒤쪽 빈 행은 read_excel처럼 제거하기 위해 보류
+                data_row_count = 0
+                time_pos = None
+                prefilter = None
+
+                def flush_chunk():
+                    # 이미 처리된 행(TIME <= since_time)을 버리고 나머지만 보관
+                    if not chunk:
+                        return
+                    if time_pos is None or since_time is None:
+                        kept_rows.extend(chunk)
+                    else:
+                        raw_times = [row[time_pos] if time_pos < len(row) else "" for row in chunk]
+                        try:
+                            with stage_timer('time_parse'):
+                                parsed = prefilter.parse(pd.Series([None if v == "" else v for v in raw_times]), fdate=fdate)
+                            keep = (parsed.isna() | (parsed > since_time)).to_numpy()
+                        except Exception:
+                            # 판단할 수 없는 경우 모두 보관 (최종 필터는 sendopcua_task에서 다시 수행)
+                            keep = [True] * len(chunk)
+                        kept_rows.extend(row for row, k in zip(chunk, keep) if k)
+                    chunk.clear()
+
+                for row in worksheet.iter_rows():
+                    converted_row = [convert_xlsx_cell(cell) for cell in row]
+                    while converted_row and converted_row[-1] == "":
+                        converted_row.pop()
+
+                    if len(header_rows) < header_row_count:
+                        header_rows.append(converted_row)
+                        if len(header_rows) == header_row_count and since_time is not None:
+                            time_pos = find_time_position(sheet_name, header_rows, header_config, is_multi_header)
+                            fdate = get_file_date(filename, verbose=False)
+                            prefilter = TimeColumnParser()
+                        continue
+
+                    if not converted_row:
+                        pending_blank.append(converted_row)
+                        continue
+                    rows = pending_blank + [converted_row]
+                    pending_blank = []
+                    for data_row in rows:
+                        data_row_count += 1
+                        # columnline 로직 적용: 헤더 다음의 불필요한 행 건너뛰기
+                        if data_row_count <= rows_to_skip:
+                            continue
+                        chunk.append(data_row)
+                        if len(chunk) >= STREAM_CHUNK_ROWS:
+                            flush_chunk()
+                flush_chunk()
+
+                if len(header_rows) < header_row_count or data_row_count == 0:
+                    continue
+                if rows_to_skip > 0:
+                    if data_row_count > rows_to_skip:
+                        print(f"[INFO] 시트 '{sheet_name}'의 시작 데이터 행({columnline_num})에 따라 상위 {rows_to_skip}개 행을 건너뜁니다.")
+                    else:
+                        print(f"[WARNING] 시트 '{sheet_name}'에서 건너뛸 행({rows_to_skip})이 전체 행 수({data_row_count})보다 많아 데이터가 없습니다.")
+                        continue
+                if not kept_rows:
+                    continue
+
+                sheet_df = rows_to_frame(header_rows + kept_rows, header_config)
+                sheet_df = normalize_columns(sheet_name, sheet_df, is_multi_header)
+                input_df = finalize_sheet(filename, dataid, sheet_name, sheet_df)
+                if input_df is not None:
+                    processed_sheets[sheet_name] = input_df
+        finally:
+            workbook.close()
+
+        return processed_sheets
+
+    except Exception as e:
+        print(f"[ERROR] Excel 파일 로딩 실패: {filename}, {e}")
+        traceback.print_exc()
+        return None
+
+
+def region_hash(f, start, stop):
+    """
+    열린 파일의 [start, stop) 구간 SHA-1 해시. (이어 읽기 위치 검증용)
+    """
+    start = max(0, start)
+    f.seek(start)
+    return hashlib.sha1(f.read(max(0, stop - start))).hexdigest()
+
+
+def resume_position(f, file_size, resume, kind, layout, head_start=0):
+    """
+    저장된 이어 읽기 정보(resume)가 현재 파일에 그대로 유효하면 이어 읽을 바이트 위치를, 아니면 None을 반환.
+    파일이 줄었거나, 앞부분 또는 마지막으로 읽은 구간의 내용이 달라졌으면(파일 교체) 처음부터 다시 읽습니다.
+    """
+    if not resume or resume.get('kind') != kind or resume.get('layout') != layout:
+        return None
+    offset = resume.get('offset')
+    if not isinstance(offset, int) or offset < head_start or offset > file_size:
+        return None
+    if region_hash(f, head_start, min(offset, head_start + RESUME_CHECK_BYTES)) != resume.get('head_hash'):
+        return None
+    if region_hash(f, max(head_start, offset - RESUME_CHECK_BYTES), offset) != resume.get('tail_hash'):
+        return None
+    return offset
+
+
+def update_resume(resume, f, kind, layout, offset, head_start=0):
+    """
+    읽기를 마친 위치(offset)와 검증용 해시로 resume 딕셔너리를 갱신.
+    """
+    if resume is None:
+        return
+    resume.clear()
+    resume.update({
+        'kind': kind,
+        'layout': layout,
+        'offset': offset,
+        'head_hash': region_hash(f, head_start, min(offset, head_start + RESUME_CHECK_BYTES)),
+        'tail_hash': region_hash(f, max(head_start, offset - RESUME_CHECK_BYTES), offset),
+    })
+
+
+def last_line_end(f, start, stop):
+    """
+    열린 파일의 [start, stop) 구간에서 마지막 줄바꿈(b'\\n') 바로 뒤의 위치를 반환. 줄바꿈이 없으면 start.
+    (기록 중인 파일의 마지막 미완성 행은 다음 사이클에 다시 읽도록 제외)
+    """
+    pos = stop
+    while pos > start:
+        block_start = max(start, pos - CSV_READ_BYTES)
+        f.seek(block_start)
+        index = f.read(pos - block_start).rfind(b'\n')
+        if index >= 0:
+            return block_start + index + 1
+        pos = block_start
+    return start
+
+
+class RangeReader(io.RawIOBase):
+    """
+    열린 파일의 [start, stop) 구간만 읽는 파일 객체. (pd.read_csv가 구간 전체를 메모리에 올리지 않고 나누어 읽도록 사용)
+    """
+
+    def __init__(self, f, start, stop):
+        self._f = f
+        self._pos = start
+        self._stop = stop
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._stop - self._pos)
+        if size <= 0:
+            return 0
+        self._f.seek(self._pos)
+        data = self._f.read(size)
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def load_csv_data(filename, dataid, headerline, columnline, resume=None):
+    """
+    .csv 파일을 STREAM_CHUNK_ROWS 행 단위로 읽어 load_excel_data와 같은 형태({'Sheet1': DataFrame})로 변환.
+    resume에 이전에 읽은 바이트 위치가 있으면 헤더 행만 다시 읽고 데이터는 그 위치부터(뒤에 추가된 부분만) 읽으며,
+    읽기를 마친 위치로 resume을 갱신합니다. (columnline에 따른 행 건너뛰기는 처음부터 읽을 때만 적용)
+    """
+    try:
+        header_config, is_multi_header, effective_header_line_num = parse_headerline(headerline)
+        rows_to_skip, columnline_num = get_rows_to_skip(columnline, effective_header_line_num)
+        header_row_count = (max(header_config) if isinstance(header_config, list) else header_config) + 1
+        encoding = CONFIG.get('csv_encoding', 'utf-8-sig')
+        layout = [str(headerline), str(columnline), encoding]
+        sheet_name = 'Sheet1'  # 시트가 없는 형식은 단일 시트 xlsx와 같은 태그 이름(dataid.컬럼)을 사용
+
+        with open(filename, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            header_lines = [f.readline() for _ in range(header_row_count)]
+            data_start = f.tell()
+            offset = resume_position(f, file_size, resume, 'csv', layout)
+            from_start = offset is None or offset < data_start
+            if from_start:
+                offset = data_start
+            # 완성된 행(마지막 줄바꿈)까지만 읽고 그 위치를 저장하므로, 기록 중이던 마지막 행은 다음에 온전히 다시 읽음
+            end = last_line_end(f, offset, file_size)
+            update_resume(resume, f, 'csv', layout, end)
+
+            if not all(line.strip() for line in header_lines) or end <= offset:
+                return {}
+            if not from_start:
+                print(f"[INFO] '{basename(filename)}'의 이전에 읽은 위치({offset} bytes) 이후 추가된 {end - offset} bytes만 읽습니다.")
+
+            header_df = pd.read_csv(io.BytesIO(b''.join(header_lines)), header=header_config, encoding=encoding)
+            header_columns = header_df.columns
+            skip = rows_to_skip if from_start else 0
+            # 헤더보다 필드가 많은 행은 헤더 범위까지만 사용 (read_excel과 동일하게 헤더 없는 컬럼은 무시)
+            positions = list(range(len(header_columns)))
+            body = io.BufferedReader(RangeReader(f, offset, end), buffer_size=CSV_READ_BYTES)
+            reader = pd.read_csv(body, header=None, names=positions, usecols=positions,
+                                 skiprows=skip, encoding=encoding, chunksize=STREAM_CHUNK_ROWS)
+
+            chunks = []
+            for chunk in reader:
+                chunk.columns = header_columns
+                chunks.append(normalize_columns(sheet_name, chunk, is_multi_header, verbose=not chunks))
+
+        if not chunks:
+            if skip > 0:
+                print(f"[WARNING] 시트 '{sheet_name}'에서 건너뛸 행({rows_to_skip})이 전체 행 수보다 많아 데이터가 없습니다.")
+            return {}
+        if skip > 0:
+            print(f"[INFO] 시트 '{sheet_name}'의 시작 데이터 행({columnline_num})에 따라 상위 {rows_to_skip}개 행을 건너뜁니다.")
+
+        input_df = finalize_sheet(filename, dataid, sheet_name, pd.concat(chunks, ignore_index=True))
+        return {sheet_name: input_df} if input_df is not None else {}
+
+    except Exception as e:
+        print(f"[ERROR] CSV 파일 로딩 실패: {filename}, {e}")
+        traceback.print_exc()
+        return None
+
+
+def load_dbf_data(filename, dataid, resume=None):
+    """
+    .dbf 파일을 STREAM_CHUNK_ROWS 레코드 단위로 읽어 {'Sheet1': DataFrame}으로 변환. (컬럼명은 DBF 필드명)
+    DBF 레코드는 고정 길이이므로 resume에 저장된 위치에서 이미 읽은 레코드를 건너뛰고 새 레코드만 읽습니다.
+    """
+    try:
+        dbf = Dbf5(filename, codec=CONFIG.get('dbf_encoding', 'utf-8'))
+    except Exception as e:
+        print(f"[ERROR] DBF 파일 로딩 실패: {filename}, {e}")
+        traceback.print_exc()
+        return None
+
+    sheet_name = 'Sheet1'
+    f = dbf.f
+    try:
+        # 헤더 앞 32바이트(레코드 수, 수정일)는 레코드가 추가될 때마다 바뀌므로 검증에서 제외
+        head_start = 32
+        layout = [dbf.lenheader, dbf.fmtsiz]
+        file_size = os.fstat(f.fileno()).st_size
+        total_records = max(0, min(dbf.numrec, (file_size - dbf.lenheader) // dbf.fmtsiz))
+
+        start_record = 0
+        offset = resume_position(f, file_size, resume, 'dbf', layout, head_start=head_start)
+        if offset is not None and (offset - dbf.lenheader) % dbf.fmtsiz == 0:
+            start_record = min(total_records, (offset - dbf.lenheader) // dbf.fmtsiz)
+        if start_record:
+            print(f"[INFO] '{basename(filename)}'의 이전에 읽은 레코드 {start_record}개 이후 {total_records - start_record}개만 읽습니다.")
+
+        f.seek(dbf.lenheader + start_record * dbf.fmtsiz)
+        dbf.numrec = total_records - start_record
+        # 레코드 묶음을 하나씩 받아 빈 묶음은 바로 버림 (to_dataframe은 파일에서 STREAM_CHUNK_ROWS개씩 읽는 제너레이터)
+        chunks = []
+        if dbf.numrec > 0:
+            for chunk in dbf.to_dataframe(chunksize=STREAM_CHUNK_ROWS):
+                if not chunk.empty:
+                    chunks.append(chunk)
+        update_resume(resume, f, 'dbf', layout, dbf.lenheader + total_records * dbf.fmtsiz, head_start=head_start)
+
+        if not chunks:
+            return {}
+        sheet_df = normalize_columns(sheet_name, pd.concat(chunks, ignore_index=True), False)
+        input_df = finalize_sheet(filename, dataid, sheet_name, sheet_df)
+        return {sheet_name: input_df} if input_df is not None else {}
+
+    except Exception as e:
+        print(f"[ERROR] DBF 파일 로딩 실패: {filename}, {e}")
+        traceback.print_exc()
+        return None
+    finally:
+        f.close()
+
+
+class FrameCache:
+    """
+    후처리(헤더 정리, TIME 파싱)가 끝난 시트별 DataFrame을 Parquet 파일로 보관하는 디스크 캐시.
+    - 항목은 (파일 경로, 크기, mtime_ns, headerline, columnline, 로더 종류)로 구분되므로 파일이 바뀌면 자동으로 무효화되며,
+      같은 파일의 이전 항목은 새 항목을 저장할 때 삭제합니다.
+    - 전체 크기가 max_bytes를 넘으면 가장 오래 사용하지 않은 항목부터 삭제합니다.
+    - 항목은 임시 디렉터리에 쓴 뒤 rename하므로 여러 파싱 프로세스가 함께 사용해도 반쯤 쓰인 항목을 읽지 않습니다.
+    """
+    VERSION = 1
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, filepath, file_stat, variant):
+        path_key = hashlib.sha1(os.path.abspath(filepath).encode('utf-8')).hexdigest()[:16]
+        content_key = hashlib.sha1(json.dumps(
+            [self.VERSION, file_stat.st_size, file_stat.st_mtime_ns, variant]).encode('utf-8')).hexdigest()[:16]
+        return f"{path_key}-{content_key}"
+
+    def load(self, key):
+        """
+        캐시된 {시트명: DataFrame}을 반환. 없거나 읽을 수 없으면 None.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        manifest_path = os.path.join(entry_dir, 'manifest.json')
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            sheets = {sheet_name: pd.read_parquet(os.path.join(entry_dir, f"{i}.parquet"))
+                      for i, sheet_name in enumerate(manifest['sheets'])}
+            os.utime(manifest_path)  # 최근 사용 시간 갱신 (삭제 순서 결정용)
+            return sheets
+        except (OSError, ValueError, KeyError):
+            return None
+        except Exception as e:
+            print(f"[WARNING] 파싱 결과 캐시({key})를 읽을 수 없습니다: {e}")
+            return None
+
+    def store(self, key, filepath, sheets):
+        entry_dir = os.path.join(self.cache_dir, key)
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            for i, sheet_df in enumerate(sheets.values()):
+                sheet_df.to_parquet(os.path.join(tmp_dir, f"{i}.parquet"), index=False)
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump({'filepath': filepath, 'sheets': list(sheets.keys())}, f, ensure_ascii=False)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except Exception as e:
+            # 혼합 타입 컬럼 등 Parquet로 저장할 수 없는 시트는 캐시하지 않음
+            print(f"[DEBUG] 파싱 결과를 캐시하지 않습니다: {filepath}, {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        # 같은 파일의 이전 항목 삭제 후 크기 제한 적용
+        path_key = key.split('-')[0]
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(path_key + '-') and name != key and '.tmp-' not in name:
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+                last_used = os.stat(os.path.join(entry_dir, 'manifest.json')).st_mtime
+            except OSError:
+                continue
+            entries.append((last_used, size, entry_dir))
+            total_size += size
+        for last_used, size, entry_dir in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+
+
+_FRAME_CACHE_LOCK = threading.Lock()
+
+def get_frame_cache():
+    """
+    config.json의 frame_cache_dir이 설정되어 있으면 파싱 결과 캐시를 한 번만 생성하여 반환. 사용하지 않으면 None.
+    """
+    global FRAME_CACHE
+    cache_dir = CONFIG.get('frame_cache_dir')
+    if not cache_dir:
+        return None
+    with _FRAME_CACHE_LOCK:
+        if FRAME_CACHE is None:
+            if pyarrow is None:
+                print("[WARNING] pyarrow 라이브러리가 없어 파싱 결과 캐시를 사용할 수 없습니다. (pip install pyarrow)")
+                FRAME_CACHE = False
+            else:
+                max_mb = CONFIG.get('frame_cache_max_mb', DEFAULT_FRAME_CACHE_MAX_MB)
+                FRAME_CACHE = FrameCache(cache_dir, int(max_mb) * 1024 * 1024)
+        return FRAME_CACHE or None
+
+
+def filter_since(df_dict, since):
+    """
+    {시트명: DataFrame}에서 이미 처리된 행(TIME <= since(시트명))을 제외. 남은 행이 없는 시트는 결과에서 뺍니다.
+    TIME이 없는 행은 스트리밍 로더와 같이 남겨 두며, 최종 필터는 parse_file_task에서 다시 수행합니다.
+    """
+    if not since or df_dict is None:
+        return df_dict
+    filtered = {}
+    for sheet_name, sheet_df in df_dict.items():
+        since_time = since(sheet_name)
+        if since_time is not None and 'TIME' in sheet_df.columns:
+            sheet_df = sheet_df[sheet_df['TIME'].isna() | (sheet_df['TIME'] > since_time)].reset_index(drop=True)
+            if sheet_df.empty:
+                continue
+        filtered[sheet_name] = sheet_df
+    return filtered
+
+
+def load_excel_cached(filepath, dataid, headerline, columnline, since=None):
+    """
+    엑셀 파일을 파싱 결과 캐시에서 읽고, 없으면 로더로 읽은 뒤 캐시에 저장.
+    캐시에는 모든 행이 담긴 결과를 저장하고, 이미 처리된 행(since)은 캐시에서 읽거나 저장한 뒤에 걸러냅니다.
+    (캐시를 사용하지 않으면 스트리밍 로더가 읽는 도중 걸러냄)
+    """
+    reader = 'streaming' if filepath.lower().endswith('.xlsx') and CONFIG.get('excel_reader', 'streaming') == 'streaming' else 'pandas'
+    cache = get_frame_cache()
+    if cache is None:
+        if reader == 'streaming':
+            return load_excel_streaming(filepath, dataid, headerline, columnline, since)
+        return load_excel_data(filepath, dataid, headerline, columnline)
+
+    key = cache.make_key(filepath, os.stat(filepath), [str(headerline), str(columnline), reader])
+    cached = cache.load(key)
+    if cached is not None:
+        print(f"[INFO] 파싱 결과 캐시에서 '{basename(filepath)}'를 읽었습니다.")
+        return filter_since(cached, since)
+
+    if reader == 'streaming':
+        df_dict = load_excel_streaming(filepath, dataid, headerline, columnline)
+    else:
+        df_dict = load_excel_data(filepath, dataid, headerline, columnline)
+    if df_dict is not None:
+        cache.store(key, filepath, df_dict)
+    return filter_since(df_dict, since)
+
+
+def loaddata(filepath, params, since=None, resume=None):
+    """
+    파일 형식에 맞는 로더로 데이터를 읽어 {시트명: DataFrame}을 반환.
+    since(시트명 -> 마지막 처리 시간)는 스트리밍 로더가 이미 처리된 행을 건너뛰는 데 사용됩니다.
+    resume(dict)이 주어지면 CSV/DBF 로더는 저장된 위치부터 이어 읽고, 읽기를 마친 위치로 resume을 갱신합니다.
+    """
+    dataid = params.get('dataid')
+    headerline = params.get('headerline', '1')
+    columnline = params.get('columnline', '1')
+    ext = os.path.splitext(filepath)[-1].lower()
+
+    if ext in ['.xls', '.xlsx']:
+        return load_excel_cached(filepath, dataid, headerline, columnline, since)
+    elif ext == '.csv':
+        return load_csv_data(filepath, dataid, headerline, columnline, resume)
+    elif ext == '.dbf':
+        return load_dbf_data(filepath, dataid, resume)
+    else:
+        print(f"[WARNING] 지원하지 않는 파일 형식: {ext}")
+        return None
@@ -0,0 +1,119 @@
+#-*- coding: utf-8 -*-
+# metrics.py
+# 워커(worker.py)와 수신 서버(lmfilerecv.py)가 함께 사용하는 Prometheus 형식 성능 지표 모음.
+# 외부 라이브러리 없이 표준 라이브러리만 사용합니다.
+
+import threading
+from bisect import bisect_left
+
+
+class Metrics:
+    """
+    Prometheus 텍스트 형식으로 내보낼 수 있는 최소한의 카운터/게이지/히스토그램 모음. (스레드 안전)
+    지표의 타입과 설명은 help_map(지표 이름 -> (Prometheus 타입, 설명))에 정의합니다.
+    """
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+    def __init__(self, help_map=None):
+        self.help_map = help_map if help_map is not None else {}
+        self._lock = threading.Lock()
+        self._values = {}  # (이름, 레이블 튜플) -> 카운터/게이지 값
+        self._histograms = {}  # (이름, 레이블 튜플) -> [버킷별 개수 리스트, 합계, 개수]
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            index = bisect_left(self.BUCKETS, value)
+            if index < len(self.BUCKETS):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        """
+        현재 값을 (카운터/게이지, 히스토그램) 딕셔너리로 복사하여 반환. (사이클 요약에서 이전 값과 비교)
+        """
+        with self._lock:
+            return dict(self._values), {key: (list(buckets), total, count)
+                                        for key, (buckets, total, count) in self._histograms.items()}
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+    def render(self):
+        """
+        모든 지표를 Prometheus 텍스트 형식(/metrics 응답)으로 변환.
+        """
+        values, histograms = self.snapshot()
+        lines = []
+        for name in sorted({name for name, _ in values} | {name for name, _ in histograms}):
+            metric_type, help_text = self.help_map.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (metric_name, labels), value in sorted(values.items()):
+                if metric_name == name:
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+            for (metric_name, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.BUCKETS, buckets):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{self._format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{self._format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def histogram_delta(before, after, name, **labels):
+    """
+    두 snapshot() 사이에 기록된 히스토그램 값의 (버킷별 개수, 합계, 개수)를 반환. (레이블을 주지 않으면 모두 합산)
+    """
+    buckets = [0] * len(Metrics.BUCKETS)
+    total = 0.0
+    count = 0
+    wanted = set(labels.items())
+    for key, (after_buckets, after_total, after_count) in after[1].items():
+        if key[0] != name or not wanted.issubset(key[1]):
+            continue
+        before_buckets, before_total, before_count = before[1].get(key, ([0] * len(buckets), 0.0, 0))
+        buckets = [b + a - p for b, a, p in zip(buckets, after_buckets, before_buckets)]
+        total += after_total - before_total
+        count += after_count - before_count
+    return buckets, total, count
+
+
+def counter_delta(before, after, name, **labels):
+    wanted = set(labels.items())
+    return sum(value - before[0].get(key, 0) for key, value in after[0].items()
+               if key[0] == name and wanted.issubset(key[1]))
+
+
+def histogram_quantile(buckets, count, quantile):
+    """
+    히스토그램 버킷에서 quantile(0~1) 값의 상한을 추정. 마지막 버킷을 넘으면 inf.
+    """
+    target = quantile * count
+    cumulative = 0
+    for bound, bucket_count in zip(Metrics.BUCKETS, buckets):
+        cumulative += bucket_count
+        if cumulative >= target:
+            return bound
+    return float('inf')
@@ -0,0 +1,785 @@
+#-*- coding: utf-8 -*-
+# opc_writer.py
+# OPC-UA 세션 풀과 동기 전송 경로(Write 배치, 변경 값 캐시, 태그 레지스트리, 백필)를 담당합니다.
+
+import time
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+# pip install opcua pandas
+import pandas as pd
+from opcua import Client, ua
+from opcua.ua.ua_binary import struct_from_binary
+
+from settings import (CONFIG, MAX_WORKERS, DEFAULT_WRITE_BATCH_SIZE, DEFAULT_CHECKPOINT_ROWS, DEFAULT_BACKFILL_BATCH_SIZE,
+                      DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_VALUE_CACHE_SIZE, get_pipeline_settings)
+from worker_metrics import METRICS
+from encoders import encode_dataframe, iter_row_writes, checkpointable_rows
+
+
+OPC_POOL = None # 사이클 간에 유지되는 OPC-UA 세션 풀 (get_opc_pool()로 생성)
+VALUE_CACHE = None # 변경된 값만 전송하는 모드(report_by_exception)에서 NodeId별 마지막 전송 값 캐시
+
+
+class OpcSessionPool:
+    """
+    엔드포인트별로 연결된 OPC-UA Client를 보관하여 워커 사이클 간에 재사용하는 세션 풀.
+    - 엔드포인트당 동시에 사용 가능한 세션 수를 max_sessions로 제한합니다. (대기 중인 세션 포함)
+      endpoint_limits({url: {'max_sessions': n}})로 엔드포인트마다 다르게 지정할 수 있습니다.
+    - 백그라운드 스레드가 keepalive_interval 주기로 유휴 세션에 Read 요청을 보내 연결을 유지하고,
+      응답이 없는 세션은 폐기합니다.
+    - 연결 실패 시 지수 백오프(최대 backoff_max초) 동안은 재연결을 시도하지 않고 즉시 실패 처리하여,
+      서버 재시작 중에 모든 스레드가 연결 시도로 묶이지 않도록 합니다.
+    """
+
+    def __init__(self, max_sessions=MAX_WORKERS, keepalive_interval=30, backoff_max=60, endpoint_limits=None):
+        self.max_sessions = max(1, int(max_sessions))
+        self.endpoint_limits = endpoint_limits or {}
+        self.keepalive_interval = max(1, int(keepalive_interval))
+        self.backoff_max = max(1, int(backoff_max))
+        self._lock = threading.Lock()
+        self._endpoints = {}  # url -> {'sem', 'idle': [(client, last_used)], 'backoff', 'retry_at'}
+        self._stop_event = threading.Event()
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="opc-keepalive", daemon=True)
+        self._keepalive_thread.start()
+
+    def _get_endpoint(self, url):
+        with self._lock:
+            ep = self._endpoints.get(url)
+            if ep is None:
+                max_sessions = max(1, int(self.endpoint_limits.get(url, {}).get('max_sessions', self.max_sessions)))
+                ep = {'sem': threading.BoundedSemaphore(max_sessions), 'idle': [], 'backoff': 0, 'retry_at': 0.0}
+                self._endpoints[url] = ep
+            return ep
+
+    @staticmethod
+    def _ping(client):
+        # 서버 상태 노드를 읽어 세션이 살아있는지 확인
+        client.get_node(ua.NodeId(ua.ObjectIds.Server_ServerStatus_State)).get_value()
+
+    @staticmethod
+    def _disconnect(client):
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+
+    def _connect(self, url, ep):
+        now = time.time()
+        with self._lock:
+            if now < ep['retry_at']:
+                raise ConnectionError(f"OPC-UA 서버({url}) 재연결 대기 중 ({ep['retry_at'] - now:.1f}초 남음)")
+        client = Client(url)
+        try:
+            client.connect()
+        except Exception:
+            with self._lock:
+                ep['backoff'] = min(self.backoff_max, ep['backoff'] * 2 if ep['backoff'] else 1)
+                ep['retry_at'] = time.time() + ep['backoff']
+                print(f"[WARNING] OPC-UA 서버({url}) 연결 실패. {ep['backoff']}초 후 재연결을 시도합니다.")
+            self._disconnect(client)
+            raise
+        with self._lock:
+            if ep['backoff']:
+                print(f"[INFO] OPC-UA 서버({url})에 다시 연결되었습니다.")
+            ep['backoff'] = 0
+            ep['retry_at'] = 0.0
+        return client
+
+    def _checkout(self, url, ep):
+        while True:
+            with self._lock:
+                if not ep['idle']:
+                    break
+                client, last_used = ep['idle'].pop()
+            # 오래 쉬었던 세션은 사용 전에 살아있는지 확인 (서버 재시작 대비)
+            if time.time() - last_used < self.keepalive_interval:
+                return client
+            try:
+                self._ping(client)
+                return client
+            except Exception:
+                self._disconnect(client)
+        return self._connect(url, ep)
+
+    def _checkin(self, ep, client):
+        with self._lock:
+            if not self._stop_event.is_set():
+                ep['idle'].append((client, time.time()))
+                return
+        self._disconnect(client)
+
+    @contextmanager
+    def session(self, url):
+        """
+        연결된 Client를 빌려주는 컨텍스트 매니저.
+        블록 안에서 예외가 발생하면 해당 세션은 손상된 것으로 보고 폐기합니다.
+        """
+        ep = self._get_endpoint(url)
+        ep['sem'].acquire()
+        client = None
+        try:
+            client = self._checkout(url, ep)
+            yield client
+        except Exception:
+            if client is not None:
+                self._disconnect(client)
+                client = None
+            raise
+        finally:
+            if client is not None:
+                self._checkin(ep, client)
+            ep['sem'].release()
+
+    def _keepalive_loop(self):
+        while not self._stop_event.wait(self.keepalive_interval):
+            with self._lock:
+                endpoints = list(self._endpoints.items())
+            for url, ep in endpoints:
+                # 사용 중이지 않은 세션만 점검 (세마포어를 잡은 상태에서만 꺼내므로 세션 수 제한이 유지됨)
+                with self._lock:
+                    idle_count = len(ep['idle'])
+                for _ in range(idle_count):
+                    if not ep['sem'].acquire(blocking=False):
+                        break
+                    try:
+                        with self._lock:
+                            if not ep['idle']:
+                                break
+                            client, last_used = ep['idle'].pop(0)
+                        try:
+                            self._ping(client)
+                            self._checkin(ep, client)
+                        except Exception as e:
+                            print(f"[WARNING] OPC-UA 세션({url}) keepalive 실패, 세션을 폐기합니다: {e}")
+                            self._disconnect(client)
+                    finally:
+                        ep['sem'].release()
+
+    def close(self):
+        """
+        keepalive 스레드를 멈추고 유휴 세션을 모두 종료.
+        """
+        self._stop_event.set()
+        with self._lock:
+            idle_clients = [client for ep in self._endpoints.values() for client, _ in ep['idle']]
+            for ep in self._endpoints.values():
+                ep['idle'] = []
+        for client in idle_clients:
+            self._disconnect(client)
+
+
+_OPC_POOL_LOCK = threading.Lock()
+
+def get_opc_pool():
+    """
+    CONFIG 설정으로 전역 세션 풀을 한 번만 생성하여 반환.
+    """
+    global OPC_POOL
+    with _OPC_POOL_LOCK:
+        if OPC_POOL is None:
+            OPC_POOL = OpcSessionPool(
+                max_sessions=CONFIG.get('opc_max_sessions', get_pipeline_settings()[1]),
+                keepalive_interval=CONFIG.get('opc_keepalive_interval', 30),
+                backoff_max=CONFIG.get('opc_reconnect_backoff_max', 60),
+                endpoint_limits=CONFIG.get('opc_endpoints'),
+            )
+        return OPC_POOL
+
+
+def get_opc_server_url(dataid):
+    """
+    config.json의 opc_routes({'dataid 접두사': 엔드포인트 URL})에서 dataid와 가장 길게 일치하는 접두사의 엔드포인트를 반환.
+    일치하는 접두사가 없으면 opc_server_url을 사용합니다.
+    """
+    routes = CONFIG.get('opc_routes') or {}
+    matches = [prefix for prefix in routes if str(dataid).startswith(prefix)]
+    if matches:
+        return routes[max(matches, key=len)]
+    return CONFIG.get('opc_server_url')
+
+
+def get_write_batch_size():
+    """
+    config.json의 write_batch_size 값을 읽어 유효한 배치 크기를 반환.
+    """
+    try:
+        batch_size = int(CONFIG.get('write_batch_size', DEFAULT_WRITE_BATCH_SIZE))
+    except (ValueError, TypeError):
+        batch_size = DEFAULT_WRITE_BATCH_SIZE
+    return max(1, batch_size)
+
+
+class LastValueCache:
+    """
+    NodeId별로 마지막으로 전송에 성공한 값을 기억하여, 바뀌지 않은 값의 전송을 생략하기 위한 캐시. (report_by_exception)
+    - 최대 max_size개의 NodeId만 기억하며, 넘으면 가장 오래 사용하지 않은 NodeId부터 잊습니다. (잊은 NodeId는 다음 값을 그대로 전송)
+    - 실수(float) 컬럼은 deadband(절대값) 또는 deadband_percent(이전 값 대비 %) 이하의 변화도 바뀌지 않은 것으로 봅니다.
+    - TIME 태그는 항상 전송합니다.
+    """
+
+    def __init__(self, max_size=DEFAULT_VALUE_CACHE_SIZE, deadband=0.0, deadband_percent=0.0):
+        self.max_size = max(1, int(max_size))
+        self.deadband = abs(float(deadband))
+        self.deadband_percent = abs(float(deadband_percent))
+        self._lock = threading.Lock()
+        self._values = OrderedDict()  # nodeid 문자열 -> 마지막으로 전송에 성공한 문자열 값
+        self.stats = {'written': 0, 'skipped': 0}
+
+    def get(self, nodeid):
+        with self._lock:
+            value = self._values.get(nodeid)
+            if value is not None:
+                self._values.move_to_end(nodeid)
+            return value
+
+    def is_unchanged(self, nodeid, value, previous, is_float):
+        """
+        previous(마지막 전송 값)와 비교하여 value를 전송하지 않아도 되는지 판단.
+        """
+        if previous is None or nodeid.endswith('.TIME'):
+            return False
+        if value == previous:
+            return True
+        if not is_float or not (self.deadband or self.deadband_percent):
+            return False
+        try:
+            new_value = float(value)
+            old_value = float(previous)
+        except ValueError:
+            return False
+        diff = abs(new_value - old_value)
+        if self.deadband and diff <= self.deadband:
+            return True
+        return bool(self.deadband_percent) and diff <= abs(old_value) * self.deadband_percent / 100
+
+    def update(self, nodeid, value):
+        with self._lock:
+            self._values[nodeid] = value
+            self._values.move_to_end(nodeid)
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+    def discard(self, nodeid):
+        with self._lock:
+            self._values.pop(nodeid, None)
+
+    def add_stats(self, written, skipped):
+        with self._lock:
+            self.stats['written'] += written
+            self.stats['skipped'] += skipped
+
+
+MISSING_TAG_STATUS_CODES = (ua.StatusCodes.BadNodeIdUnknown, ua.StatusCodes.BadNodeIdInvalid)
+
+
+class TagRegistry:
+    """
+    NodeId 문자열을 ua.NodeId로 한 번만 변환해 두고, 서버에 없는 태그를 기억하는 태그 맵.
+    - (dataid, 시트, 헤더 구성)별로 NodeId 목록을 한 번 컴파일하며, validate가 true이면
+      하나의 배치 Read 요청으로 노드가 실제로 존재하는지 확인합니다.
+    - 존재하지 않는 태그는 missing_ttl초 동안 전송을 생략하고(이후 다시 시도), 태그별로 처음 한 번만 [WARNING]을 출력합니다.
+      생략된 값의 건수는 report()에서 사이클마다 한 번에 출력합니다.
+    """
+
+    def __init__(self, missing_ttl=600):
+        self.missing_ttl = float(missing_ttl)
+        self._lock = threading.Lock()
+        self._nodeids = {}  # nodeid 문자열 -> ua.NodeId
+        self._tag_maps = set()  # 컴파일이 끝난 (dataid, 시트, NodeId 목록)
+        self._missing = {}  # nodeid 문자열 -> 다시 시도할 시각 (잘못된 형식의 NodeId는 inf)
+        self._missing_counts = {}  # nodeid 문자열 -> 마지막 report() 이후 생략된 값 수
+        self._reported = set()
+
+    def _parse(self, nodeid):
+        try:
+            ua_nodeid = ua.NodeId.from_string(nodeid)
+        except Exception as node_e:
+            print(f"[WARNING] NodeId {nodeid} 처리 중 오류: {node_e}")
+            self._missing[nodeid] = float('inf')
+            self._reported.add(nodeid)
+            return None
+        self._nodeids[nodeid] = ua_nodeid
+        return ua_nodeid
+
+    def compile(self, client, dataid, sheet_name, nodeids, validate=False, batch_size=DEFAULT_WRITE_BATCH_SIZE):
+        """
+        시트의 NodeId 목록을 미리 변환하고, validate가 true이면 서버에 존재하는지 확인. (헤더 구성별로 한 번만 수행)
+        """
+        key = (dataid, sheet_name, tuple(nodeids))
+        with self._lock:
+            if key in self._tag_maps:
+                return
+            parsed = [(nodeid, self._nodeids.get(nodeid) or self._parse(nodeid)) for nodeid in nodeids]
+            parsed = [(nodeid, ua_nodeid) for nodeid, ua_nodeid in parsed if ua_nodeid is not None]
+
+        if validate and parsed:
+            for start in range(0, len(parsed), batch_size):
+                chunk = parsed[start:start + batch_size]
+                params = ua.ReadParameters()
+                for _, ua_nodeid in chunk:
+                    rv = ua.ReadValueId()
+                    rv.NodeId = ua_nodeid
+                    rv.AttributeId = ua.AttributeIds.NodeClass
+                    params.NodesToRead.append(rv)
+                try:
+                    results = client.uaclient.read(params)
+                except ua.UaStatusCodeError as read_e:
+                    print(f"[WARNING] 태그 존재 여부 확인 중 오류: {read_e}")
+                    break
+                for (nodeid, _), result in zip(chunk, results):
+                    if result.StatusCode.value in MISSING_TAG_STATUS_CODES:
+                        self.mark_missing(nodeid, result.StatusCode.name)
+
+        with self._lock:
+            self._tag_maps.add(key)
+
+    def resolve(self, nodeid):
+        """
+        전송할 ua.NodeId를 반환. 존재하지 않는 것으로 확인된 태그이면 None을 반환하고 생략 건수를 기록.
+        """
+        with self._lock:
+            retry_at = self._missing.get(nodeid)
+            if retry_at is not None:
+                if time.time() < retry_at:
+                    self._missing_counts[nodeid] = self._missing_counts.get(nodeid, 0) + 1
+                    return None
+                del self._missing[nodeid]
+            ua_nodeid = self._nodeids.get(nodeid)
+            if ua_nodeid is None:
+                ua_nodeid = self._parse(nodeid)
+                if ua_nodeid is None:
+                    self._missing_counts[nodeid] = self._missing_counts.get(nodeid, 0) + 1
+            return ua_nodeid
+
+    def mark_missing(self, nodeid, reason):
+        with self._lock:
+            self._missing[nodeid] = time.time() + self.missing_ttl
+            if nodeid in self._reported:
+                return
+            self._reported.add(nodeid)
+        print(f"[WARNING] 태그 {nodeid}가 서버에 없습니다({reason}). {self.missing_ttl:.0f}초 동안 이 태그의 전송을 생략합니다.")
+
+    def report(self):
+        """
+        마지막 report() 이후 존재하지 않는 태그 때문에 생략된 값의 건수를 한 번에 출력.
+        """
+        with self._lock:
+            counts = self._missing_counts
+            self._missing_counts = {}
+        if counts:
+            examples = ', '.join(f"{nodeid}({count})" for nodeid, count in sorted(counts.items(), key=lambda x: -x[1])[:5])
+            print(f"[WARNING] 존재하지 않는 태그 {len(counts)}개에 대한 값 {sum(counts.values())}개를 전송하지 않았습니다. 예시: {examples}")
+
+
+TAG_REGISTRY = None
+_TAG_REGISTRY_LOCK = threading.Lock()
+
+def get_tag_registry():
+    """
+    config.json의 missing_tag_ttl(기본 600초)로 전역 태그 맵을 한 번만 생성하여 반환.
+    """
+    global TAG_REGISTRY
+    with _TAG_REGISTRY_LOCK:
+        if TAG_REGISTRY is None:
+            TAG_REGISTRY = TagRegistry(missing_ttl=CONFIG.get('missing_tag_ttl', 600))
+        return TAG_REGISTRY
+
+
+_VALUE_CACHE_LOCK = threading.Lock()
+
+def get_value_cache():
+    """
+    config.json의 report_by_exception이 true이면 마지막 전송 값 캐시를 한 번만 생성하여 반환. 사용하지 않으면 None.
+    """
+    global VALUE_CACHE
+    if not CONFIG.get('report_by_exception', False):
+        return None
+    with _VALUE_CACHE_LOCK:
+        if VALUE_CACHE is None:
+            VALUE_CACHE = LastValueCache(
+                max_size=CONFIG.get('value_cache_size', DEFAULT_VALUE_CACHE_SIZE),
+                deadband=CONFIG.get('deadband', 0),
+                deadband_percent=CONFIG.get('deadband_percent', 0),
+            )
+        return VALUE_CACHE
+
+
+class WriteBatcher:
+    """
+    행 단위 (NodeId 문자열, 문자열 값) 목록을 Write 요청 단위로 묶고, 노드별 응답 결과를 집계.
+    동기 Client(write_values_batched)와 비동기 엔진(AsyncOpcEngine.write_values)이 같은 규칙을 사용하도록 분리한 부분입니다.
+    """
+
+    def __init__(self, batch_size, value_cache=None, float_nodeids=()):
+        self.batch_size = batch_size
+        self.value_cache = value_cache
+        self.float_nodeids = float_nodeids
+        self.tag_registry = get_tag_registry()  # NodeId 문자열 파싱과 존재하지 않는 태그 확인은 태그별로 한 번만 수행
+        self.last_values = {}  # 전송하기로 한 NodeId별 마지막 값 (아직 응답을 받기 전인 값 포함)
+        self.ok_count = 0
+        self.fail_count = 0
+        self.skipped_count = 0
+
+    def batches(self, row_writes, row_timestamps=None):
+        """
+        요청 하나에 담을 [(NodeId 문자열, 문자열 값, ua.NodeId, SourceTimestamp)] 목록을 차례로 반환.
+        """
+        pending = []
+        for row_index, writes in enumerate(row_writes):
+            source_timestamp = row_timestamps[row_index] if row_timestamps is not None else None
+            resolved = []
+            for nodeid, value in writes:
+                ua_nodeid = self.tag_registry.resolve(nodeid)
+                if ua_nodeid is None:
+                    continue  # 서버에 없는 태그 (건수는 TagRegistry에서 집계)
+                if self.value_cache is not None:
+                    previous = self.last_values[nodeid] if nodeid in self.last_values else self.value_cache.get(nodeid)
+                    if self.value_cache.is_unchanged(nodeid, value, previous, nodeid in self.float_nodeids):
+                        self.skipped_count += 1
+                        continue
+                    self.last_values[nodeid] = value
+                resolved.append((nodeid, value, ua_nodeid, source_timestamp))
+            if pending and len(pending) + len(resolved) > self.batch_size:
+                yield pending
+                pending = []
+            for item in resolved:
+                pending.append(item)
+                if len(pending) >= self.batch_size:
+                    yield pending
+                    pending = []
+        if pending:
+            yield pending
+
+    def _forget(self, nodeid):
+        if self.value_cache is not None:
+            # 실패한 값을 기준으로 다음 값을 생략하지 않도록 기억한 값을 지움
+            self.value_cache.discard(nodeid)
+            self.last_values.pop(nodeid, None)
+
+    def handle_results(self, batch, results):
+        for (nodeid, value, _, _), status in zip(batch, results):
+            if status.is_good():
+                self.ok_count += 1
+                if self.value_cache is not None:
+                    self.value_cache.update(nodeid, value)
+            else:
+                self.fail_count += 1
+                if status.value in MISSING_TAG_STATUS_CODES:
+                    # 서버에 없는 태그는 행마다 기록하지 않고, 일정 시간 전송을 생략한 뒤 한 번에 집계
+                    self.tag_registry.mark_missing(nodeid, status.name)
+                else:
+                    print(f"[WARNING] NodeId {nodeid} 처리 중 오류: {status}")
+                self._forget(nodeid)
+
+    def handle_error(self, batch, error):
+        print(f"[WARNING] Write 요청({len(batch)}개 태그) 처리 중 오류: {error}")
+        self.fail_count += len(batch)
+        for nodeid, _, _, _ in batch:
+            self._forget(nodeid)
+
+    def finish(self):
+        """
+        성공/실패 건수 튜플 (ok_count, fail_count)을 반환.
+        """
+        if self.value_cache is not None:
+            self.value_cache.add_stats(self.ok_count + self.fail_count, self.skipped_count)
+        METRICS.inc('worker_values_written_total', self.ok_count, result='ok')
+        METRICS.inc('worker_values_written_total', self.fail_count, result='fail')
+        if self.skipped_count:
+            METRICS.inc('worker_values_skipped_total', self.skipped_count)
+        return self.ok_count, self.fail_count
+
+
+def write_values_batched(client, row_writes, batch_size, value_cache=None, float_nodeids=(), row_timestamps=None):
+    """
+    여러 행의 (NodeId 문자열, 문자열 값) 목록을 WriteValue로 묶어 Write 요청 단위로 전송.
+    - 행 내부의 순서(TIME 마지막)는 그대로 유지되며, 한 행이 두 요청으로 나뉘지 않도록
+      배치가 batch_size를 넘기 전에 먼저 전송합니다. (단, 한 행이 batch_size보다 크면 나누어 전송)
+    - 응답의 노드별 StatusCode를 확인하여 실패한 태그는 기존과 동일하게 [WARNING]으로 기록합니다.
+    - value_cache(LastValueCache)가 주어지면 마지막 전송 값과 같은(또는 deadband 이내인) 값은 전송하지 않습니다.
+      float_nodeids는 deadband를 적용할 실수 컬럼의 NodeId 집합입니다.
+    - row_timestamps(행별 UTC datetime 목록)가 주어지면 각 값의 SourceTimestamp로 함께 전송합니다. (백필 모드)
+    성공/실패 건수 튜플 (ok_count, fail_count)을 반환.
+    """
+    batcher = WriteBatcher(batch_size, value_cache, float_nodeids)
+    for batch in batcher.batches(row_writes, row_timestamps):
+        params = ua.WriteParameters()
+        for _, value, ua_nodeid, source_timestamp in batch:
+            wv = ua.WriteValue()
+            wv.NodeId = ua_nodeid
+            wv.AttributeId = ua.AttributeIds.Value
+            wv.Value = ua.DataValue(ua.Variant(value, ua.VariantType.String))
+            if source_timestamp is not None:
+                wv.Value.SourceTimestamp = source_timestamp
+            params.NodesToWrite.append(wv)
+        started = time.perf_counter()
+        try:
+            results = client.uaclient.write(params)
+        except ua.UaStatusCodeError as batch_e:
+            # 서비스 단위 오류는 기록 후 계속 진행. 연결 오류 등은 상위로 전달되어 세션이 폐기됩니다.
+            batcher.handle_error(batch, batch_e)
+            continue
+        finally:
+            METRICS.observe('worker_opc_write_seconds', time.perf_counter() - started)
+        batcher.handle_results(batch, results)
+    return batcher.finish()
+
+
+def send_dataframe(client, dataid, sheet_name, df_to_send, batch_size, checkpoint=None):
+    """
+    시트의 새로운 행들을 OPC-UA 태그 값으로 변환하여 배치 전송.
+    checkpoint가 주어지면 checkpoint_rows 행 또는 checkpoint_interval 초마다
+    지금까지 전송 완료된 행의 마지막 TIME으로 checkpoint(datetime)를 호출합니다.
+    """
+    encoded_columns = encode_dataframe(dataid, sheet_name, df_to_send)
+    return send_encoded(client, encoded_columns, df_to_send['TIME'].to_numpy(), batch_size, checkpoint)
+
+
+def send_encoded(client, encoded_columns, time_values, batch_size, checkpoint=None, value_cache=None, float_nodeids=(),
+                 rate_limiter=None):
+    """
+    encode_dataframe으로 인코딩된 컬럼을 배치 전송. (send_dataframe, write_values_batched 참고)
+    rate_limiter(RateLimiter)가 주어지면 행 묶음을 보내기 전마다 전송량만큼 대기합니다.
+    """
+    row_count = len(time_values)
+    if not np.issubdtype(time_values.dtype, np.datetime64):
+        checkpoint = None
+    if checkpoint is None and rate_limiter is None:
+        return write_values_batched(client, iter_row_writes(encoded_columns, 0, row_count), batch_size,
+                                    value_cache, float_nodeids)
+
+    checkpoint_rows = max(1, int(CONFIG.get('checkpoint_rows', DEFAULT_CHECKPOINT_ROWS)))
+    checkpoint_interval = float(CONFIG.get('checkpoint_interval', DEFAULT_CHECKPOINT_INTERVAL))
+    if checkpoint is not None:
+        safe, prefix_max = checkpointable_rows(time_values)
+
+    # 한 번의 Write 요청 크기에 맞춰 행을 나누어 전송하고, 각 묶음이 끝날 때마다 체크포인트 조건을 확인
+    chunk_rows = max(1, min(checkpoint_rows, batch_size // max(1, len(encoded_columns))))
+    ok_count = fail_count = 0
+    rows_since_checkpoint = 0
+    last_checkpoint_at = time.time()
+    for start in range(0, row_count, chunk_rows):
+        stop = min(start + chunk_rows, row_count)
+        if rate_limiter is not None:
+            rate_limiter.acquire((stop - start) * len(encoded_columns))
+        ok, fail = write_values_batched(client, iter_row_writes(encoded_columns, start, stop), batch_size,
+                                        value_cache, float_nodeids)
+        ok_count += ok
+        fail_count += fail
+        rows_since_checkpoint += stop - start
+
+        if checkpoint is None:
+            continue
+        due = rows_since_checkpoint >= checkpoint_rows or time.time() - last_checkpoint_at >= checkpoint_interval
+        if due and stop < row_count and safe[stop - 1]:
+            checkpoint(pd.Timestamp(prefix_max[stop - 1]).to_pydatetime())
+            rows_since_checkpoint = 0
+            last_checkpoint_at = time.time()
+
+    return ok_count, fail_count
+
+
+def to_utc_datetimes(time_values):
+    """
+    TIME 컬럼(현지 시간, datetime64)을 OPC-UA 타임스탬프용 UTC datetime 리스트로 변환.
+    시간대는 config.json의 time_zone(예: 'Asia/Seoul'), 없으면 워커가 실행 중인 시스템의 시간대를 사용합니다.
+    서머타임 종료로 두 번 나타나는 시각은 행 순서로 앞/뒤를 추론하고, 추론할 수 없으면 표준시(뒤의 시각)로 정하며,
+    서머타임 시작으로 건너뛴 시각은 뒤로 옮기므로 값이 있는 TIME은 항상 타임스탬프를 가집니다. (TIME이 없는 행만 None)
+    """
+    tz = CONFIG.get('time_zone') or datetime.now().astimezone().tzinfo
+    local_index = pd.DatetimeIndex(time_values)
+    try:
+        local_times = local_index.tz_localize(tz, ambiguous='infer', nonexistent='shift_forward')
+    except Exception as e:  # pandas 버전에 따라 ValueError 또는 pytz.AmbiguousTimeError
+        print(f"[WARNING] 서머타임 종료 구간의 시각을 추론할 수 없어 표준시로 변환합니다: {e}")
+        local_times = local_index.tz_localize(tz, ambiguous=np.zeros(len(local_index), dtype=bool), nonexistent='shift_forward')
+    return [None if pd.isna(t) else t for t in local_times.tz_convert('UTC').tz_localize(None).to_pydatetime()]
+
+
+def get_backfill_mask(time_values):
+    """
+    config.json의 backfill_age(초)보다 오래된 행의 마스크를 반환. 백필 모드를 사용하지 않으면 None.
+    """
+    backfill_age = CONFIG.get('backfill_age')
+    if backfill_age is None or not np.issubdtype(time_values.dtype, np.datetime64):
+        return None
+    threshold = np.datetime64(datetime.now() - pd.Timedelta(seconds=float(backfill_age)))
+    return time_values < threshold
+
+
+HISTORY_UPDATE_UNSUPPORTED_CODES = (ua.StatusCodes.BadServiceUnsupported, ua.StatusCodes.BadHistoryOperationUnsupported)
+
+
+def send_history_update(client, request):
+    """
+    HistoryUpdate 요청을 보내고 응답을 반환. python-opcua 클라이언트에는 HistoryUpdate 함수가 없어, 0.98 버전의
+    비공개 속성인 client.uaclient._uasocket으로 직접 전송합니다. 라이브러리 변경으로 이 속성이 없으면 None을 반환하며,
+    호출 측은 SourceTimestamp Write로 대신 전송합니다.
+    """
+    uasocket = getattr(getattr(client, 'uaclient', None), '_uasocket', None)
+    if uasocket is None or not hasattr(uasocket, 'send_request'):
+        print("[WARNING] 설치된 python-opcua에서 HistoryUpdate 요청을 보낼 수 없습니다. (client.uaclient._uasocket 없음)")
+        return None
+    return struct_from_binary(ua.HistoryUpdateResponse, uasocket.send_request(request))
+
+
+def history_update_encoded(client, encoded_columns, utc_times, batch_size):
+    """
+    인코딩된 컬럼 값을 HistoryUpdate(UpdateDataDetails) 요청으로 서버 이력에 SourceTimestamp와 함께 직접 기록.
+    값은 태그별로 묶어 요청당 최대 batch_size개씩 전송합니다.
+    서버가 HistoryUpdate를 지원하지 않으면 None, 그렇지 않으면 (ok_count, fail_count)를 반환.
+    """
+    tag_registry = get_tag_registry()
+    details = []  # (nodeid 문자열, UpdateDataDetails)
+    for nodeid, values in encoded_columns:
+        ua_nodeid = tag_registry.resolve(nodeid)
+        if ua_nodeid is None:
+            continue
+        data_values = []
+        for value, source_timestamp in zip(values, utc_times):
+            if value is None or source_timestamp is None:
+                continue
+            dv = ua.DataValue(ua.Variant(value, ua.VariantType.String))
+            dv.SourceTimestamp = source_timestamp
+            data_values.append(dv)
+        for start in range(0, len(data_values), batch_size):
+            # python-opcua의 UpdateDataDetails()는 기본값(PerformUpdateType(0)) 오류로 생성자를 사용할 수 없음
+            detail = ua.UpdateDataDetails.__new__(ua.UpdateDataDetails)
+            detail.NodeId = ua_nodeid
+            detail.PerformInsertReplace = ua.PerformUpdateType.Update
+            detail.UpdateValues = data_values[start:start + batch_size]
+            details.append((nodeid, detail))
+
+    ok_count = 0
+    fail_count = 0
+    requests_sent = 0
+    while details:
+        # 요청 하나에 담을 UpdateDataDetails를 값 개수 기준으로 선택
+        chunk = []
+        value_count = 0
+        while details and (not chunk or value_count + len(details[0][1].UpdateValues) <= batch_size):
+            chunk.append(details.pop(0))
+            value_count += len(chunk[-1][1].UpdateValues)
+
+        request = ua.HistoryUpdateRequest()
+        request.Parameters.HistoryUpdateDetails = [detail for _, detail in chunk]
+        try:
+            response = send_history_update(client, request)
+            if response is None:
+                if requests_sent == 0:
+                    return None
+                raise ua.UaStatusCodeError(ua.StatusCodes.BadServiceUnsupported)
+            response.ResponseHeader.ServiceResult.check()
+        except ua.UaStatusCodeError as e:
+            if requests_sent == 0 and e.code in HISTORY_UPDATE_UNSUPPORTED_CODES:
+                return None
+            raise
+        requests_sent += 1
+
+        if requests_sent == 1 and all(r.StatusCode.value in HISTORY_UPDATE_UNSUPPORTED_CODES for r in response.Results):
+            return None
+        for (nodeid, detail), result in zip(chunk, response.Results):
+            if not result.StatusCode.is_good():
+                if result.StatusCode.value in MISSING_TAG_STATUS_CODES:
+                    tag_registry.mark_missing(nodeid, result.StatusCode.name)
+                else:
+                    print(f"[WARNING] NodeId {nodeid} 이력 기록 중 오류: {result.StatusCode}")
+                fail_count += len(detail.UpdateValues)
+                continue
+            operation_results = result.OperationResults or [ua.StatusCode()] * len(detail.UpdateValues)
+            for status in operation_results:
+                if status.is_good():
+                    ok_count += 1
+                else:
+                    fail_count += 1
+    METRICS.inc('worker_values_written_total', ok_count, result='ok')
+    METRICS.inc('worker_values_written_total', fail_count, result='fail')
+    return ok_count, fail_count
+
+
+HISTORY_UPDATE_UNSUPPORTED = set() # HistoryUpdate를 지원하지 않는 것으로 확인된 OPC-UA 서버 URL
+
+
+def send_backfill(client, opc_server_url, encoded_columns, time_values, checkpoint=None, float_nodeids=(), rate_limiter=None):
+    """
+    backfill_age보다 오래된 행을 큰 배치로 전송. (행마다 TIME을 마지막에 쓰는 실시간 경로 대신 SourceTimestamp 사용)
+    backfill_method가 'history_update'이고 서버가 지원하면 HistoryUpdate로 이력에 직접 기록하고,
+    그렇지 않으면 SourceTimestamp를 지정한 Write 요청으로 전송합니다.
+    backfill_batch_size 행 단위로 나누어 보내며, 각 묶음이 끝날 때마다 체크포인트를 기록합니다.
+    이력 값은 같은 값이 반복되어도 모두 기록해야 하므로 변경된 값만 전송(LastValueCache)을 적용하지 않습니다.
+    """
+    batch_size = max(1, int(CONFIG.get('backfill_batch_size', DEFAULT_BACKFILL_BATCH_SIZE)))
+    use_history = CONFIG.get('backfill_method', 'write') == 'history_update' and opc_server_url not in HISTORY_UPDATE_UNSUPPORTED
+    utc_times = to_utc_datetimes(time_values)
+    safe, prefix_max = checkpointable_rows(time_values)
+
+    row_count = len(time_values)
+    chunk_rows = max(1, batch_size // max(1, len(encoded_columns)))
+    ok_count = fail_count = 0
+    for start in range(0, row_count, chunk_rows):
+        stop = min(start + chunk_rows, row_count)
+        chunk_columns = [(nodeid, values[start:stop]) for nodeid, values in encoded_columns]
+        if rate_limiter is not None:
+            rate_limiter.acquire((stop - start) * len(encoded_columns))
+        result = None
+        if use_history:
+            result = history_update_encoded(client, chunk_columns, utc_times[start:stop], batch_size)
+            if result is None:
+                print(f"[WARNING] OPC-UA 서버({opc_server_url})가 HistoryUpdate를 지원하지 않아 SourceTimestamp Write로 백필합니다.")
+                HISTORY_UPDATE_UNSUPPORTED.add(opc_server_url)
+                use_history = False
+        if result is None:
+            result = write_values_batched(client, iter_row_writes(chunk_columns, 0, stop - start), batch_size,
+                                          float_nodeids=float_nodeids, row_timestamps=utc_times[start:stop])
+        ok_count += result[0]
+        fail_count += result[1]
+
+        if checkpoint is not None and stop < row_count and safe[stop - 1]:
+            checkpoint(pd.Timestamp(prefix_max[stop - 1]).to_pydatetime())
+
+    return ok_count, fail_count
+
+
+def forget_cached_values(value_cache, encoded_columns):
+    """
+    백필로 쓴 값이 서버의 현재 값이 되었을 수 있으므로, 이어지는 실시간 행은 캐시와 비교하지 않고 다시 전송하도록 시트의 마지막 전송 값을 지움.
+    """
+    if value_cache is not None:
+        for nodeid, _ in encoded_columns:
+            value_cache.discard(nodeid)
+
+
+def send_sheet(client, opc_server_url, sheet, batch_size, checkpoint=None, value_cache=None, rate_limiter=None):
+    """
+    parse_file_task가 만든 시트 하나를 전송. backfill_age보다 오래된 행은 send_backfill로 먼저 보내고,
+    나머지 행은 기존과 같이 행마다 TIME을 마지막에 쓰는 방식(send_encoded)으로 전송합니다.
+    (오래된 행은 모두 나머지 행보다 TIME이 이르므로 체크포인트 순서가 유지됩니다.)
+    변경된 값만 전송(value_cache)은 나머지 행에만 적용합니다.
+    """
+    encoded_columns = sheet['columns']
+    time_values = sheet['times']
+    float_nodeids = sheet['float_nodeids']
+    ok_count = fail_count = 0
+
+    backfill_mask = get_backfill_mask(time_values)
+    if backfill_mask is not None and backfill_mask.any():
+        print(f"[INFO] 시트 '{sheet['sheet_name']}'의 오래된 행 {int(backfill_mask.sum())}개를 백필 모드로 전송합니다.")
+        ok_count, fail_count = send_backfill(client, opc_server_url,
+                                             [(nodeid, values[backfill_mask]) for nodeid, values in encoded_columns],
+                                             time_values[backfill_mask], checkpoint, float_nodeids, rate_limiter)
+        forget_cached_values(value_cache, encoded_columns)
+        live_mask = ~backfill_mask
+        encoded_columns = [(nodeid, values[live_mask]) for nodeid, values in encoded_columns]
+        time_values = time_values[live_mask]
+
+    if len(time_values):
+        ok, fail = send_encoded(client, encoded_columns, time_values, batch_size, checkpoint, value_cache, float_nodeids,
+                                rate_limiter)
+        ok_count += ok
+        fail_count += fail
+    return ok_count, fail_count
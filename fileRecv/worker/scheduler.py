@@ -0,0 +1,115 @@
+#-*- coding: utf-8 -*-
+# scheduler.py
+# 소스(장비)별 공정 스케줄링과 전송 속도 제한.
+
+import os
+import time
+import threading
+from collections import deque
+from os.path import basename
+
+from settings import CONFIG
+
+
+def get_source(filepath):
+    """
+    save_path/deviceid/dataid/파일명 경로에서 (deviceid, dataid)를 반환.
+    """
+    dataid_path = os.path.dirname(filepath)
+    return basename(os.path.dirname(dataid_path)), basename(dataid_path)
+
+
+def lookup_source_setting(settings, source, default=None):
+    """
+    'deviceid/dataid' 또는 'dataid' 키로 지정된 설정 값을 찾음. ('deviceid/dataid'가 우선)
+    """
+    if not settings:
+        return default
+    deviceid, dataid = source
+    return settings.get(f"{deviceid}/{dataid}", settings.get(dataid, default))
+
+
+class FairScheduler:
+    """
+    처리할 파일을 (deviceid, dataid)별 대기열로 나누고, 가중치 기반 라운드 로빈(smooth weighted round-robin)으로
+    다음 파일을 고르는 스케줄러. 한 장치의 대량 파일이 밀려 있어도 다른 장치의 실시간 파일이 함께 처리됩니다.
+    - 대기열 안에서는 수정 시간이 오래된 파일부터 처리합니다.
+    - weights({'dataid' 또는 'deviceid/dataid': 가중치}, 기본 1)가 클수록 더 자주 선택됩니다.
+    - max_inflight가 주어지면 한 대기열에서 동시에 처리 중인 파일 수를 그 이하로 제한합니다.
+    """
+
+    def __init__(self, tasks, weights=None, max_inflight=None):
+        self.queues = {}  # source -> deque(task)
+        for task in sorted(tasks, key=lambda t: t['mtime_ns']):
+            self.queues.setdefault(task['source'], deque()).append(task)
+        self.weights = {source: max(0.001, float(lookup_source_setting(weights, source, 1))) for source in self.queues}
+        self.current = {source: 0.0 for source in self.queues}
+        self.in_flight = {source: 0 for source in self.queues}
+        self.max_inflight = int(max_inflight) if max_inflight else None
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def next_task(self):
+        """
+        다음에 처리할 파일을 반환. 지금 선택할 수 있는 파일이 없으면 None.
+        """
+        eligible = [source for source, queue in self.queues.items()
+                    if queue and (self.max_inflight is None or self.in_flight[source] < self.max_inflight)]
+        if not eligible:
+            return None
+        total_weight = sum(self.weights[source] for source in eligible)
+        for source in eligible:
+            self.current[source] += self.weights[source]
+        selected = max(eligible, key=lambda source: self.current[source])
+        self.current[selected] -= total_weight
+        self.in_flight[selected] += 1
+        return self.queues[selected].popleft()
+
+    def task_done(self, task):
+        self.in_flight[task['source']] -= 1
+
+
+class RateLimiter:
+    """
+    초당 전송 값 수를 제한하는 토큰 버킷. 여러 전송 스레드가 같은 (deviceid, dataid)의 한도를 공유합니다.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._lock = threading.Lock()
+        self._tokens = self.rate
+        self._updated = time.time()
+
+    def reserve(self, amount):
+        """
+        amount만큼 전송량을 예약하고, 전송 전에 기다려야 할 시간(초)을 반환. (비동기 엔진은 asyncio.sleep으로 대기)
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def acquire(self, amount):
+        wait_seconds = self.reserve(amount)
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+
+
+RATE_LIMITERS = {} # (deviceid, dataid) -> RateLimiter
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+def get_rate_limiter(source):
+    """
+    config.json의 rate_limits에 전송 한도(초당 값 수)가 지정된 (deviceid, dataid)이면 RateLimiter를, 아니면 None을 반환.
+    """
+    rate = lookup_source_setting(CONFIG.get('rate_limits'), source)
+    if not rate:
+        return None
+    with _RATE_LIMITERS_LOCK:
+        limiter = RATE_LIMITERS.get(source)
+        if limiter is None or limiter.rate != float(rate):
+            limiter = RATE_LIMITERS[source] = RateLimiter(rate)
+        return limiter
@@ -0,0 +1,52 @@
+#-*- coding: utf-8 -*-
+# settings.py
+# 워커 전역 설정(config.json 내용)과 기본값, 그리고 설정 값을 읽는 공통 함수 모음.
+
+import os
+import json
+
+
+CONFIG = {}
+STATE_DB_FILE = 'worker_state.db' # 처리 상태(마지막 행 시간, 파일 지문)를 저장할 SQLite 파일 (config.json의 state_db_path로 변경 가능)
+LAST_ROW_INFO_FILE = 'last_row_info.json' # (이전 버전) 처리된 마지막 행 정보 파일. 최초 실행 시 STATE_DB_FILE로 이관
+FILE_INDEX_FILE = 'file_index.json' # (이전 버전) 파일 지문 파일. 최초 실행 시 STATE_DB_FILE로 이관
+MAX_WORKERS = 5 # 동시에 전송할 최대 파일 수 (config.json의 write_workers로 변경 가능)
+DEFAULT_ASYNC_WRITE_WORKERS = 50 # 비동기 엔진에서 동시에 전송할 최대 파일 수 기본값
+DEFAULT_WRITE_BATCH_SIZE = 1000 # 한 번의 Write 요청에 담을 최대 값 개수 (config.json의 write_batch_size로 변경 가능)
+DEFAULT_CHECKPOINT_ROWS = 1000 # 시트 처리 중 진행 상황을 저장할 행 간격 (config.json의 checkpoint_rows)
+DEFAULT_BACKFILL_BATCH_SIZE = 10000 # 백필 모드에서 한 번의 요청에 담을 최대 값 개수 (config.json의 backfill_batch_size)
+DEFAULT_CHECKPOINT_INTERVAL = 5 # 시트 처리 중 진행 상황을 저장할 시간 간격(초) (config.json의 checkpoint_interval)
+DEFAULT_VALUE_CACHE_SIZE = 100000 # 마지막 전송 값을 기억할 최대 NodeId 수 (config.json의 value_cache_size)
+DEFAULT_FRAME_CACHE_MAX_MB = 1024 # 파싱 결과 캐시의 최대 크기(MB) (config.json의 frame_cache_max_mb)
+
+
+def load_json_file(path, default):
+    """
+    JSON 파일을 읽어 반환. 파일이 없거나 손상된 경우 default를 반환.
+    """
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                print(f"[WARNING] {path} 파일이 손상되었습니다. 새로 시작합니다.")
+    return default
+
+
+def get_pipeline_settings():
+    """
+    config.json에서 (파싱 프로세스 수, 동시 전송 파일 수, 동시에 처리 중인 최대 파일 수)를 읽어 반환.
+    parse_workers가 0이면 파싱도 전송 스레드에서 수행합니다.
+    동시 전송 파일 수(write_workers)는 스레드 엔진이면 전송 스레드 수, 비동기 엔진이면 이벤트 루프에서 동시에 전송할 파일 수입니다.
+    """
+    def read_int(key, default, minimum):
+        try:
+            return max(minimum, int(CONFIG.get(key, default)))
+        except (ValueError, TypeError):
+            return default
+
+    parse_workers = read_int('parse_workers', os.cpu_count() or 1, 0)
+    default_write_workers = DEFAULT_ASYNC_WRITE_WORKERS if CONFIG.get('opc_engine', 'thread') == 'async' else MAX_WORKERS
+    write_workers = read_int('write_workers', default_write_workers, 1)
+    queue_size = read_int('pipeline_queue_size', parse_workers + write_workers * 2, 1)
+    return parse_workers, write_workers, queue_size
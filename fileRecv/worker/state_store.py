@@ -0,0 +1,164 @@
+#-*- coding: utf-8 -*-
+# state_store.py
+# 처리 상태(마지막 행 시간, 파일 지문, 이어 읽기 위치)를 저장하는 SQLite 저장소.
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from settings import CONFIG, STATE_DB_FILE, LAST_ROW_INFO_FILE, FILE_INDEX_FILE, load_json_file
+
+
+def commit_loader_state(state, parsed):
+    """
+    CSV/DBF 이어 읽기 위치를 기록. 모든 시트 전송에 성공한 뒤에만 호출하여, 실패 시 같은 위치부터 다시 읽도록 함
+    """
+    filepath = parsed['filepath']
+    resume = parsed['resume']
+    if resume and resume != state.get_loader_state(filepath):
+        state.commit(loader_states={filepath: resume})
+
+
+class StateStore:
+    """
+    처리 상태를 SQLite(WAL 모드)에 저장하는 저장소.
+    - last_row: 파일|시트 키별 마지막으로 전송한 행의 시간
+    - file_index: 처리 완료된 파일의 지문
+    - loader_state: CSV/DBF 파일별 이어 읽기 위치
+    매 사이클 전체 JSON을 다시 쓰지 않고 변경된 키만 upsert하며, 한 번의 트랜잭션으로 커밋되므로
+    기록 도중 프로세스가 종료되어도 이전 상태가 손상되지 않습니다.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS last_row (key TEXT PRIMARY KEY, last_time TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS file_index (path TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS loader_state (path TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._migrate_json()
+
+    def _migrate_json(self):
+        """
+        이전 버전의 last_row_info.json / file_index.json 내용을 한 번만 이관하고, 원본은 .migrated로 이름을 바꿈.
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return
+            last_row_info = load_json_file(LAST_ROW_INFO_FILE, {})
+            file_index = load_json_file(FILE_INDEX_FILE, {})
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO last_row (key, last_time) VALUES (?, ?)", list(last_row_info.items()))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO file_index (path, entry) VALUES (?, ?)",
+                    [(path, json.dumps(entry)) for path, entry in file_index.items()])
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                                   (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+        for legacy_file in (LAST_ROW_INFO_FILE, FILE_INDEX_FILE):
+            if os.path.exists(legacy_file):
+                os.replace(legacy_file, legacy_file + '.migrated')
+        if last_row_info or file_index:
+            print(f"[INFO] 이전 처리 정보를 {self.path}로 이관했습니다. (파일/시트 {len(last_row_info)}개, 파일 지문 {len(file_index)}개)")
+
+    def get_last_time(self, file_sheet_key):
+        with self._lock:
+            row = self._conn.execute("SELECT last_time FROM last_row WHERE key = ?", (file_sheet_key,)).fetchone()
+        return row[0] if row else None
+
+    def get_last_times(self, filepath):
+        """
+        한 파일의 모든 시트에 대한 {파일|시트 키: 마지막 처리 시간}을 반환.
+        """
+        # '파일|' 로 시작하는 키를 기본 키 범위 검색으로 조회 ('}'는 '|' 다음 문자)
+        with self._lock:
+            rows = self._conn.execute("SELECT key, last_time FROM last_row WHERE key >= ? AND key < ?",
+                                      (filepath + '|', filepath + '}')).fetchall()
+        return dict(rows)
+
+    def get_file_entry(self, filepath):
+        with self._lock:
+            row = self._conn.execute("SELECT entry FROM file_index WHERE path = ?", (filepath,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_loader_state(self, filepath):
+        with self._lock:
+            row = self._conn.execute("SELECT entry FROM loader_state WHERE path = ?", (filepath,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def file_paths(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT path FROM file_index")]
+
+    def commit(self, last_times=None, file_entries=None, removed_paths=None, loader_states=None):
+        """
+        변경된 마지막 처리 시간, 파일 지문, 이어 읽기 위치, 삭제된 파일을 하나의 트랜잭션으로 기록.
+        """
+        with self._lock:
+            with self._conn:
+                if last_times:
+                    self._conn.executemany(
+                        "INSERT INTO last_row (key, last_time) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET last_time = excluded.last_time",
+                        list(last_times.items()))
+                if file_entries:
+                    self._conn.executemany(
+                        "INSERT INTO file_index (path, entry) VALUES (?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET entry = excluded.entry",
+                        [(path, json.dumps(entry)) for path, entry in file_entries.items()])
+                if loader_states:
+                    self._conn.executemany(
+                        "INSERT INTO loader_state (path, entry) VALUES (?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET entry = excluded.entry",
+                        [(path, json.dumps(entry)) for path, entry in loader_states.items()])
+                if removed_paths:
+                    self._conn.executemany("DELETE FROM file_index WHERE path = ?", [(path,) for path in removed_paths])
+                    self._conn.executemany("DELETE FROM loader_state WHERE path = ?", [(path,) for path in removed_paths])
+
+    def export_prefix(self, prefix):
+        """
+        prefix(save_path/deviceid/)로 시작하는 파일의 처리 상태를 prefix를 뺀 상대 경로 키로 반환. (import_prefix로 되돌림)
+        """
+        # prefix 뒤의 모든 경로를 기본 키 범위 검색으로 조회 (구분자 다음 문자를 상한으로 사용)
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        snapshot = {}
+        with self._lock:
+            for name, table, key_column, value_column in (('last_times', 'last_row', 'key', 'last_time'),
+                                                          ('file_entries', 'file_index', 'path', 'entry'),
+                                                          ('loader_states', 'loader_state', 'path', 'entry')):
+                rows = self._conn.execute(f"SELECT {key_column}, {value_column} FROM {table} "
+                                          f"WHERE {key_column} >= ? AND {key_column} < ?", (prefix, upper)).fetchall()
+                snapshot[name] = {key[len(prefix):]: (value if name == 'last_times' else json.loads(value))
+                                  for key, value in rows}
+        return snapshot
+
+    def import_prefix(self, prefix, snapshot):
+        """
+        export_prefix로 내보낸 처리 상태를 prefix를 붙여 기록.
+        """
+        self.commit(**{name: {prefix + key: value for key, value in snapshot.get(name, {}).items()}
+                       for name in ('last_times', 'file_entries', 'loader_states')})
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+STATE_STORE = None
+_STATE_STORE_LOCK = threading.Lock()
+
+def get_state_store():
+    """
+    CONFIG의 state_db_path(기본 worker_state.db)로 전역 상태 저장소를 한 번만 생성하여 반환.
+    """
+    global STATE_STORE
+    with _STATE_STORE_LOCK:
+        if STATE_STORE is None:
+            STATE_STORE = StateStore(CONFIG.get('state_db_path', STATE_DB_FILE))
+        return STATE_STORE
@@ -2,410 +2,657 @@
 # worker.py (Concurrent Version)
 # 지정된 경로의 파일을 스캔하여 처리하고 OPC-UA 서버로 전송합니다.
 # 여러 파일을 동시에 병렬로 처리하여 성능을 향상시킵니다.
+#
+# 구성 모듈 (worker.py와 같은 폴더)
+# - settings.py: 전역 설정(CONFIG)과 기본값
+# - worker_metrics.py / metrics.py: 성능 지표
+# - loaders.py: 엑셀/CSV/DBF 읽기와 TIME 열 파싱
+# - encoders.py: DataFrame -> NodeId/전송 값 변환
+# - opc_writer.py: OPC-UA 세션 풀과 동기 전송, 백필
+# - async_engine.py: asyncua 기반 비동기 전송 엔진
+# - state_store.py: 처리 상태 저장소(SQLite)
+# - leases.py: 다중 워커 lease 관리
+# - scheduler.py: 소스별 공정 스케줄링과 속도 제한
 
 import os
 import sys
 import json
 import time
+import hashlib
+import socket
 import traceback
 import threading
 from datetime import datetime
-from os.path import basename
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-import numpy as np
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 
 # 필요한 라이브러리 목록
 # pip install opcua pandas openpyxl simpledbf
 import pandas as pd
-from opcua import Client, ua
-from simpledbf import Dbf5
 
-# --- 전역 설정 변수 ---
-CONFIG = {}
-LAST_ROW_INFO_FILE = 'last_row_info.json' # 처리된 마지막 행 정보를 저장할 파일
-MAX_WORKERS = 5 # 동시에 처리할 최대 파일 수
+# 선택 라이브러리: 이벤트 기반 모드에서 파일 시스템 이벤트(inotify 등)를 사용하려면 설치
+# pip install watchdog
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+import opc_writer
+import async_engine
+import leases
+import state_store
+from settings import CONFIG, get_pipeline_settings
+from worker_metrics import (METRICS, _STAGE_TIMINGS, stage_timer, record_parse_metrics, print_cycle_summary,
+                            start_metrics_listener)
+from scheduler import get_source, FairScheduler, get_rate_limiter
+from loaders import loaddata
+from encoders import make_nodeid, encode_dataframe
+from opc_writer import get_opc_pool, get_opc_server_url, get_write_batch_size, get_tag_registry, get_value_cache, send_sheet
+from state_store import get_state_store, commit_loader_state
+from async_engine import get_async_engine
+from leases import get_lease_manager
+
+PARSE_POOL = None # 사이클 간에 유지되는 파싱 단계 프로세스 풀 (get_parse_pool()로 생성)
+WAKEUP_EVENT = threading.Event() # 이벤트 기반 모드에서 새 파일 도착 시 메인 루프를 깨우는 이벤트
+PENDING_PATHS = set() # 이벤트로 전달된, 처리 대상 후보 파일 경로
+_PENDING_LOCK = threading.Lock()
+
+# --- 1. 파일 처리 태스크 (파싱/전송) ---
+
+def parse_last_time(last_processed_time_str, file_sheet_key, verbose=True):
+    """
+    저장된 마지막 처리 시간 문자열을 datetime으로 변환. 없거나 형식 오류이면 None.
+    """
+    if not last_processed_time_str:
+        return None
+    try:
+        return datetime.strptime(last_processed_time_str, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        if verbose:
+            print(f"[WARNING] 날짜 형식 오류로 '{file_sheet_key}'의 전체 데이터를 재처리합니다: {last_processed_time_str}")
+        return None
 
-# --- 1. 데이터 처리 로직 (수정) ---
 
-def parse_flexible_time(time_val, fdate=None):
+def get_last_processed_time(state, file_sheet_key, verbose=True):
     """
-    여러 형식의 시간 문자열을 파싱하여 datetime 객체로 변환하는 함수.
+    상태 저장소에서 파일|시트 키의 마지막 처리 시간을 datetime으로 반환. 없거나 형식 오류이면 None.
     """
-    if pd.isna(time_val):
-        return pd.NaT
-        
-    time_str = str(time_val)
+    return parse_last_time(state.get_last_time(file_sheet_key), file_sheet_key, verbose)
 
-    # 시도할 형식과 전처리 로직의 리스트
-    # 각 항목은 (전처리 함수, strptime 포맷)의 튜플
-    # 전처리 함수는 (원본문자열, 파일날짜)를 인자로 받아 파싱할 문자열을 반환한다. 아무것도 반환하지 못할경우 에러처리.
-    parsing_strategies = [
-        # 형식 1: '24년1월1일 10시20분30초' -> '24-01-01 10:20:30'
-        (lambda s, d: s.replace("년", "-").replace("월", "-").replace("일", " ").replace("시", ":").replace("분", ":").replace("초", ""), '%y-%m-%d %H:%M:%S'),
-        
-        # 형식 2: '2024/01/01 10:20' 또는 '10:20:30' (날짜가 없는경우 넘겨받은 파일의 날짜를 사용(fdata)
-        (lambda s, d: f"{d} {s}" if d and len(s) < 12 and ':' in s else (s + ":00")[:19].replace("/", "-"), '%Y-%m-%d %H:%M:%S'),
 
-        # 형식 3: '2024.01.01 10:20:30' 또는 '24.01.01 10:20:30'
-        (lambda s, d: s.replace(".", "-"), '%Y-%m-%d %H:%M:%S'),
-        (lambda s, d: s.replace(".", "-"), '%y-%m-%d %H:%M:%S'),
-    ]
+def parse_file_task(filepath, params, last_times, resume):
+    """
+    [파싱 단계] 파일을 읽어 전송할 새 행만 골라 OPC-UA 문자열 값으로 인코딩. (프로세스 풀에서 실행될 함수)
+    last_times는 이 파일의 {파일|시트 키: 마지막 처리 시간 문자열}, resume은 CSV/DBF 이어 읽기 위치.
+    상태 저장소에 접근하지 않으므로 별도 프로세스에서 실행할 수 있으며, 결과는 write_file_task로 전달됩니다.
+    실패 시 None, 성공 시 {'filepath', 'dataid', 'sheets': [시트별 인코딩 결과], 'resume', 'timings': 단계별 소요 시간} 딕셔너리를 반환.
+    """
+    _STAGE_TIMINGS.current = {}
+    try:
+        parsed = parse_file(filepath, params, last_times, resume)
+        if parsed is not None:
+            parsed['timings'] = _STAGE_TIMINGS.current
+        return parsed
+    finally:
+        _STAGE_TIMINGS.current = None
 
-    for preprocess, fmt in parsing_strategies:
-        try:
-            processed_str = preprocess(time_str, fdate)
-            return datetime.strptime(processed_str, fmt)
-        except (ValueError, TypeError):
+
+def parse_file(filepath, params, last_times, resume):
+    """
+    parse_file_task의 본문. (단계별 소요 시간은 parse_file_task에서 수집)
+    """
+    dataid = params.get('dataid')
+
+    def since(sheet_name):
+        key = f"{filepath}|{sheet_name}"
+        return parse_last_time(last_times.get(key), key, verbose=False)
+
+    resume = dict(resume or {})
+    with stage_timer('load'):
+        df_dict = loaddata(filepath, params, since, resume)
+    if df_dict is None:
+        print(f"[ERROR] 파일 데이터 로드 실패: {filepath}")
+        return None
+
+    sheets = []
+    for sheet_name, df in df_dict.items():
+        if df.empty:
             continue
-            
-    # 모든 형식 변환 실패 시, pandas의 자동 파싱 기능을 마지막으로 시도
-    # errors='coerce'는 파싱 실패 시 NaT (Not a Time)을 반환하여 오류를 방지
-    return pd.to_datetime(time_str, errors='coerce')
 
+        file_sheet_key = f"{filepath}|{sheet_name}"
+        last_processed_time = parse_last_time(last_times.get(file_sheet_key), file_sheet_key)
 
-def load_excel_data(filename, dataid, headerline, columnline):
+        if last_processed_time is not None:
+            df_to_send = df[df['TIME'] > last_processed_time]
+        else:
+            df_to_send = df
+
+        if df_to_send.empty:
+            continue
+
+        with stage_timer('encode'):
+            encoded_columns = encode_dataframe(dataid, sheet_name, df_to_send)
+        sheets.append({
+            'sheet_name': sheet_name,
+            'key': file_sheet_key,
+            'columns': encoded_columns,
+            'float_nodeids': {make_nodeid(dataid, sheet_name, col) for col, dtype in df_to_send.dtypes.items()
+                              if pd.api.types.is_float_dtype(dtype)},
+            'times': df_to_send['TIME'].to_numpy(),
+            'latest_time': df_to_send['TIME'].max().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+
+    return {'filepath': filepath, 'dataid': dataid, 'sheets': sheets, 'resume': resume}
+
+
+def write_file_task(parsed, state):
     """
-    .xls 또는 .xlsx 파일을 읽어 Pandas DataFrame으로 변환.
-    columnline을 사용하여 데이터 시작점 이전의 행을 건너뛰고, 명시된 TIME 포맷으로 파싱합니다.
+    [전송 단계] parse_file_task 결과를 OPC-UA 서버로 전송. (스레드 풀에서 실행될 함수)
+    성공 시 (파일-시트 키, 마지막 처리 시간) 튜플의 리스트를 반환하고, 실패 시 None.
+    OPC-UA 연결은 매번 새로 만들지 않고 세션 풀(get_opc_pool)에서 빌려 사용합니다.
     """
+    filepath = parsed['filepath']
+
+    if not parsed['sheets']:
+        # 유효한 데이터가 없는 파일도 처리 완료로 보아 다음 사이클에 다시 읽지 않도록 함
+        commit_loader_state(state, parsed)
+        return []
+
+    opc_server_url = get_opc_server_url(parsed['dataid'])
+    if not opc_server_url:
+        print(f"[ERROR] config.json에 'opc_server_url'(또는 dataid '{parsed['dataid']}'의 opc_routes)이 설정되지 않았습니다.")
+        return None
+
+    batch_size = get_write_batch_size()
+    value_cache = get_value_cache()
+    rate_limiter = get_rate_limiter(get_source(filepath))
+    tag_registry = get_tag_registry()
+    validate_tags = bool(CONFIG.get('validate_tags', False))
+
+    started = time.perf_counter()
     try:
-        header_config = None
-        is_multi_header = False
-        effective_header_line_num = 1  # 기본값
+        with get_opc_pool().session(opc_server_url) as client:
+            results_for_this_file = []
+            for sheet in parsed['sheets']:
+                file_sheet_key = sheet['key']
+                tag_registry.compile(client, parsed['dataid'], sheet['sheet_name'],
+                                     [nodeid for nodeid, _ in sheet['columns']], validate_tags, batch_size)
+                print(f"[INFO] 스레드({threading.get_ident()})가 시트 '{sheet['sheet_name']}'의 새로운 데이터 {len(sheet['times'])}개를 처리합니다.")
 
-        header_str = str(headerline)
-        if header_str.startswith('[') and header_str.endswith(']'):
-            try:
-                header_list = json.loads(header_str)
-                header_config = [h - 1 for h in header_list]
-                is_multi_header = True
-                effective_header_line_num = max(header_list)
-            except (json.JSONDecodeError, ValueError):
-                header_config = 0
-                effective_header_line_num = 1
-        elif header_str.isdigit():
-            header_config = int(header_str) - 1
-            effective_header_line_num = int(header_str)
-        else:
-            header_config = 0
-            effective_header_line_num = 1
+                def checkpoint(last_time, key=file_sheet_key):
+                    # 시트 처리 도중 재시작되어도 이미 전송한 행을 다시 보내지 않도록 중간 진행 상황을 기록
+                    state.commit(last_times={key: last_time.strftime('%Y-%m-%d %H:%M:%S')})
 
-        all_sheets_df = pd.read_excel(filename, header=header_config, sheet_name=None)
-        
-        try:
-            columnline_num = int(columnline)
-            df_starts_at_line = effective_header_line_num + 1
-            rows_to_skip = columnline_num - df_starts_at_line
-            if rows_to_skip < 0:
-                rows_to_skip = 0
-        except (ValueError, TypeError):
-            rows_to_skip = 0
-
-        processed_sheets = {}
-        for sheet_name, sheet_df in all_sheets_df.items():
-            if sheet_df.empty:
-                continue
-
-            # columnline 로직 적용: DataFrame의 시작 부분에서 불필요한 행 건너뛰기
-            if rows_to_skip > 0:
-                if len(sheet_df) > rows_to_skip:
-                    print(f"[INFO] 시트 '{sheet_name}'의 시작 데이터 행({columnline_num})에 따라 상위 {rows_to_skip}개 행을 건너뜁니다.")
-                    sheet_df = sheet_df.iloc[rows_to_skip:].reset_index(drop=True)
-                else:
-                    print(f"[WARNING] 시트 '{sheet_name}'에서 건너뛸 행({rows_to_skip})이 전체 행 수({len(sheet_df)})보다 많아 데이터가 없습니다.")
-                    continue
+                send_sheet(client, opc_server_url, sheet, batch_size, checkpoint, value_cache, rate_limiter)
+                results_for_this_file.append((file_sheet_key, sheet['latest_time']))
 
-            if is_multi_header:
-                new_cols = []
-                last_header_part = ""
-                for col in sheet_df.columns:
-                    part1 = str(col[0])
-                    if 'Unnamed:' in part1 or part1.strip() == '':
-                        current_header_part1 = last_header_part
-                    else:
-                        current_header_part1 = part1
-                        last_header_part = part1
-                    
-                    remaining_parts = [str(p) for p in col[1:] if 'Unnamed:' not in str(p) and str(p).strip() != '']
-                    all_parts = [current_header_part1] + remaining_parts
-                    combined_col = '.'.join(filter(None, all_parts))
-                    new_cols.append(combined_col)
-                sheet_df.columns = new_cols
-
-            cols_to_keep = [col for col in sheet_df.columns if 'Unnamed:' not in str(col)]
-            if len(cols_to_keep) < len(sheet_df.columns):
-                dropped_cols = [col for col in sheet_df.columns if 'Unnamed:' in str(col)]
-                print(f"[INFO] 시트 '{sheet_name}'에서 'Unnamed' 컬럼 {dropped_cols}을 무시합니다.")
-            sheet_df = sheet_df[cols_to_keep]
-
-            all_columns = sheet_df.columns.tolist()
-            unique_columns = []
-            seen_originals = set()
-            for column in all_columns:
-                original_col = column
-                if isinstance(column, str) and len(column) > 2 and column[-2] == '.' and column[-1].isdigit():
-                    original_col = column[:-2]
-                if original_col not in seen_originals:
-                    unique_columns.append(column)
-                    seen_originals.add(original_col)
-            
-            if len(all_columns) > len(unique_columns):
-                dropped_cols = [col for col in all_columns if col not in unique_columns]
-                print(f"[INFO] 시트 '{sheet_name}'에서 중복 컬럼 {dropped_cols}을 무시합니다.")
-            sheet_df = sheet_df[unique_columns]
-
-            if sheet_df.empty or sheet_df.columns.empty:
-                continue
-
-            input_df = sheet_df.rename(columns={sheet_df.columns[0]: 'TIME'})
-            
-            # 파싱 전 TIME 컬럼이 비어있는 행을 먼저 제거
-            input_df.dropna(subset=['TIME'], inplace=True)
-            if input_df.empty:
-                print(f"[INFO] 시트 '{sheet_name}'에 유효한 시간 데이터가 없어 건너뜁니다.")
-                continue
-
-            print(f"[DEBUG] 시트 '{sheet_name}'의 TIME 컬럼 파싱 시도 (원본 데이터 예시: {input_df['TIME'].iloc[0]})")
-            
-            original_time_column = input_df['TIME'].copy()
-            
-            # --- 유연한 시간 파싱 로직 ---
-            # 파일명에서 날짜 추출 (시간만 있는 데이터에 사용)
-            fdate = None
-            try:
-                fname = basename(filename).split(".")
-                fdate_str = fname[0].split("_")[-1]
-                # 'YYYY년MM월DD일' 또는 'YYYY-MM-DD' 같은 형식을 '%Y-%m-%d'로 통일
-                cleaned_fdate_str = fdate_str.replace("년", "-").replace("월", "-").replace("일", "")
-                fdate = datetime.strptime(cleaned_fdate_str, '%Y-%m-%d').strftime('%Y-%m-%d')
-            except (ValueError, IndexError):
-                print(f"[WARNING] 파일명 '{basename(filename)}'에서 날짜를 추출할 수 없습니다. 시간만 있는 데이터는 파싱에 실패할 수 있습니다.")
-
-            # TIME값을 일괄 처리하기 위한 공통 함수를 호출한다.
-            input_df['TIME'] = input_df['TIME'].apply(lambda x: parse_flexible_time(x, fdate=fdate))
-            
-            # 파싱에 실패한 행(NaT)이 있는지 확인하고 경고
-            failed_mask = input_df['TIME'].isna()
-            if failed_mask.any():
-                failed_count = failed_mask.sum()
-                failed_examples = original_time_column[failed_mask].head(3).tolist()
-                print(f"[WARNING] 시트 '{sheet_name}'에서 TIME 컬럼 파싱 실패 (총 {failed_count}개). 예시: {failed_examples}")
-                # 파싱 실패한 행 최종 제거
-                input_df.dropna(subset=['TIME'], inplace=True)
-
-            processed_sheets[sheet_name] = input_df
-        
-        return processed_sheets
+            commit_loader_state(state, parsed)
+            return results_for_this_file
 
     except Exception as e:
-        print(f"[ERROR] Excel 파일 로딩 실패: {filename}, {e}")
+        print(f"[ERROR] 스레드({threading.get_ident()}) 실행 중 오류: {filepath}, {e}")
         traceback.print_exc()
         return None
+    finally:
+        METRICS.observe('worker_stage_seconds', time.perf_counter() - started, stage='write')
 
-def loaddata(filepath, params):
-    dataid = params.get('dataid')
-    headerline = params.get('headerline', '1')
-    columnline = params.get('columnline', '1')
-    ext = os.path.splitext(filepath)[-1].lower()
-    
-    if ext in ['.xls', '.xlsx']:
-        return load_excel_data(filepath, dataid, headerline, columnline)
-    else:
-        print(f"[WARNING] 지원하지 않는 파일 형식: {ext}")
-        return None
-
-# --- 2. OPC-UA 전송 태스크 (기존과 동일) ---
 
-def sendopcua_task(filepath, params, last_row_info):
+def sendopcua_task(filepath, params, state):
     """
-    단일 파일에 대한 데이터 처리 및 OPC-UA 전송을 수행. (스레드에서 실행될 함수)
+    단일 파일에 대한 데이터 처리(parse_file_task)와 OPC-UA 전송(write_file_task)을 현재 스레드에서 차례로 수행.
     성공 시 (파일-시트 키, 마지막 처리 시간) 튜플의 리스트를 반환.
     """
-    dataid = params.get('dataid')
-    
-    df_dict = loaddata(filepath, params)
-    if not df_dict:
-        print(f"[ERROR] 파일 데이터 로드 실패: {filepath}")
+    parsed = parse_file_task(filepath, params, state.get_last_times(filepath), state.get_loader_state(filepath))
+    if parsed is None:
         return None
+    record_parse_metrics(parsed)
+    return write_file_task(parsed, state)
 
-    opc_server_url = CONFIG.get('opc_server_url')
-    if not opc_server_url:
-        print(f"[ERROR] config.json에 'opc_server_url'이 설정되지 않았습니다.")
-        return None
-        
-    client = Client(opc_server_url)
-    try:
-        client.connect()
-        
-        results_for_this_file = []
-        for sheet_name, df in df_dict.items():
-            if df.empty:
-                continue
-
-            file_sheet_key = f"{filepath}|{sheet_name}"
-            last_processed_time_str = last_row_info.get(file_sheet_key)
-            
-            if last_processed_time_str:
-                try:
-                    last_processed_time = datetime.strptime(last_processed_time_str, '%Y-%m-%d %H:%M:%S')
-                    df_to_send = df[df['TIME'] > last_processed_time].copy()
-                except ValueError:
-                    print(f"[WARNING] 날짜 형식 오류로 '{file_sheet_key}'의 전체 데이터를 재처리합니다: {last_processed_time_str}")
-                    df_to_send = df.copy()
-            else:
-                df_to_send = df.copy()
-
-            if df_to_send.empty:
-                continue
-
-            print(f"[INFO] 스레드({threading.get_ident()})가 시트 '{sheet_name}'의 새로운 데이터 {len(df_to_send)}개를 처리합니다.")
-            
-            latest_time_in_batch = df_to_send['TIME'].max()
-
-            current_sheet_name = sheet_name
-            if current_sheet_name.startswith("Sheet"):
-                current_sheet_name = ""
-
-            # 전송 순서 조정을 위해 컬럼 목록을 가져와 TIME을 맨 뒤로 보냅니다.
-            column_order = df_to_send.columns.tolist()
-            if 'TIME' in column_order:
-                column_order.remove('TIME')
-                column_order.append('TIME')
-
-            for _, row in df_to_send.iterrows():
-                for col_name in column_order: # 수정된 순서대로 처리
-                    value = row[col_name]
-                    if current_sheet_name == "":
-                        nodeid = f"ns=2;s={dataid}.{col_name}"
-                    else:
-                        nodeid = f"ns=2;s={dataid}.{current_sheet_name}.{col_name}"
-                    
+
+# --- 2. 메인 처리 함수 ---
+
+def compute_file_hash(filepath, chunk_size=1024 * 1024):
+    """
+    파일 내용의 SHA-1 해시를 계산. (config.json의 fingerprint_hash가 true일 때만 사용)
+    """
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_fingerprint(file_stat, param_stat):
+    """
+    데이터 파일과 메타데이터(.json) 파일의 stat 결과로 파일 지문을 생성.
+    메타데이터(headerline 등)가 바뀌어도 다시 처리되도록 함께 기록합니다.
+    """
+    return {
+        'size': file_stat.st_size,
+        'mtime_ns': file_stat.st_mtime_ns,
+        'param_mtime_ns': param_stat.st_mtime_ns,
+    }
+
+
+def is_unchanged(filepath, fingerprint, index_entry, use_hash):
+    """
+    이전에 처리 완료된 지문(index_entry)과 비교하여 파일이 변경되지 않았는지 확인.
+    use_hash가 true이면 크기/수정 시간이 달라도 내용 해시가 같으면 변경되지 않은 것으로 보고,
+    새 크기/수정 시간을 index_entry에 반영합니다.
+    """
+    if not index_entry:
+        return False
+    if all(index_entry.get(k) == v for k, v in fingerprint.items()):
+        return True
+    if use_hash and index_entry.get('hash') and index_entry.get('param_mtime_ns') == fingerprint['param_mtime_ns']:
+        try:
+            if compute_file_hash(filepath) == index_entry['hash']:
+                index_entry.update(fingerprint)
+                return True
+        except OSError:
+            pass
+    return False
+
+
+def list_deviceids(save_path):
+    """
+    save_path 아래의 deviceid 폴더 목록을 반환. ('.'으로 시작하는 폴더(lease_dir 등)는 제외)
+    """
+    return [name for name in os.listdir(save_path)
+            if not name.startswith('.') and os.path.isdir(os.path.join(save_path, name))]
+
+
+def iter_candidate_files(save_path, paths=None, deviceids=None):
+    """
+    처리 후보 파일을 (데이터 파일 경로, stat, 메타데이터 파일 경로, stat) 튜플로 반환.
+    paths가 없으면 save_path/deviceid/dataid 전체를 스캔하고,
+    paths가 주어지면 해당 경로(데이터 파일 또는 .json 메타데이터 파일)만 확인합니다.
+    deviceids가 주어지면(여러 워커로 나누어 처리) 해당 deviceid 폴더의 파일만 반환합니다.
+    """
+    if paths is None:
+        for deviceid_folder in list_deviceids(save_path):
+            if deviceids is not None and deviceid_folder not in deviceids: continue
+            deviceid_path = os.path.join(save_path, deviceid_folder)
+            for dataid_folder in os.listdir(deviceid_path):
+                dataid_path = os.path.join(deviceid_path, dataid_folder)
+                if not os.path.isdir(dataid_path): continue
+
+                # scandir 결과로 stat을 한 번에 가져와, 파일마다 exists/getmtime을 호출하지 않도록 함
+                with os.scandir(dataid_path) as it:
+                    entries = {entry.name: entry for entry in it if entry.is_file()}
+
+                for filename, entry in entries.items():
+                    if filename.endswith('.json') or filename.endswith('.tmp'): continue
+
+                    param_entry = entries.get(filename + '.json')
+                    if param_entry is None: continue
                     try:
-                        node = client.get_node(nodeid)
-                        
-                        # --- 데이터 타입에 따른 Variant 생성 (소수점 처리) ---
-                        if pd.isna(value):
-                            continue
-
-                        if isinstance(value, (int, np.integer)):
-                            variant = ua.Variant(str(value), ua.VariantType.String)
-                        elif isinstance(value, (float, np.floating)):
-                            # 소수점 8자리까지 표현하고, 불필요한 0은 제거하여 문자열로 변환
-                            formatted_float = f"{value:.8f}".rstrip('0').rstrip('.')
-                            variant = ua.Variant(formatted_float, ua.VariantType.String)
-                        elif isinstance(value, str):
-                            variant = ua.Variant(value, ua.VariantType.String)
-                        elif isinstance(value, datetime):
-                            variant = ua.Variant(value.strftime('%Y-%m-%d %H:%M:%S'), ua.VariantType.String)
-                        else:
-                            variant = ua.Variant(str(value), ua.VariantType.String)
-                        
-                        dv = ua.DataValue(variant)
-                        node.set_value(dv)
-                        # --- 로직 끝 ---
-                    except Exception as node_e:
-                        print(f"[WARNING] NodeId {nodeid} 처리 중 오류: {node_e}")
+                        yield entry.path, entry.stat(), param_entry.path, param_entry.stat()
+                    except FileNotFoundError:
+                        continue
+        return
 
-            results_for_this_file.append((file_sheet_key, latest_time_in_batch.strftime('%Y-%m-%d %H:%M:%S')))
+    save_root = os.path.abspath(save_path)
+    filepaths = set()
+    for path in paths:
+        if path.endswith('.tmp'): continue
+        filepath = path[:-len('.json')] if path.endswith('.json') else path
+        # save_path/deviceid/dataid/파일명 구조의 파일만 처리
+        rel_parts = os.path.relpath(os.path.abspath(filepath), save_root).split(os.sep)
+        if len(rel_parts) != 3 or rel_parts[0] == '..': continue
+        if deviceids is not None and rel_parts[0] not in deviceids: continue
+        filepaths.add(os.path.join(save_path, *rel_parts))
+
+    for filepath in sorted(filepaths):
+        param_filepath = filepath + '.json'
+        try:
+            yield filepath, os.stat(filepath), param_filepath, os.stat(param_filepath)
+        except FileNotFoundError:
+            continue
 
-        client.disconnect()
-        return results_for_this_file
 
-    except Exception as e:
-        print(f"[ERROR] 스레드({threading.get_ident()}) 실행 중 오류: {filepath}, {e}")
-        traceback.print_exc()
-        if client.uaclient:
-            client.disconnect()
+def init_parse_process(config):
+    """
+    파싱 프로세스 초기화. 메인 프로세스의 CONFIG를 그대로 사용합니다.
+    (다른 모듈이 settings.CONFIG를 import하여 사용하므로 같은 딕셔너리의 내용을 교체)
+    """
+    CONFIG.clear()
+    CONFIG.update(config)
+
+
+_PARSE_POOL_LOCK = threading.Lock()
+
+def get_parse_pool(parse_workers):
+    """
+    파싱 단계 프로세스 풀을 한 번만 생성하여 반환. parse_workers가 0이면 None.
+    (spawn 방식으로 생성하여 메인 프로세스의 스레드/소켓/DB 연결을 물려받지 않음)
+    """
+    global PARSE_POOL
+    if parse_workers <= 0:
         return None
+    with _PARSE_POOL_LOCK:
+        if PARSE_POOL is None:
+            PARSE_POOL = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=init_parse_process, initargs=(CONFIG,))
+        return PARSE_POOL
+
 
-# --- 3. 메인 처리 함수 (기존과 동일) ---
+def reset_parse_pool():
+    global PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if PARSE_POOL is not None:
+            PARSE_POOL.shutdown(wait=False, cancel_futures=True)
+            PARSE_POOL = None
 
-def process_all_files():
+
+def process_all_files(paths=None):
     """
-    파일을 스캔하고, ThreadPoolExecutor를 사용해 병렬로 처리.
+    파일을 스캔하고, 파싱(프로세스 풀)과 전송(스레드 풀) 단계로 나누어 병렬로 처리.
+    지난 처리 이후 크기/수정 시간이 바뀌지 않은 파일은 읽지 않고 건너뜁니다.
+    paths가 주어지면(이벤트 기반 모드) 전체 스캔 없이 해당 파일만 확인합니다.
     """
-    print(f"---[{datetime.now()}] 워커 사이클 시작 ---")
+    if paths is None:
+        print(f"---[{datetime.now()}] 워커 사이클 시작 ---")
+    else:
+        print(f"---[{datetime.now()}] 워커 사이클 시작 (이벤트 {len(paths)}건) ---")
+    cycle_started = time.time()
+    metrics_before = METRICS.snapshot()
     
-    # 1. 마지막 처리 정보 로드
-    last_row_info = {}
-    if os.path.exists(LAST_ROW_INFO_FILE):
-        with open(LAST_ROW_INFO_FILE, 'r', encoding='utf-8') as f:
-            try:
-                last_row_info = json.load(f)
-            except json.JSONDecodeError:
-                print(f"[WARNING] {LAST_ROW_INFO_FILE} 파일이 손상되었습니다. 새로 시작합니다.")
+    # 1. 처리 상태 저장소 준비
+    state = get_state_store()
+    file_entries = {}  # 이번 사이클에 갱신할 파일 지문
+    use_hash = bool(CONFIG.get('fingerprint_hash', False))
 
     # 2. 처리할 파일 목록 수집
     tasks = []
+    seen_paths = set()
+    skipped_count = 0
     save_path = CONFIG.get('save_path')
     if not save_path or not os.path.isdir(save_path):
         print(f"[ERROR] 설정된 save_path를 찾을 수 없음: {save_path}")
         return
 
+    # 여러 워커로 나누어 처리하는 경우(partition), lease를 얻은 deviceid만 처리
+    lease_manager = get_lease_manager()
+    owned_deviceids = None
+    if lease_manager is not None:
+        try:
+            owned_deviceids = lease_manager.refresh(list_deviceids(save_path), state)
+        except OSError as e:
+            print(f"[ERROR] lease 갱신 중 오류: {e}")
+            return
+        if paths is None:
+            print(f"[INFO] 워커 '{lease_manager.worker_id}'가 deviceid {len(owned_deviceids)}개를 담당합니다.")
+
     try:
-        for deviceid_folder in os.listdir(save_path):
-            deviceid_path = os.path.join(save_path, deviceid_folder)
-            if not os.path.isdir(deviceid_path): continue
-            for dataid_folder in os.listdir(deviceid_path):
-                dataid_path = os.path.join(deviceid_path, dataid_folder)
-                if not os.path.isdir(dataid_path): continue
-                for filename in os.listdir(dataid_path):
-                    if filename.endswith('.json') or filename.endswith('.tmp'): continue
-                    
-                    filepath = os.path.join(dataid_path, filename)
-                    param_filepath = filepath + '.json'
-                    if not os.path.exists(param_filepath): continue
+        for filepath, file_stat, param_filepath, param_stat in iter_candidate_files(save_path, paths, owned_deviceids):
+            seen_paths.add(filepath)
+            fingerprint = make_fingerprint(file_stat, param_stat)
+            index_entry = state.get_file_entry(filepath)
+            if index_entry is not None:
+                previous_entry = dict(index_entry)
+                if is_unchanged(filepath, fingerprint, index_entry, use_hash):
+                    if index_entry != previous_entry:
+                        file_entries[filepath] = index_entry
+                    skipped_count += 1
+                    continue
 
-                    try:
-                        with open(param_filepath, 'r', encoding='utf-8') as f:
-                            params = json.load(f)
-                        tasks.append({'filepath': filepath, 'params': params})
-                    except (json.JSONDecodeError, FileNotFoundError) as e:
-                        print(f"[WARNING] 메타데이터 파일({param_filepath}) 처리 중 오류: {e}")
+            try:
+                with open(param_filepath, 'r', encoding='utf-8') as f:
+                    params = json.load(f)
+                tasks.append({'filepath': filepath, 'params': params, 'fingerprint': fingerprint,
+                              'source': get_source(filepath), 'mtime_ns': file_stat.st_mtime_ns})
+            except (json.JSONDecodeError, FileNotFoundError) as e:
+                print(f"[WARNING] 메타데이터 파일({param_filepath}) 처리 중 오류: {e}")
 
     except Exception as e:
         print(f"[ERROR] 파일 스캔 중 예외 발생: {e}")
         traceback.print_exc()
         return
 
+    # 삭제된 파일의 지문 정리 (전체 스캔일 때만)
+    removed_paths = [path for path in state.file_paths() if path not in seen_paths] if paths is None else []
+    if owned_deviceids is not None:
+        # 다른 워커가 담당하는 deviceid의 파일은 삭제된 것으로 보지 않음
+        removed_paths = [path for path in removed_paths if get_source(path)[0] in owned_deviceids]
+    # 이번 사이클에 처리 상태가 바뀐 deviceid (partition 모드에서 파일별 기록과 별도로 사이클 끝에 다시 상태를 내보냄)
+    changed_deviceids = {get_source(path)[0] for path in list(removed_paths) + list(file_entries)}
+    changed_deviceids.update(task['source'][0] for task in tasks)
+
     if not tasks:
+        if removed_paths or file_entries:
+            state.commit(file_entries=file_entries, removed_paths=removed_paths)
+            if lease_manager is not None:
+                lease_manager.save_state(state, changed_deviceids)
         return
 
-    print(f"[INFO] 총 {len(tasks)}개 파일을 병렬로 처리합니다. (최대 동시 작업: {MAX_WORKERS})")
+    async_engine = get_async_engine()
+    parse_workers, write_workers, queue_size = get_pipeline_settings()
+    write_label = '비동기 동시 전송' if async_engine is not None else '전송 스레드'
+    print(f"[INFO] 총 {len(tasks)}개 파일을 병렬로 처리합니다. (변경 없음으로 건너뛴 파일: {skipped_count}개, 파싱 프로세스: {parse_workers}, {write_label}: {write_workers})")
 
-    # 3. ThreadPoolExecutor로 병렬 처리
+    # 3. 파싱(프로세스 풀) -> 전송(스레드 풀 또는 비동기 엔진) 파이프라인으로 처리
+    # 파싱 중이거나 전송을 기다리는 파일 수를 queue_size로 제한하여, 전송이 느릴 때 파싱 결과가 메모리에 쌓이지 않도록 함
+    # 처리 순서는 FairScheduler가 (deviceid, dataid)별 가중치와 파일 수정 시간에 따라 결정
     new_results = {}
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_task = {executor.submit(sendopcua_task, task['filepath'], task['params'], last_row_info): task for task in tasks}
-        
-        for future in as_completed(future_to_task):
-            task_filepath = future_to_task[future]['filepath']
+    parse_pool = get_parse_pool(parse_workers)
+    scheduler = FairScheduler(tasks, CONFIG.get('source_weights'), CONFIG.get('max_inflight_per_source'))
+    in_flight = {}  # future -> (단계, task)
+    # 비동기 엔진에서는 스레드 풀을 파싱 프로세스가 없을 때의 파싱에만 사용
+    thread_workers = write_workers if async_engine is None else (os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=thread_workers) as write_pool:
+
+        def submit_write(parsed):
+            if async_engine is not None:
+                return async_engine.submit(parsed, state)
+            return write_pool.submit(write_file_task, parsed, state)
+
+        while len(scheduler) or in_flight:
+            while len(in_flight) < queue_size:
+                task = scheduler.next_task()
+                if task is None:
+                    break
+                task_filepath = task['filepath']
+                if parse_pool is None and async_engine is None:
+                    future = write_pool.submit(sendopcua_task, task_filepath, task['params'], state)
+                    in_flight[future] = ('write', task)
+                else:
+                    future = (parse_pool or write_pool).submit(parse_file_task, task_filepath, task['params'],
+                                                               state.get_last_times(task_filepath),
+                                                               state.get_loader_state(task_filepath))
+                    in_flight[future] = ('parse', task)
+
+            METRICS.set('worker_pending_files', len(scheduler))
+            METRICS.set('worker_in_flight_files', len(in_flight))
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, task = in_flight.pop(future)
+                task_filepath = task['filepath']
+                try:
+                    if stage == 'parse':
+                        parsed = future.result()
+                        if parsed is not None:
+                            record_parse_metrics(parsed)
+                            in_flight[submit_write(parsed)] = ('write', task)
+                        else:
+                            METRICS.inc('worker_files_total', result='fail')
+                            scheduler.task_done(task)
+                        continue
+
+                    scheduler.task_done(task)
+                    result_list = future.result()
+                    METRICS.inc('worker_files_total', result='ok' if result_list is not None else 'fail')
+                    if result_list is not None:
+                        METRICS.observe('worker_file_lag_seconds', max(0.0, time.time() - task['mtime_ns'] / 1e9))
+                        file_results = dict(result_list)
+                        # 처리에 성공한 파일만 지문을 기록 (실패한 파일은 다음 사이클에 다시 시도)
+                        entry = dict(task['fingerprint'])
+                        entry['processed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                        if use_hash:
+                            try:
+                                entry['hash'] = compute_file_hash(task_filepath)
+                            except OSError:
+                                pass
+                        # 다른 파일의 완료를 기다리지 않고 파일 단위로 즉시 기록
+                        state.commit(last_times=file_results, file_entries={task_filepath: entry})
+                        if lease_manager is not None:
+                            # 워커가 도중에 죽어도 lease를 넘겨받은 워커가 이미 전송한 파일을 다시 보내지 않도록 바로 내보냄
+                            lease_manager.save_state(state, [task['source'][0]])
+                        new_results.update(file_results)
+                except BrokenProcessPool as e:
+                    METRICS.inc('worker_files_total', result='fail')
+                    # 파싱 프로세스가 비정상 종료된 경우, 이번 사이클의 나머지 파일은 전송 스레드에서 파싱하고 다음 사이클에 풀을 새로 만듦
+                    print(f"[ERROR] 파싱 프로세스 풀 오류({task_filepath}): {e}")
+                    scheduler.task_done(task)
+                    reset_parse_pool()
+                    parse_pool = None
+                except Exception as e:
+                    print(f"[ERROR] 태스크 실행({task_filepath}) 결과 처리 중 오류: {e}")
+                    METRICS.inc('worker_files_total', result='fail')
+                    if stage == 'parse':
+                        scheduler.task_done(task)
+
+    # 4. 모든 작업 완료 후, 나머지 정보(건너뛴 파일의 지문 갱신, 삭제된 파일) 기록
+    if new_results:
+        print(f"[INFO] 총 {len(new_results)}개의 파일/시트 정보가 {state.path}에 기록되었습니다.")
+    if opc_writer.TAG_REGISTRY is not None:
+        opc_writer.TAG_REGISTRY.report()
+    value_cache = opc_writer.VALUE_CACHE
+    if value_cache is not None:
+        print(f"[INFO] 변경된 값만 전송 모드: 누적 전송 {value_cache.stats['written']}개, 변경 없음으로 생략 {value_cache.stats['skipped']}개")
+    try:
+        state.commit(file_entries=file_entries, removed_paths=removed_paths)
+    except Exception as e:
+        print(f"[ERROR] {state.path} 기록 오류: {e}")
+    if lease_manager is not None:
+        lease_manager.save_state(state, changed_deviceids)
+    METRICS.set('worker_pending_files', 0)
+    METRICS.set('worker_in_flight_files', 0)
+    cycle_elapsed = time.time() - cycle_started
+    METRICS.observe('worker_cycle_seconds', cycle_elapsed)
+    print_cycle_summary(metrics_before, cycle_elapsed)
+
+# --- 3. 이벤트 기반 깨우기 ---
+
+def notify_paths(paths):
+    """
+    처리 대상 후보 경로를 등록하고 메인 루프를 깨움.
+    """
+    with _PENDING_LOCK:
+        PENDING_PATHS.update(paths)
+    WAKEUP_EVENT.set()
+
+
+def take_pending_paths():
+    # 잠금 안에서 이벤트를 먼저 내려야, 복사 직후 notify_paths가 등록한 경로의 깨우기 신호가 지워지지 않음
+    with _PENDING_LOCK:
+        WAKEUP_EVENT.clear()
+        paths = set(PENDING_PATHS)
+        PENDING_PATHS.clear()
+    return paths
+
+
+def start_notify_listener(port):
+    """
+    lmfilerecv가 파일 저장 후 보내는 로컬 UDP 알림(저장된 파일 경로)을 수신하는 스레드를 시작.
+    네트워크 파일 시스템처럼 inotify 이벤트가 전달되지 않는 환경에서도 즉시 처리할 수 있습니다.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', int(port)))
+
+    def listen():
+        while True:
             try:
-                result_list = future.result()
-                if result_list:
-                    for file_sheet_key, new_time in result_list:
-                        new_results[file_sheet_key] = new_time
+                data, _ = sock.recvfrom(65535)
+                notify_paths([data.decode('utf-8')])
             except Exception as e:
-                print(f"[ERROR] 태스크 실행({task_filepath}) 결과 처리 중 오류: {e}")
+                print(f"[WARNING] 수신 알림 처리 중 오류: {e}")
 
-    # 4. 모든 작업 완료 후, 마지막 처리 정보 일괄 업데이트
-    if new_results:
-        print(f"[INFO] 총 {len(new_results)}개의 파일/시트 정보가 갱신됩니다.")
-        last_row_info.update(new_results)
-        try:
-            with open(LAST_ROW_INFO_FILE, 'w', encoding='utf-8') as f:
-                json.dump(last_row_info, f, indent=2)
-            print(f"[INFO] {LAST_ROW_INFO_FILE} 파일에 성공적으로 기록했습니다.")
-        except Exception as e:
-            print(f"[ERROR] {LAST_ROW_INFO_FILE} 파일 쓰기 오류: {e}")
+    threading.Thread(target=listen, name="notify-listener", daemon=True).start()
+    print(f"[INFO] 수신 알림 대기 중: udp://127.0.0.1:{port}")
+
+
+def is_hidden_path(path, save_path):
+    """
+    save_path 기준 상대 경로에 '.'으로 시작하는 부분이 있으면 True. (list_deviceids와 같은 규칙)
+    lease_dir(.leases, 워커 heartbeat와 <deviceid>.state.json 포함)와 분할 업로드 폴더(.uploads), save_path 밖의 경로가 해당됩니다.
+    """
+    relative = os.path.relpath(path, save_path)
+    return any(part.startswith('.') for part in relative.split(os.sep))
+
+
+class SavePathEventHandler(FileSystemEventHandler):
+    """
+    save_path 아래에서 파일 쓰기 완료(close) 및 이름 변경(rename) 이벤트를 받아 메인 루프를 깨우는 핸들러.
+    lmfilerecv는 .tmp로 저장 후 rename하므로 .tmp 이벤트는 무시합니다.
+    워커가 매 사이클 기록하는 lease 파일 등 '.'으로 시작하는 폴더의 이벤트도 무시하여, 자신의 기록으로 다시 깨어나지 않도록 합니다.
+    """
+
+    def __init__(self, save_path):
+        super().__init__()
+        self.save_path = save_path
+
+    def _notify(self, path):
+        if not path.endswith('.tmp') and not is_hidden_path(path, self.save_path):
+            notify_paths([path])
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._notify(event.dest_path)
 
-# --- 4. 실행 블록 (기존과 동일) ---
+    def on_closed(self, event):
+        if not event.is_directory:
+            self._notify(event.src_path)
+
+    def on_modified(self, event):
+        # close 이벤트를 지원하지 않는 플랫폼(Windows 등)을 위한 보조 이벤트
+        if not event.is_directory:
+            self._notify(event.src_path)
+
+
+def start_fs_watcher(save_path):
+    """
+    watchdog이 설치되어 있으면 save_path 파일 시스템 감시를 시작. 설치되지 않았으면 None을 반환.
+    """
+    if Observer is None:
+        print("[WARNING] watchdog 라이브러리가 없어 파일 시스템 이벤트 감시를 사용할 수 없습니다. (pip install watchdog)")
+        return None
+    observer = Observer()
+    observer.schedule(SavePathEventHandler(save_path), save_path, recursive=True)
+    observer.daemon = True
+    observer.start()
+    print(f"[INFO] 파일 시스템 이벤트 감시 시작: {save_path}")
+    return observer
+
+
+def run_event_loop(reconcile_interval, debounce):
+    """
+    이벤트 기반 메인 루프. 이벤트가 들어오면 해당 파일만 처리하고,
+    reconcile_interval마다 전체 스캔으로 누락된 파일을 보정합니다.
+    """
+    process_all_files()
+    next_reconcile = time.time() + reconcile_interval
+    while True:
+        WAKEUP_EVENT.wait(max(0, next_reconcile - time.time()))
+        if WAKEUP_EVENT.is_set():
+            # 짧은 시간 동안 연속으로 들어오는 이벤트(데이터 파일 + .json)를 한 번에 모아서 처리
+            time.sleep(debounce)
+            paths = take_pending_paths()
+            if paths:
+                process_all_files(paths)
+        if time.time() >= next_reconcile:
+            process_all_files()
+            next_reconcile = time.time() + reconcile_interval
+
+# --- 4. 실행 블록 ---
 if __name__ == '__main__':
     # 1. 설정 파일 로드
     try:
         with open('config.json', 'r', encoding='utf-8') as f:
-            CONFIG = json.load(f)
+            CONFIG.update(json.load(f))
     except FileNotFoundError:
         print("[CRITICAL] 설정 파일(config.json)을 찾을 수 없습니다. 프로그램을 종료합니다.")
         sys.exit(1)
@@ -424,7 +671,35 @@ if __name__ == '__main__':
 
     # 3. 메인 처리 루프 실행
     scan_interval = CONFIG.get('scan_interval', 10)
-    print(f"[INFO] 워커가 지속적인 실행 모드로 시작됩니다. ({scan_interval}초 간격, 최대 스레드: {MAX_WORKERS})")
-    while True:
-        process_all_files()
-        time.sleep(scan_interval)
\ No newline at end of file
+    wakeup_mode = CONFIG.get('wakeup_mode', 'poll')
+    parse_workers, write_workers, _ = get_pipeline_settings()
+    metrics_port = CONFIG.get('metrics_port')
+    if metrics_port:
+        start_metrics_listener(metrics_port)
+    try:
+        if wakeup_mode == 'event':
+            reconcile_interval = CONFIG.get('reconcile_interval', 300)
+            notify_port = CONFIG.get('notify_port')
+            if notify_port:
+                start_notify_listener(notify_port)
+            if save_path_init:
+                start_fs_watcher(save_path_init)
+            print(f"[INFO] 워커가 이벤트 기반 모드로 시작됩니다. (보정 스캔 {reconcile_interval}초 간격, 파싱 프로세스/동시 전송: {parse_workers}/{write_workers}, 전송 엔진: {CONFIG.get('opc_engine', 'thread')})")
+            run_event_loop(reconcile_interval, CONFIG.get('event_debounce', 0.2))
+        else:
+            print(f"[INFO] 워커가 지속적인 실행 모드로 시작됩니다. ({scan_interval}초 간격, 파싱 프로세스/동시 전송: {parse_workers}/{write_workers}, 전송 엔진: {CONFIG.get('opc_engine', 'thread')})")
+            while True:
+                process_all_files()
+                time.sleep(scan_interval)
+    finally:
+        # 종료 시 풀에 남아있는 OPC-UA 세션을 정리
+        if opc_writer.OPC_POOL is not None:
+            opc_writer.OPC_POOL.close()
+        if async_engine.ASYNC_ENGINE is not None:
+            async_engine.ASYNC_ENGINE.close()
+        if leases.LEASE_MANAGER is not None:
+            leases.LEASE_MANAGER.close(state_store.STATE_STORE)
+        if PARSE_POOL is not None:
+            PARSE_POOL.shutdown()
+        if state_store.STATE_STORE is not None:
+            state_store.STATE_STORE.close()
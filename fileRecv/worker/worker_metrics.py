@@ -0,0 +1,110 @@
+#-*- coding: utf-8 -*-
+# worker_metrics.py
+# 워커의 성능 지표(단계별 소요 시간, 처리량)를 기록하고 사이클 요약과 /metrics 응답을 제공합니다.
+
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+
+# 수신 서버(lmfilerecv.py)와 함께 사용하는 성능 지표 모듈 (worker/metrics.py)
+from metrics import Metrics, histogram_delta, counter_delta, histogram_quantile
+
+from settings import CONFIG
+
+
+# 지표 이름 -> (Prometheus 타입, 설명)
+METRIC_HELP = {
+    'worker_stage_seconds': ('histogram', '파일 하나의 처리 단계별 소요 시간(초). stage: load(파일 읽기, TIME 파싱 포함), time_parse, encode, write'),
+    'worker_opc_write_seconds': ('histogram', 'OPC-UA Write 요청 하나의 응답 시간(초)'),
+    'worker_file_lag_seconds': ('histogram', '파일 수정 시간부터 마지막 OPC-UA 전송 완료까지의 지연(초)'),
+    'worker_cycle_seconds': ('histogram', '워커 사이클 하나의 소요 시간(초)'),
+    'worker_files_total': ('counter', '처리한 파일 수. result: ok, fail'),
+    'worker_rows_total': ('counter', '전송 대상으로 파싱된 행 수'),
+    'worker_values_written_total': ('counter', 'OPC-UA로 전송한 값 수. result: ok, fail'),
+    'worker_values_skipped_total': ('counter', '변경 없음(report_by_exception)으로 전송을 생략한 값 수'),
+    'worker_pending_files': ('gauge', '이번 사이클에서 아직 시작하지 않은 파일 수'),
+    'worker_in_flight_files': ('gauge', '파싱 또는 전송 중인 파일 수'),
+}
+
+METRICS = Metrics(METRIC_HELP)
+_STAGE_TIMINGS = threading.local() # 현재 스레드에서 파싱 중인 파일의 단계별 소요 시간 (parse_file_task에서 설정)
+
+
+@contextmanager
+def stage_timer(stage):
+    """
+    블록의 소요 시간을 현재 파싱 중인 파일의 단계별 시간에 더함. (파싱 프로세스에서도 결과와 함께 메인 프로세스로 전달)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = getattr(_STAGE_TIMINGS, 'current', None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def record_parse_metrics(parsed):
+    """
+    parse_file_task 결과에 담긴 단계별 소요 시간과 행 수를 지표에 기록.
+    """
+    for stage, seconds in parsed.get('timings', {}).items():
+        METRICS.observe('worker_stage_seconds', seconds, stage=stage)
+    METRICS.inc('worker_rows_total', sum(len(sheet['times']) for sheet in parsed['sheets']))
+
+
+def print_cycle_summary(before, elapsed):
+    """
+    사이클 시작 시점의 snapshot()과 비교하여, 이번 사이클의 처리량과 단계별 소요 시간을 한 줄로 출력.
+    """
+    after = METRICS.snapshot()
+    ok_files = counter_delta(before, after, 'worker_files_total', result='ok')
+    failed_files = counter_delta(before, after, 'worker_files_total', result='fail')
+    rows = counter_delta(before, after, 'worker_rows_total')
+    ok_values = counter_delta(before, after, 'worker_values_written_total', result='ok')
+    failed_values = counter_delta(before, after, 'worker_values_written_total', result='fail')
+    summary = (f"파일 {ok_files}개(실패 {failed_files}), 행 {rows}개({rows / max(elapsed, 1e-9):.1f}행/초), "
+               f"값 {ok_values}개(실패 {failed_values}), 소요 {elapsed:.2f}초")
+
+    buckets, total, count = histogram_delta(before, after, 'worker_opc_write_seconds')
+    if count:
+        summary += (f", Write 요청 {count}회(평균 {total / count * 1000:.1f}ms, "
+                    f"p95 {histogram_quantile(buckets, count, 0.95) * 1000:.0f}ms 이하)")
+    stage_averages = []
+    for stage in ('load', 'time_parse', 'encode', 'write'):
+        _, total, count = histogram_delta(before, after, 'worker_stage_seconds', stage=stage)
+        if count:
+            stage_averages.append(f"{stage} {total / count * 1000:.0f}ms")
+    if stage_averages:
+        summary += f", 파일당 평균({', '.join(stage_averages)})"
+    buckets, _, count = histogram_delta(before, after, 'worker_file_lag_seconds')
+    if count:
+        summary += f", 파일 지연 p95 {histogram_quantile(buckets, count, 0.95):g}초 이하"
+    print(f"[INFO] 사이클 요약: {summary}")
+
+
+def start_metrics_listener(port):
+    """
+    성능 지표를 Prometheus 텍스트 형식으로 제공하는 HTTP 서버(GET /metrics)를 시작.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = METRICS.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # 요청마다 로그를 남기지 않음
+
+    host = CONFIG.get('metrics_host', '0.0.0.0')
+    server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-listener", daemon=True).start()
+    print(f"[INFO] 성능 지표 제공 중: http://{host}:{server.server_address[1]}/metrics")
+    return server
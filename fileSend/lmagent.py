@@ -1,7 +1,7 @@
 #-*- coding: utf-8 -*-
 # lmagent.py
 # 이 스크립트는 설정 파일(config.json)에 지정된 경로를 주기적으로 스캔함.
-# 마지막으로 확인한 시간(lastchktime) 이후에 수정된 파일을 찾아내어,
+# 로컬 파일 인덱스(file_index.json)와 비교하여 새로 생겼거나 내용이 바뀐 파일을 찾아내어,
 # 지정된 게이트웨이(gateway_url)로 HTTP POST를 통해 전송하는 에이전트 역할을 함.
 
 import sys
@@ -13,6 +13,34 @@ import os
 import requests
 import logging
 import re
+import io
+import gzip
+import tarfile
+import tempfile
+import struct
+import hashlib
+import operator
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+# 선택 라이브러리: blocks 방식 델타의 약한 체크섬 검색을 벡터화 (없으면 한 바이트씩 계산하므로 delta_block_max_size를 낮춰 적용)
+# pip install numpy
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# numpy가 없을 때 blocks 방식 델타를 계산할 최대 파일 크기 (한 바이트씩 계산하면 1MB당 약 0.7초가 걸림)
+PURE_PYTHON_BLOCK_MAX_SIZE = 2 * 1024 * 1024
+
+# 게이트웨이 전송에 사용하는 HTTP 세션. (keep-alive 연결을 주기 간에 재사용하기 위해 get_http_session()으로 한 번만 생성)
+HTTP_SESSION = None
+HTTP_SESSION_SIZE = 0
+HTTP_SESSION_LOCK = threading.Lock()
+
+# 전송 완료된 파일의 지문을 기록하는 로컬 인덱스 (get_file_index()로 한 번만 생성)
+FILE_INDEX = None
 
 def timefmt(t):
     # time.time() 등으로 얻어온 타임스탬프 값을 'Y-m-d H:M:S' 형태의 문자열로 변환하는 함수이다.
@@ -30,10 +58,85 @@ def getValue(obj, key, defval):
     else:
         return defval
 
-def get_files_to_send(paths_str, dataids_str, headerlines_str, columnlines_str, fexts_str, last_check_time):
+class FileIndex:
+    # scan_path별로 전송 완료된 파일의 지문 [크기, mtime_ns, inode, 내용 해시]를 기록하는 로컬 인덱스이다.
+    # 파일 이름 -> 지문 형태로 경로마다 따로 저장하며, 전송 주기가 끝날 때 한 번만 파일에 기록한다.
+    # 인덱스를 기록할 때 이미 전송을 마친 시각(seed_time)도 함께 기록하여, 나중에 추가된 경로의 초기 기준으로 사용한다.
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.paths = {}  # scan_path -> {파일 이름: [크기, mtime_ns, inode, 내용 해시]}
+        self.seed_time = None  # 이 시각까지 수정된 파일은 모두 전송을 마친 것으로 볼 수 있는 시각 (타임스탬프)
+        self.dirty = False
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data.get('paths'), dict) and 'seed_time' in data:
+                    self.paths = data['paths']
+                    self.seed_time = data['seed_time']
+                else:
+                    # 이전 버전의 인덱스 ({scan_path: {...}} 형식)
+                    self.paths = data
+                logging.info("파일 인덱스 로드: {} (경로 {}개)".format(index_file, len(self.paths)))
+            except Exception as e:
+                # 인덱스가 손상된 경우 빈 인덱스로 시작. (경로별로 lastchktime 기준 초기화가 다시 적용됨)
+                logging.error("파일 인덱스({}) 로드 중 오류 발생. 새로 생성합니다: {}".format(index_file, e))
+                self.paths = {}
+                self.seed_time = None
+
+    def has_path(self, directory):
+        return directory in self.paths
+
+    def get(self, directory, name):
+        return self.paths.get(directory, {}).get(name)
+
+    def update(self, directory, name, fingerprint):
+        self.paths.setdefault(directory, {})[name] = fingerprint
+        self.dirty = True
+
+    def prune(self, directory, names):
+        # 폴더에서 사라진 파일의 기록을 삭제.
+        entries = self.paths.setdefault(directory, {})
+        for name in [name for name in entries if name not in names]:
+            del entries[name]
+            self.dirty = True
+
+    def save(self, seed_time=None):
+        # 변경된 내용이 있을 때만 임시 파일에 쓴 뒤 교체하여, 기록 도중 종료되어도 인덱스가 손상되지 않게 한다.
+        # seed_time이 주어지면 인덱스와 함께 기록하여, 인덱스에 없는 경로를 처음 스캔할 때 lastchktime 대신 사용한다.
+        if not self.dirty:
+            return
+        if seed_time is not None:
+            self.seed_time = max(seed_time, self.seed_time or 0)
+        temp_file = self.index_file + ".tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump({'seed_time': self.seed_time, 'paths': self.paths}, f, ensure_ascii=False)
+            os.replace(temp_file, self.index_file)
+            self.dirty = False
+        except Exception as e:
+            logging.error("파일 인덱스({}) 저장 중 오류 발생: {}".format(self.index_file, e))
+
+def get_file_index(index_file):
+    # 파일 인덱스를 한 번만 로드하여 반환하는 함수이다.
+    global FILE_INDEX
+    if FILE_INDEX is None or FILE_INDEX.index_file != index_file:
+        FILE_INDEX = FileIndex(index_file)
+    return FILE_INDEX
+
+def hash_file(file_path, prefix_size=None):
+    # 파일 내용의 SHA-1 해시와, 앞부분 prefix_size바이트의 SHA-1 해시를 한 번 읽어서 계산하는 함수이다.
+    # (큰 파일도 1MB씩 나누어 읽음. 앞부분 해시는 append 방식 델타의 기준 확인에 사용)
+    with open(file_path, 'rb') as f:
+        return FileRanges(f, [(0, os.fstat(f.fileno()).st_size)]).digests(prefix_size)
+
+def get_files_to_send(paths_str, dataids_str, headerlines_str, columnlines_str, fexts_str, file_index, last_check_time, hash_files):
     # 전송해야 할 파일 목록을 찾아내는 함수이다.
-    # 마지막 확인 시간(last_check_time) 이후에 수정된 파일만 대상으로 한다.
-    
+    # os.scandir로 얻은 크기/수정 시간(mtime_ns)/inode를 파일 인덱스와 비교하여, 새 파일과 바뀐 파일만 대상으로 한다.
+    # 크기나 수정 시간이 바뀐 파일은 내용 해시(hash_files)까지 비교하여, 내용이 같으면(복사, 수정 시간만 변경 등) 전송하지 않는다.
+    # (비교할 해시가 없는 새 파일은 어차피 전송하므로 여기서 해시를 계산하지 않고, 전송할 때 한 번만 계산한다)
+    # 인덱스에 아직 없는 경로는 처음 한 번만 마지막 확인 시간(last_check_time)까지 수정된 파일을 전송된 것으로 기록한다.
+
     files_to_send = []  # 전송 대상 파일 정보를 담을 리스트.
     
     # 설정 파일에 콤마(,)로 구분된 여러 경로가 있을 수 있으므로 분리해서 처리.
@@ -49,69 +152,648 @@ def get_files_to_send(paths_str, dataids_str, headerlines_str, columnlines_str,
     for index, directory in enumerate(paths):
         logging.info("get_files_to_send: 경로 확인 중: {}".format(directory))
         try:
-            # 해당 디렉토리의 파일 목록을 가져온다.
-            files = os.listdir(directory)
-            logging.info("get_files_to_send: 경로에서 {}개의 파일을 찾음: {}".format(len(files), directory))
+            # 해당 디렉토리의 항목 목록을 가져온다. (Windows에서는 크기/수정 시간이 목록과 함께 조회되어 파일별 stat 호출이 없음)
+            with os.scandir(directory) as it:
+                entries = list(it)
+            logging.info("get_files_to_send: 경로에서 {}개의 파일을 찾음: {}".format(len(entries), directory))
         except Exception as e:
             logging.error("디렉토리({}) 확인 중 오류 발생: {}".format(directory, e))
-            continue  # 접근할 수 없는 디렉토리는 건너뛴다.
+            continue  # 접근할 수 없는 디렉토리는 건너뛴다. (인덱스 기록도 그대로 유지)
 
         dataid = dataids[index]
         headerline = headerlines[index] # 현재 경로에 맞는 headerline을 가져옴
         columnline = columnlines[index] # 현재 경로에 맞는 columnline을 가져옴
+        # 인덱스에 없는 경로는 lastchktime(또는 인덱스에 기록된 seed_time) 이전 파일을 전송된 것으로 기록
+        seeding = not file_index.has_path(directory)
+        seed_time = max(last_check_time, file_index.seed_time or 0)
+        present = set()
+        counts = {'new': 0, 'changed': 0, 'identical': 0, 'unchanged': 0}
         # 디렉토리 내의 각 파일에 대해 처리.
-        for file in files:
+        for entry in entries:
             # 파일 이름과 확장자를 소문자로 분리.
-            fname, fext = os.path.splitext(file.lower())
+            fname, fext = os.path.splitext(entry.name.lower())
             
             # 엑셀 등에서 작업 시 생성되는 임시 파일(~$로 시작)은 건너뛴다.
             if fname.startswith("~$"):
                 continue
 
-            file_path = os.path.join(directory, file)
-            # 해당 경로가 디렉토리가 아니고, 스캔 대상 확장자(fexts)에 포함되는지 확인.
-            if (not os.path.isdir(file_path)) and (fext in fexts):
+            file_path = os.path.join(directory, entry.name)
+            try:
+                # 해당 경로가 디렉토리가 아니고, 스캔 대상 확장자(fexts)에 포함되는지 확인.
+                if entry.is_dir() or fext not in fexts:
+                    continue
+                st = entry.stat()
+            except FileNotFoundError:
+                # 스캔 도중 파일이 삭제되는 경우를 대비한 예외 처리.
+                logging.warning("스캔 중 파일을 찾을 수 없음: {}".format(file_path))
+                continue
+
+            present.add(entry.name)
+            # inode는 Windows의 scandir 결과에서 0이므로 크기/수정 시간으로 비교됨.
+            fingerprint = [st.st_size, st.st_mtime_ns, st.st_ino, None]
+            known = file_index.get(directory, entry.name)
+            if known and known[:3] == fingerprint[:3]:
+                counts['unchanged'] += 1
+                continue
+            if seeding and st.st_mtime <= seed_time:
+                file_index.update(directory, entry.name, fingerprint)
+                counts['unchanged'] += 1
+                continue
+            prefix_hash = None
+            if hash_files and known and known[3] is not None:
                 try:
-                    # 파일의 최종 수정 시간을 타임스탬프로 가져온다.
-                    mtime = os.path.getmtime(file_path)
-                    # 파일의 수정 시간이 마지막 확인 시간과 같거나 최신인 경우. (중복은 메인 로직에서 제거)
-                    if mtime >= last_check_time:
-                        # 전송 목록에 파일 정보(경로, 데이터 ID, 헤더라인, 수정 시간)를 추가.
-                        files_to_send.append({
-                            'file_path': file_path,
-                            'dataid': dataid,
-                            'headerline': headerline,
-                            'columnline': columnline,
-                            'mtime': mtime
-                        })
-                except FileNotFoundError:
-                    # 스캔 도중 파일이 삭제되는 경우를 대비한 예외 처리.
-                    logging.warning("스캔 중 파일을 찾을 수 없음: {}".format(file_path))
+                    fingerprint[3], prefix_hash = hash_file(file_path, known[0] if known[0] < st.st_size else None)
+                except OSError as e:
+                    # 다른 프로그램이 파일을 사용 중인 경우 등. 다음 주기에 다시 확인한다.
+                    logging.warning("파일({}) 해시 계산 중 오류 발생. 다음 주기에 다시 확인합니다: {}".format(file_path, e))
                     continue
+                if known[3] == fingerprint[3]:
+                    # 내용이 같은 파일은 지문만 갱신하고 전송하지 않음.
+                    file_index.update(directory, entry.name, fingerprint)
+                    counts['identical'] += 1
+                    continue
+            counts['changed' if known else 'new'] += 1
+            # 전송 목록에 파일 정보(경로, 데이터 ID, 헤더라인, 수정 시간, 인덱스에 기록할 지문)를 추가.
+            files_to_send.append({
+                'file_path': file_path,
+                'scan_path': directory,
+                'name': entry.name,
+                'dataid': dataid,
+                'headerline': headerline,
+                'columnline': columnline,
+                'mtime': st.st_mtime,
+                'fingerprint': fingerprint,
+                'base_hash': known[3] if known else None, # 마지막으로 전송한 버전의 내용 해시 (델타 전송 기준)
+                'base_size': known[0] if known else None, # 마지막으로 전송한 버전의 크기
+                'prefix_hash': prefix_hash # 파일 앞부분 base_size바이트의 내용 해시 (append 방식 델타 확인용)
+            })
+
+        file_index.prune(directory, present)
+        logging.info("get_files_to_send: 새 파일 {new}개, 변경된 파일 {changed}개, 내용이 같은 파일 {identical}개, 변경 없음 {unchanged}개".format(**counts))
     
     # 전송할 파일들을 수정 시간(mtime) 기준으로 오름차순 정렬. (오래된 파일부터 보내기 위함)
     files_to_send.sort(key=lambda x: x['mtime'])
     return files_to_send
 
-def update_lastchktime_in_config(new_time_float):
-    # config.json 파일의 lastchktime 값을 안전하게 업데이트하는 함수이다.
+def get_http_session(pool_size):
+    # 커넥션 풀을 가진 HTTP 세션을 반환하는 함수이다.
+    # 동시 전송 수(pool_size)만큼 게이트웨이와의 연결을 유지하여, 파일마다 새로 연결하지 않는다.
+    # 설정 변경으로 동시 전송 수가 바뀐 경우에만 세션을 다시 만든다.
+    global HTTP_SESSION, HTTP_SESSION_SIZE
+    with HTTP_SESSION_LOCK:
+        if HTTP_SESSION is None or HTTP_SESSION_SIZE != pool_size:
+            if HTTP_SESSION is not None:
+                HTTP_SESSION.close()
+            session = requests.Session()
+            # 재시도는 upload_with_retry에서 백오프와 함께 처리하므로 어댑터의 자동 재시도는 사용하지 않음.
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            HTTP_SESSION = session
+            HTTP_SESSION_SIZE = pool_size
+        return HTTP_SESSION
+
+def rolling_checksum(block):
+    # rsync 방식의 약한 체크섬 (a, b)를 계산하는 함수이다. (lmfilerecv의 rolling_checksum과 같은 값이어야 함)
+    a = sum(block) % 65536
+    b = sum(map(operator.mul, range(len(block), 0, -1), block)) % 65536
+    return a, b
+
+class WeakChecksumSearch:
+    # data의 각 위치에서 시작하는 block_size바이트 구간의 약한 체크섬을 numpy로 구간(chunk_positions개 위치)씩 한 번에 계산하여,
+    # 수신 서버의 블록과 약한 체크섬이 같은 위치만 차례로 찾는다. (rolling_checksum과 같은 값)
+    # a(k) = S[k+L] - S[k], b(k) = (L + k) * a(k) - (T[k+L] - T[k]) (S, T는 바이트와 위치 * 바이트의 누적합, 65536으로 나눈 나머지 적용 전)
+    def __init__(self, data, block_size, weak_keys, chunk_positions=1024 * 1024):
+        self.data = np.frombuffer(data, dtype=np.uint8)
+        self.block_size = block_size
+        self.keys = np.unique(np.fromiter(weak_keys, dtype=np.int64))
+        self.a_table = np.zeros(65536, dtype=bool)  # 블록들의 a 값 (a가 같은 위치만 전체 체크섬을 비교)
+        self.a_table[self.keys & 0xFFFF] = True
+        self.chunk_positions = chunk_positions
+        self.last_start = len(data) - block_size  # 블록 하나가 들어가는 마지막 시작 위치
+        self.chunk_end = 0  # 계산한 구간의 끝 (이 위치 앞까지 계산함)
+        self.positions = np.empty(0, dtype=np.int64)
+        self.weaks = np.empty(0, dtype=np.int64)
+
+    def _compute(self, start):
+        end = min(start + self.chunk_positions, self.last_start + 1)
+        values = self.data[start:end + self.block_size - 1].astype(np.int64)
+        sums = np.concatenate(([0], np.cumsum(values)))
+        weighted = np.concatenate(([0], np.cumsum(values * np.arange(start, start + len(values), dtype=np.int64))))
+        a = sums[self.block_size:] - sums[:-self.block_size]
+        found = np.flatnonzero(self.a_table[a % 65536])
+        a = a[found]
+        b = (found + start + self.block_size) * a - (weighted[found + self.block_size] - weighted[found])
+        weaks = ((b % 65536) << 16) | (a % 65536)
+        matched = self.keys[np.minimum(np.searchsorted(self.keys, weaks), len(self.keys) - 1)] == weaks
+        self.positions = found[matched] + start
+        self.weaks = weaks[matched]
+        self.chunk_end = end
+
+    def next_from(self, pos):
+        # pos 이상이면서 약한 체크섬이 같은 첫 위치와 그 체크섬을 반환한다. (없으면 None)
+        while pos <= self.last_start:
+            if pos >= self.chunk_end:
+                self._compute(pos)
+            i = int(np.searchsorted(self.positions, pos))
+            if i < len(self.positions):
+                return int(self.positions[i]), int(self.weaks[i])
+            pos = self.chunk_end
+        return None
+
+class FileRanges:
+    # 열린 파일의 여러 구간 [(위치, 길이)]을 이어 붙인 전송 본문이다.
+    # 본문 전체를 메모리에 올리지 않고, 전송하는 조각만 그때그때 파일에서 읽는다.
+    def __init__(self, f, ranges):
+        self.f = f
+        self.ranges = [(offset, length) for offset, length in ranges if length > 0]
+        self.size = sum(length for _, length in self.ranges)
+
+    def read_at(self, pos, length):
+        # 본문의 pos 위치부터 length바이트를 읽는다. (전송 중 파일이 줄어들면 OSError)
+        parts = []
+        for offset, range_length in self.ranges:
+            if length <= 0:
+                break
+            if pos >= range_length:
+                pos -= range_length
+                continue
+            take = min(range_length - pos, length)
+            self.f.seek(offset + pos)
+            data = self.f.read(take)
+            if len(data) != take:
+                raise OSError("전송 중 파일이 줄어들었습니다")
+            parts.append(data)
+            length -= take
+            pos = 0
+        return b''.join(parts)
+
+    def chunks(self, chunk_size=1024 * 1024):
+        for pos in range(0, self.size, chunk_size):
+            yield self.read_at(pos, min(chunk_size, self.size - pos))
+
+    def sha1(self):
+        return self.digests()[0]
+
+    def digests(self, prefix_size=None):
+        # 본문 전체의 SHA-1과 앞부분 prefix_size바이트의 SHA-1을 한 번 읽어서 계산한다. (prefix_size가 없거나 본문보다 길면 None)
+        digest = hashlib.sha1()
+        prefix = None
+        pos = 0
+        for chunk in self.chunks():
+            if prefix is None and prefix_size is not None and pos <= prefix_size <= pos + len(chunk):
+                digest.update(chunk[:prefix_size - pos])
+                prefix = digest.hexdigest()
+                digest.update(chunk[prefix_size - pos:])
+            else:
+                digest.update(chunk)
+            pos += len(chunk)
+        return digest.hexdigest(), prefix
+
+def compress_payload(source):
+    # 본문을 임시 파일에 gzip으로 압축하여 FileRanges로 반환하는 함수이다. (사용 후 반환값의 f를 닫아야 함)
+    # 같은 본문이 항상 같은 압축 결과가 되도록 mtime을 고정한다. (분할 업로드 이어서 보내기에 필요)
+    spool = tempfile.TemporaryFile()
     try:
-        # 설정 파일을 읽어서 JSON 객체로 로드.
-        with open("config.json", "r", encoding="utf-8") as f:
-            config = json.load(f)
-        
-        # float 타임스탬프를 밀리초까지 포함하는 문자열로 변환
-        new_time_str = datetime.datetime.fromtimestamp(new_time_float).strftime('%Y-%m-%d %H:%M:%S.%f')
-        config['lastchktime'] = new_time_str
-        
-        # 수정된 config 객체를 다시 파일에 덮어쓴다. (indent=2로 가독성 좋게 저장)
-        # ensure_ascii=False로 한글이 깨지지 않게 저장
-        with open("config.json", "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        logging.info("lastchktime 값을 다음으로 업데이트: {}".format(new_time_str))
-    except Exception as e:
-        logging.error("config.json 업데이트 중 오류 발생: {}".format(e))
+        with gzip.GzipFile(fileobj=spool, mode='wb', compresslevel=6, mtime=0) as gz:
+            for chunk in source.chunks():
+                gz.write(chunk)
+        return FileRanges(spool, [(0, spool.tell())])
+    except BaseException:
+        spool.close()
+        raise
+
+def append_delta(f, size, base_size, base_sha1, fext, prefix_sha1=None):
+    # 뒤에 행이 추가되기만 하는 CSV/DBF 파일(열린 파일 f, 크기 size)의 델타(추가된 구간)를 만드는 함수이다.
+    # prefix_sha1은 이미 계산한 파일 앞부분 base_size바이트의 SHA-1이며, 없으면 파일을 다시 읽어 계산한다.
+    # 델타는 (명령 목록, 새 데이터 구간 목록)이며, 명령은 ["copy", 기존 파일 위치, 길이] 또는 ["data", 길이]이고
+    # 새 데이터 구간은 파일의 [위치, 길이]이다. 기존 파일 뒤에 추가된 형태가 아니면 None을 반환한다.
+    if fext == '.dbf':
+        # DBF는 헤더의 레코드 수/수정 날짜가 바뀌고 파일 끝 표시(0x1A) 자리에 새 레코드가 쓰이므로,
+        # 헤더는 새로 보내고 기존 레코드 구간만 복사한다. (일치 여부는 수신 서버가 재구성 후 SHA-1로 확인)
+        f.seek(0)
+        head = f.read(12)
+        if len(head) < 12:
+            return None
+        header_len, record_len = struct.unpack('<HH', head[8:12])
+        if record_len <= 0 or base_size < header_len:
+            return None
+        body_end = header_len + (base_size - header_len) // record_len * record_len
+        if body_end > size:
+            return None
+        return ([["data", header_len], ["copy", header_len, body_end - header_len], ["data", size - body_end]],
+                [(0, header_len), (body_end, size - body_end)])
+    if size < base_size:
+        return None
+    if prefix_sha1 is None:
+        prefix_sha1 = FileRanges(f, [(0, base_size)]).sha1()
+    if prefix_sha1 != base_sha1:
+        return None
+    return [["copy", 0, base_size], ["data", size - base_size]], [(base_size, size - base_size)]
+
+def block_delta(data, blocks, base_size, block_size, max_literal):
+    # 수신 서버의 블록별 체크섬(blocks)을 이용해 rsync 방식의 델타를 만드는 함수이다.
+    # 블록 경계에서 먼저 MD5로 같은 블록을 찾고, 없으면 한 바이트씩 이동하며 약한 체크섬이 같은 블록을 찾는다.
+    # (numpy가 있으면 약한 체크섬을 WeakChecksumSearch로 한꺼번에 계산하여 같은 위치만 MD5로 확인한다)
+    # 델타는 append_delta와 같은 (명령 목록, 새 데이터 구간 목록)이다.
+    # 새 데이터가 max_literal 바이트를 넘으면 전체 파일을 보내는 편이 나으므로 None을 반환한다.
+    strong_index = {}
+    weak_index = {}
+    for index, (weak, strong) in enumerate(blocks):
+        strong_index.setdefault(strong, index)
+        if min(block_size, base_size - index * block_size) == block_size:
+            weak_index.setdefault(weak, []).append(index)
 
+    ops = []
+    pieces = []
+    literal_total = 0
+
+    def add_copy(index, length):
+        offset = index * block_size
+        if ops and ops[-1][0] == "copy" and ops[-1][1] + ops[-1][2] == offset:
+            ops[-1][2] += length
+        else:
+            ops.append(["copy", offset, length])
+
+    def add_literal(start, end):
+        if end > start:
+            ops.append(["data", end - start])
+            pieces.append((start, end - start))
+
+    n = len(data)
+    pos = 0
+    literal_start = 0
+    search = WeakChecksumSearch(data, block_size, weak_index) if np is not None and weak_index else None
+    while pos < n:
+        # 블록 경계 위치에서 같은 블록이 있는지 먼저 확인
+        index = strong_index.get(hashlib.md5(data[pos:pos + block_size]).hexdigest())
+        if index is not None:
+            length = min(block_size, n - pos)
+            add_literal(literal_start, pos)
+            add_copy(index, length)
+            pos += length
+            literal_start = pos
+            continue
+        if n - pos < block_size:
+            break
+        if search is not None:
+            # 약한 체크섬이 같은 위치만 차례로 MD5 확인
+            index = None
+            found = search.next_from(pos)
+            while found is not None:
+                pos, weak = found
+                if literal_total + pos - literal_start > max_literal:
+                    return None
+                strong = hashlib.md5(data[pos:pos + block_size]).hexdigest()
+                index = next((i for i in weak_index[weak] if blocks[i][1] == strong), None)
+                if index is not None:
+                    break
+                found = search.next_from(pos + 1)
+            if index is None:
+                pos = n
+        else:
+            # 한 바이트씩 이동하며 약한 체크섬으로 같은 블록 찾기
+            a, b = rolling_checksum(data[pos:pos + block_size])
+            while True:
+                candidates = weak_index.get((b << 16) | a)
+                if candidates:
+                    strong = hashlib.md5(data[pos:pos + block_size]).hexdigest()
+                    index = next((i for i in candidates if blocks[i][1] == strong), None)
+                    if index is not None:
+                        break
+                if pos + block_size >= n:
+                    pos = n
+                    break
+                out_byte = data[pos]
+                a = (a - out_byte + data[pos + block_size]) % 65536
+                b = (b - block_size * out_byte + a) % 65536
+                pos += 1
+                if literal_total + pos - literal_start > max_literal:
+                    return None
+        if pos >= n:
+            break
+        literal_total += pos - literal_start
+        add_literal(literal_start, pos)
+        add_copy(index, block_size)
+        pos += block_size
+        literal_start = pos
+
+    if literal_total + n - literal_start > max_literal:
+        return None
+    add_literal(literal_start, n)
+    return ops, pieces
+
+def chunked_upload(session, gateway_url, params, fname, source, options):
+    # 큰 본문(source)을 upload_chunk_size 단위 조각으로 나누어 수신 서버의 분할 업로드(/opcUpload)로 전송하는 함수이다.
+    # 같은 본문은 항상 같은 업로드가 되므로, 연결이 끊기거나 재시도/재시작하면 수신 서버가 확인한 위치부터 이어서 보낸다.
+    # 조각은 보낼 때마다 파일에서 읽으므로 메모리에는 조각 하나만 올라간다.
+    # 완료 요청의 HTTP 상태 코드를 반환하며, 수신 서버가 분할 업로드를 지원하지 않으면 None을 반환한다.
+    upload_url = gateway_url.rsplit('/', 1)[0] + '/opcUpload'
+    open_params = dict(params, size=source.size, payload_sha1=source.sha1())
+    response = session.post(url=upload_url, timeout=options['timeout'], data=open_params)
+    if response.status_code in (404, 405):
+        logging.warning("수신 서버가 분할 업로드를 지원하지 않아 한 번에 전송합니다: {}".format(fname))
+        return None
+    if response.status_code != 200:
+        return response.status_code
+    info = response.json()
+    upload_id = info['upload_id']
+    offset = info['offset']
+    if offset:
+        logging.info("분할 업로드를 이어서 전송합니다: {} ({}/{}바이트)".format(fname, offset, source.size))
+
+    chunk_url = "{}/{}".format(upload_url, upload_id)
+    while offset < source.size:
+        chunk = source.read_at(offset, min(options['chunk_size'], source.size - offset))
+        response = session.put(url=chunk_url, timeout=options['timeout'], params={'offset': offset}, data=chunk,
+                               headers={'X-Chunk-SHA1': hashlib.sha1(chunk).hexdigest()})
+        if response.status_code in (200, 409):
+            # 409는 수신 서버가 확인한 위치가 다른 경우 (이전 요청의 응답을 받지 못한 경우 등). 그 위치부터 이어서 보냄.
+            offset = response.json()['offset']
+        else:
+            return response.status_code
+
+    response = session.post(url=chunk_url + '/commit', timeout=options['timeout'])
+    return response.status_code
+
+def post_payload(session, gateway_url, params, fname, source, options):
+    # 파일(또는 델타) 본문(source)을 게이트웨이로 전송하고 HTTP 상태 코드를 반환하는 함수이다. (upload_compress 설정 시 gzip 압축)
+    # 본문이 upload_chunk_size보다 크면 분할 업로드로 전송하고, 그 이하만 한 번에 읽어 전송한다.
+    compressed = None
+    if options['compress']:
+        compressed = source = compress_payload(source)
+        params = dict(params, encoding='gzip')
+    try:
+        if 0 < options['chunk_size'] < source.size:
+            status = chunked_upload(session, gateway_url, params, fname, source, options)
+            if status is not None:
+                return status
+        # HTTP POST 요청으로 파일 전송.
+        response = session.post(url=gateway_url, timeout=options['timeout'], data=params,
+                                files={'filename': (fname, source.read_at(0, source.size))})
+        return response.status_code
+    finally:
+        if compressed is not None:
+            compressed.f.close()
+
+def request_delta(session, gateway_url, params, f, size, sha1, f_info, mode, options):
+    # 수신 서버에 저장된 파일 정보를 조회하여 열린 파일 f(크기 size)의 델타를 만드는 함수이다.
+    # 수신 서버에 이미 같은 파일이 있으면 'same', 델타를 만들 수 없거나 이득이 없으면 None,
+    # 그 외에는 (명령 목록, 새 데이터 구간 목록, 수신 서버의 기준 파일 SHA-1)을 반환한다.
+    signature_url = gateway_url.rsplit('/', 1)[0] + '/opcFileSignature'
+    query = {
+        'deviceid': params['deviceid'],
+        'dataid': params['dataid'],
+        'orgfilename': params['orgfilename'],
+        'base_sha1': f_info['base_hash'] or '',
+        'block_size': options['block_size'] if mode == 'blocks' else 0
+    }
+    response = session.post(url=signature_url, timeout=options['timeout'], data=query)
+    if response.status_code != 200:
+        # 델타 전송을 지원하지 않는 이전 버전의 수신 서버 등
+        logging.warning("수신 서버 파일 정보 조회 실패(상태 코드: {}). 전체 파일을 전송합니다: {}".format(response.status_code, params['orgfilename']))
+        return None
+    info = response.json()
+    if not info.get('exists'):
+        return None
+    if info['sha1'] == sha1:
+        return 'same'
+    if not info.get('match'):
+        logging.info("수신 서버의 파일이 마지막으로 전송한 버전과 다릅니다. 수신 서버의 파일을 기준으로 델타를 만듭니다: {}".format(params['orgfilename']))
+
+    fext = os.path.splitext(params['orgfilename'].lower())[1]
+    max_literal = int(size * options['max_literal'])
+    if mode == 'append':
+        prefix_sha1 = f_info['prefix_hash'] if f_info.get('base_size') == info['size'] else None
+        delta = append_delta(f, size, info['size'], info['sha1'], fext, prefix_sha1)
+    else:
+        # blocks 방식은 delta_block_max_size 이하의 파일만 사용하므로 파일 전체를 읽어 계산
+        f.seek(0)
+        delta = block_delta(f.read(size), info.get('blocks', []), info['size'], options['block_size'], max_literal)
+    if delta is None or sum(length for _, length in delta[1]) > max_literal:
+        return None
+    return delta[0], delta[1], info['sha1']
+
+def file_params(deviceid, f_info, sha1):
+    # 파일과 함께 보낼 파라미터를 준비하는 함수이다. (sha1은 수신 서버가 저장 전 파일을 검증하는 데 사용)
+    return {
+        'deviceid': deviceid,
+        'dataid': f_info['dataid'],
+        'path': f_info['dataid'], # 원본 로직에 따라 path를 dataid로 설정.
+        'orgfilename': os.path.basename(f_info['file_path']),
+        'headerline': f_info['headerline'], # 매칭된 headerline 파라미터 추가
+        'columnline': f_info['columnline'],
+        'params': "deviceid,dataid,filename,path,orgfilename,headerline,columnline",
+        'sha1': sha1
+    }
+
+def upload_file(session, gateway_url, deviceid, f_info, options):
+    # 파일 하나를 게이트웨이로 전송하고, 성공(HTTP 200) 여부를 반환하는 함수이다.
+    # delta_formats에 해당하는 파일은 수신 서버에 있는 이전 버전과의 차이(델타)만 전송하고,
+    # 델타를 만들 수 없거나 수신 서버의 검증에 실패(409)하면 전체 파일을 전송한다.
+    # 파일은 전송하는 조각 단위로 읽으며, 전송 중 파일이 바뀌면 수신 서버의 SHA-1 검증에 실패하여 다음 주기에 다시 전송된다.
+    fname = os.path.basename(f_info['file_path'])
+    # 파일을 바이너리 읽기 모드('rb')로 연다.
+    with open(f_info['file_path'], 'rb') as sendfile:
+        st = os.fstat(sendfile.fileno())
+        size = st.st_size
+        whole = FileRanges(sendfile, [(0, size)])
+        fingerprint = f_info['fingerprint']
+        if fingerprint[3] is not None and fingerprint[:2] == [size, st.st_mtime_ns]:
+            # 스캔 이후 바뀌지 않은 파일은 스캔할 때 계산한 해시를 그대로 사용
+            sha1 = fingerprint[3]
+        else:
+            base_size = f_info.get('base_size')
+            sha1, f_info['prefix_hash'] = whole.digests(base_size if base_size is not None and base_size < size else None)
+        # 인덱스에는 실제로 전송한 내용의 해시를 기록 (다음 델타 전송의 기준)
+        fingerprint[3] = sha1
+        params = file_params(deviceid, f_info, sha1)
+
+        mode = options['delta_formats'].get(os.path.splitext(fname.lower())[1]) if options['delta'] else None
+        block_max_size = options['block_max_size'] if np is not None else min(options['block_max_size'], PURE_PYTHON_BLOCK_MAX_SIZE)
+        if mode == 'blocks' and size > block_max_size:
+            # 블록 차이 계산은 파일 전체를 읽어 체크섬을 비교하므로, 큰 파일(numpy가 없으면 PURE_PYTHON_BLOCK_MAX_SIZE 초과)은 전체 전송이 빠르다.
+            mode = None
+        if mode and size >= options['min_size']:
+            delta = request_delta(session, gateway_url, params, sendfile, size, sha1, f_info, mode, options)
+            if delta == 'same':
+                logging.info("수신 서버에 같은 파일이 있어 전송을 생략합니다: {}".format(fname))
+                return True
+            if delta is not None:
+                ops, ranges, base_sha1 = delta
+                payload = FileRanges(sendfile, ranges)
+                delta_params = dict(params, delta='1', base_sha1=base_sha1, ops=json.dumps(ops))
+                status = post_payload(session, gateway_url, delta_params, fname, payload, options)
+                if status == 200:
+                    logging.info("델타 전송 완료: {} (파일 {}바이트 중 {}바이트 전송)".format(fname, size, payload.size))
+                    return True
+                if status != 409:
+                    logging.error("델타 전송 실패: {}. 상태 코드: {}".format(fname, status))
+                    return False
+                logging.warning("수신 서버의 기준 파일이 다르거나 재구성한 파일의 검증에 실패했습니다. 전체 파일을 전송합니다: {}".format(fname))
+
+        status = post_payload(session, gateway_url, params, fname, whole, options)
+    if status == 200:
+        return True
+    logging.error("전송 실패: {}. 상태 코드: {}".format(fname, status))
+    return False
+
+def upload_with_retry(session, gateway_url, deviceid, f_info, options, retries, backoff):
+    # 전송에 실패하면 backoff초부터 두 배씩(최대 60초) 기다리며 retries번까지 다시 시도하는 함수이다.
+    # 끝내 실패한 파일은 False를 반환하며, 다음 주기에 다시 스캔되어 전송된다.
+    fname = os.path.basename(f_info['file_path'])
+    logging.info("파일 전송 시도: {} (수정 시간: {})".format(fname, timefmt(f_info['mtime'])))
+    for attempt in range(retries + 1):
+        try:
+            if upload_file(session, gateway_url, deviceid, f_info, options):
+                logging.info("성공적으로 전송 완료: {}.".format(fname))
+                return True
+        except FileNotFoundError:
+            # 스캔 이후 파일이 삭제된 경우. 다음 주기의 스캔 대상에서도 빠지므로 재시도하지 않음.
+            logging.warning("전송할 파일을 찾을 수 없음: {}".format(f_info['file_path']))
+            return False
+        except Exception as e:
+            # requests.post에서 발생할 수 있는 모든 예외(네트워크 오류 등)를 처리.
+            logging.error("파일({}) 전송 중 예외 발생 (시도 {}/{}): {}".format(fname, attempt + 1, retries + 1, e))
+        if attempt < retries:
+            delay = min(backoff * (2 ** attempt), 60)
+            logging.info("{}초 후 다시 전송합니다: {}".format(delay, fname))
+            time.sleep(delay)
+    logging.error("전송 재시도 횟수를 초과했습니다: {}. 다음 주기에 다시 시도합니다.".format(fname))
+    return False
+
+def build_batch(deviceid, batch, options):
+    # 여러 파일을 하나의 tar 스트림으로 묶는 함수이다. 파일별 파라미터는 tar 항목의 pax 헤더(LM.params)에 담는다.
+    # (tar 본문, 묶음에 포함된 파일 목록, 묶음에서 뺀 파일 목록)을 반환하며, 스캔 이후 삭제된 파일은 어느 목록에도 넣지 않는다.
+    # 묶음은 메모리에서 만들므로, 스캔 이후 파일이 커져도 본문이 batch_max_bytes를 넘지 않도록 넘치는 파일은 묶음에서 뺀다.
+    buffer = io.BytesIO()
+    included = []
+    deferred = []
+    total = 0
+    with tarfile.open(fileobj=buffer, mode='w:gz' if options['compress'] else 'w', format=tarfile.PAX_FORMAT) as archive:
+        for index, f_info in enumerate(batch):
+            try:
+                with open(f_info['file_path'], 'rb') as sendfile:
+                    size = os.fstat(sendfile.fileno()).st_size
+                    if total + size > options['batch_max_bytes']:
+                        deferred.append(f_info)
+                        continue
+                    # 확인한 크기까지만 읽음 (읽는 중에 덧붙여진 내용은 다음 주기에 전송)
+                    data = sendfile.read(size)
+            except FileNotFoundError:
+                logging.warning("전송할 파일을 찾을 수 없음: {}".format(f_info['file_path']))
+                continue
+            total += len(data)
+            sha1 = hashlib.sha1(data).hexdigest()
+            f_info['fingerprint'][3] = sha1
+            member = tarfile.TarInfo("{}/{}".format(index, os.path.basename(f_info['file_path'])))
+            member.size = len(data)
+            member.mtime = int(f_info['mtime'])
+            member.pax_headers = {'LM.params': json.dumps(file_params(deviceid, f_info, sha1), ensure_ascii=False)}
+            archive.addfile(member, io.BytesIO(data))
+            included.append(f_info)
+    return buffer.getvalue(), included, deferred
+
+def upload_batch_with_retry(session, gateway_url, deviceid, batch, options, retries, backoff):
+    # 작은 파일 여러 개를 묶음 업로드(/opcFileBatch) 요청 하나로 전송하는 함수이다. 파일별 성공 여부 목록을 반환한다.
+    # 수신 서버가 묶음 업로드를 지원하지 않거나 묶음이 거부(400/409)되면 파일별로 전송한다.
+    # batch_max_bytes를 넘어 묶음에서 뺀 파일은 묶음 전송 후 파일별로 전송한다.
+    batch_url = gateway_url.rsplit('/', 1)[0] + '/opcFileBatch'
+    logging.info("묶음 전송 시도: 파일 {}개 ({} ~ {})".format(len(batch), os.path.basename(batch[0]['file_path']), os.path.basename(batch[-1]['file_path'])))
+    payload, included, deferred = build_batch(deviceid, batch, options)
+    if deferred:
+        logging.info("묶음 최대 크기({}바이트)를 넘는 파일 {}개는 파일별로 전송합니다.".format(options['batch_max_bytes'], len(deferred)))
+    status = None
+    for attempt in range(retries + 1):
+        try:
+            response = session.post(url=batch_url, timeout=options['timeout'], data=payload,
+                                    params={'encoding': 'gzip'} if options['compress'] else None,
+                                    headers={'Content-Type': 'application/x-tar'})
+            status = response.status_code
+            if status == 200:
+                logging.info("묶음 전송 완료: 파일 {}개 ({}바이트)".format(len(included), len(payload)))
+                return [f_info in included or
+                        (f_info in deferred and upload_with_retry(session, gateway_url, deviceid, f_info, options, retries, backoff))
+                        for f_info in batch]
+            if status in (400, 404, 405, 409):
+                break
+            logging.error("묶음 전송 실패. 상태 코드: {}".format(status))
+        except Exception as e:
+            logging.error("묶음 전송 중 예외 발생 (시도 {}/{}): {}".format(attempt + 1, retries + 1, e))
+        if attempt < retries:
+            delay = min(backoff * (2 ** attempt), 60)
+            logging.info("{}초 후 묶음을 다시 전송합니다.".format(delay))
+            time.sleep(delay)
+
+    if status not in (400, 404, 405, 409):
+        logging.error("묶음 전송 재시도 횟수를 초과했습니다. 다음 주기에 다시 시도합니다.")
+        return [False] * len(batch)
+    logging.warning("묶음 전송을 사용할 수 없어(상태 코드: {}) 파일별로 전송합니다.".format(status))
+    return [(f_info in included or f_info in deferred) and
+            upload_with_retry(session, gateway_url, deviceid, f_info, options, retries, backoff)
+            for f_info in batch]
+
+def send_files(slist, gateway_url, deviceid, upload_workers, options, retries, backoff, file_index):
+    # 전송 목록(slist)을 최대 upload_workers개씩 동시에 전송하는 함수이다.
+    # 모든 scan_path의 파일을 수정 시간 순으로 한 작업 큐에 넣으므로, 여러 경로와 한 경로 안의 파일이 함께 전송된다.
+    # batch_file_size보다 작은 파일은 batch_max_files개 / batch_max_bytes바이트까지 묶어 요청 하나로 전송한다.
+    # 전송에 성공한 파일만 인덱스에 지문을 기록하므로, 실패한 파일은 다음 주기에 다시 전송 대상이 된다.
+    # 전송하지 못한 파일 목록을 반환한다.
+    # --- 5. 전송 성공/실패 처리 ---
+    session = get_http_session(upload_workers)
+    sent = 0
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+        futures = {}
+
+        def submit(files):
+            # 파일 하나는 upload_with_retry(성공 여부), 여러 개는 upload_batch_with_retry(파일별 성공 여부 목록)로 전송
+            if len(files) == 1:
+                future = executor.submit(upload_with_retry, session, gateway_url, deviceid, files[0], options, retries, backoff)
+            else:
+                future = executor.submit(upload_batch_with_retry, session, gateway_url, deviceid, files, options, retries, backoff)
+            futures[future] = files
+
+        batch = []
+        batch_bytes = 0
+        for f_info in slist:
+            size = f_info['fingerprint'][0]
+            if size >= options['batch_file_size']:
+                submit([f_info])
+                continue
+            if batch and (len(batch) >= options['batch_max_files'] or batch_bytes + size > options['batch_max_bytes']):
+                submit(batch)
+                batch = []
+                batch_bytes = 0
+            batch.append(f_info)
+            batch_bytes += size
+        if batch:
+            submit(batch)
+
+        for future in as_completed(futures):
+            files = futures[future]
+            results = future.result() if len(files) > 1 else [future.result()]
+            for f_info, ok in zip(files, results):
+                if ok:
+                    file_index.update(f_info['scan_path'], f_info['name'], f_info['fingerprint'])
+                    sent += 1
+                else:
+                    failed.append(f_info)
+
+    logging.info("전송 완료: {}개, 실패: {}개".format(sent, len(failed)))
+    return failed
+
+def send_heartbeat(gateway_url, deviceid, pending, lag, upload_workers):
+    # 게이트웨이에 살아있다는 신호(heartbeat)와 미전송 파일 수, 지연 시간(가장 오래된 미전송 파일의 수정 시간부터 지금까지, 초)을 보내는 함수이다.
+    heartbeat_url = gateway_url.rsplit('/', 1)[0] + '/opcHeartbeat'
+    try:
+        response = get_http_session(upload_workers).post(url=heartbeat_url, timeout=10,
+                                                         data={'deviceid': deviceid, 'pending': pending, 'lag': round(lag, 1)})
+        if response.status_code != 200:
+            logging.warning("Heartbeat 전송 실패. 상태 코드: {}".format(response.status_code))
+    except Exception as e:
+        logging.warning("Heartbeat 전송 오류: {}".format(e))
 
 if __name__ == '__main__':
     # --- 로깅 설정 ---
@@ -150,91 +832,61 @@ if __name__ == '__main__':
         lastchktime_str = getValue(config, 'lastchktime', "1970-01-01 00:00:00")
         headerline_str = getValue(config, 'headerline', '1') 
         columnline_str = getValue(config, 'columnline', '1')
+        upload_workers = max(1, int(getValue(config, 'upload_workers', 4))) # 동시에 전송할 파일 수
+        upload_retries = int(getValue(config, 'upload_retries', 3)) # 전송 실패 시 재시도 횟수
+        upload_backoff = float(getValue(config, 'upload_backoff', 2)) # 첫 재시도 대기 시간(초), 재시도마다 두 배
+        upload_timeout = float(getValue(config, 'upload_timeout', 60)) # 파일 하나의 전송 제한 시간(초)
+        index_file = getValue(config, 'index_file', "file_index.json") # 전송 완료된 파일의 지문을 기록하는 파일
+        hash_files = bool(getValue(config, 'hash_files', True)) # 크기/수정 시간이 바뀐 파일의 내용 해시 비교 여부
+        # 파일 전송 방식 (델타 전송, 압축)
+        upload_options = {
+            'timeout': upload_timeout,
+            'delta': bool(getValue(config, 'delta_upload', True)), # 이전 버전과의 차이만 전송
+            'delta_formats': getValue(config, 'delta_formats', {".csv": "append", ".dbf": "append", ".xls": "blocks"}), # 확장자 -> append/blocks
+            'block_size': int(getValue(config, 'delta_block_size', 65536)), # blocks 방식의 블록 크기(바이트)
+            'min_size': int(getValue(config, 'delta_min_size', 262144)), # 이보다 작은 파일은 항상 전체 전송
+            'block_max_size': int(getValue(config, 'delta_block_max_size', 16777216)), # 이보다 큰 파일은 blocks 방식 대신 전체 전송
+            'max_literal': float(getValue(config, 'delta_max_ratio', 0.5)), # 델타가 파일 크기의 이 비율을 넘으면 전체 전송
+            'compress': bool(getValue(config, 'upload_compress', False)), # 전송 본문 gzip 압축 (수신 서버도 이 버전 이상이어야 함)
+            'chunk_size': int(getValue(config, 'upload_chunk_size', 4194304)), # 이보다 큰 본문은 분할 업로드 (0이면 사용 안 함)
+            'batch_file_size': int(getValue(config, 'batch_file_size', 262144)), # 이보다 작은 파일은 묶어서 전송 (0이면 사용 안 함)
+            'batch_max_files': int(getValue(config, 'batch_max_files', 200)), # 묶음 하나의 최대 파일 수
+            'batch_max_bytes': int(getValue(config, 'batch_max_bytes', 16777216)) # 묶음 하나의 최대 크기(바이트)
+        }
 
-        # 마지막 확인 시간을 문자열에서 타임스탬프(float)로 변환.
+        # 마지막 확인 시간을 문자열에서 타임스탬프(float)로 변환. (인덱스에 없는 경로를 처음 스캔할 때만 사용)
         # 밀리초 포맷과 기존 포맷을 모두 지원하기 위한 예외 처리
         try:
             lastmtime_ts = datetime.datetime.strptime(lastchktime_str, '%Y-%m-%d %H:%M:%S.%f').timestamp()
         except ValueError:
             lastmtime_ts = datetime.datetime.strptime(lastchktime_str, '%Y-%m-%d %H:%M:%S').timestamp()
 
-        logging.info("설정된 시간({}) 이후로 수정된 파일을 스캔합니다...".format(lastchktime_str))
+        file_index = get_file_index(index_file)
+        scan_started = time.time()
+        logging.info("파일 인덱스({})와 비교하여 새로 생겼거나 변경된 파일을 스캔합니다...".format(index_file))
         
         # --- 3. 전송 대상 파일 목록 가져오기 ---
-        slist = get_files_to_send(scan_path_str, dataid_str, headerline_str, columnline_str, scan_file_str, lastmtime_ts)
-
-        # 중복 전송 방지: >= 비교로 인해 마지막 전송 파일이 포함될 수 있으므로, mtime이 거의 동일하면 목록에서 제거
-        # 부동소수점 정밀도 문제를 피하기 위해 작은 수(epsilon)보다 작은지 확인.
-        # lastmtime_ts가 0보다 큰 경우(즉, 초기 실행이 아닌 경우)에만 이 로직을 적용.
-        if slist and lastmtime_ts > 0 and abs(slist[0]['mtime'] - lastmtime_ts) < 0.000001:
-            logging.info(f"마지막 전송 파일과 동일하여 목록에서 제외: {os.path.basename(slist[0]['file_path'])}")
-            slist.pop(0)
+        slist = get_files_to_send(scan_path_str, dataid_str, headerline_str, columnline_str, scan_file_str, file_index, lastmtime_ts, hash_files)
 
         # --- 4. 파일 전송 처리 ---
+        failed = []
         if not slist:
             # 전송할 파일이 없는 경우.
             logging.info("새로 전송할 파일이 없습니다.")
-            # 파일이 없더라도 게이트웨이 서버에 살아있다는 신호(live check)를 보낼 수 있음 (선택 사항).
-            try:
-                params = {'deviceid': deviceid, 'dataid': "-", 'path': "-", 'orgfilename': '-', 'headerline': '-', 'columnline': '-', 'params': "deviceid,dataid,path,orgfilename,headerline,columnline"}
-                upload = {'filename': ""}
-                requests.post(url=gateway_url, timeout=10, data=params, files=upload)
-            except Exception as e:
-                logging.warning("Live-check 전송 오류: {}".format(e))
         else:
             # 전송할 파일이 있는 경우.
             logging.info("총 {}개의 새로운 파일을 발견했습니다.".format(len(slist)))
-            # 정렬된 목록(slist)을 순회하며 파일 전송.
-            for f_info in slist:
-                file_path = f_info['file_path']
-                current_dataid = f_info['dataid']
-                current_headerline = f_info['headerline']
-                current_columnline = f_info['columnline']
-                file_mtime = f_info['mtime']
-                
-                path_parts = os.path.split(file_path)
-                fname = path_parts[1]
-                
-                logging.info("파일 전송 시도: {} (수정 시간: {})".format(fname, timefmt(file_mtime)))
+            # 정렬된 목록(slist)을 동시에 전송. 실패한 파일은 백오프 후 재시도하며, 나머지 파일의 전송은 계속한다.
+            failed = send_files(slist, gateway_url, deviceid, upload_workers, upload_options, upload_retries, upload_backoff, file_index)
+
+        # 파일 전송 여부와 관계없이 게이트웨이 서버에 살아있다는 신호와 미전송 상태를 보낸다.
+        lag = time.time() - min(f_info['mtime'] for f_info in failed) if failed else 0.0
+        send_heartbeat(gateway_url, deviceid, len(failed), lag, upload_workers)
+
+        # 스캔/전송 결과를 주기마다 한 번만 인덱스 파일에 기록.
+        # 전송하지 못한 파일이 없으면 스캔을 시작한 시각, 있으면 그중 가장 오래된 파일의 수정 시간 직전까지 전송을 마친 것으로 기록
+        file_index.save(min([scan_started] + [f_info['mtime'] - 1 for f_info in failed]))
 
-                try:
-                    # 파일을 바이너리 읽기 모드('rb')로 연다.
-                    with open(file_path, 'rb') as sendfile:
-                        # requests로 보낼 파일과 파라미터를 준비.
-                        upload = {'filename': sendfile}
-                        params = {
-                            'deviceid': deviceid,
-                            'dataid': current_dataid,
-                            'path': current_dataid, # 원본 로직에 따라 path를 dataid로 설정.
-                            'orgfilename': fname,
-                            'headerline': current_headerline, # 매칭된 headerline 파라미터 추가
-                            'columnline': current_columnline,
-                            'params': "deviceid,dataid,filename,path,orgfilename,headerline,columnline"
-                        }
-
-                        # HTTP POST 요청으로 파일 전송.
-                        response = requests.post(url=gateway_url, timeout=60, data=params, files=upload)
-
-                        # --- 5. 전송 성공/실패 처리 ---
-                        if response.status_code == 200:
-                            # 전송 성공 시 (HTTP 상태 코드 200).
-                            logging.info("성공적으로 전송 완료: {}.".format(fname))
-                            
-                            # 중요: config.json의 lastchktime을 방금 보낸 파일의 수정 시간(float)으로 업데이트.
-                            update_lastchktime_in_config(file_mtime)
-
-                        else:
-                            # 전송 실패 시.
-                            logging.error("전송 실패: {}. 상태 코드: {}. 이번 주기의 추가 전송을 중단합니다.".format(fname, response.status_code))
-                            # 전송에 실패하면 현재 사이클을 중단. 다음 사이클에서 이 파일부터 다시 시도하게 됨.
-                            break
-
-                except Exception as e:
-                    # requests.post에서 발생할 수 있는 모든 예외(네트워크 오류 등)를 처리.
-                    logging.exception("파일({}) 전송 중 예외 발생. 이번 주기의 추가 전송을 중단합니다.".format(fname))
-                    # 예외 발생 시에도 현재 사이클을 중단.
-                    break
-        
         # --- 6. 다음 스캔까지 대기 ---
         logging.info("{}초 후 다음 스캔을 시작합니다...".format(scan_interval))
         time.sleep(scan_interval)
@@ -0,0 +1,26 @@
+#-*- coding: utf-8 -*-
+# conftest.py
+# 워커 모듈(fileRecv/worker), 수신 서버(fileRecv/lmfilerecv.py), 에이전트(fileSend/lmagent.py)를 실행할 때와 같은 방식(평면 import)으로 불러오도록 경로를 설정합니다.
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'fileSend'))
+sys.path.insert(0, os.path.join(ROOT, 'fileRecv'))
+# worker 폴더가 먼저 검색되어야 'worker'가 fileRecv/worker 폴더가 아닌 worker.py로 불러와짐
+sys.path.insert(0, os.path.join(ROOT, 'fileRecv', 'worker'))
+
+
+@pytest.fixture
+def worker_config():
+    """
+    워커 CONFIG(settings.CONFIG)를 테스트 동안만 바꾸고 원래 내용으로 되돌림.
+    """
+    import settings
+    saved = dict(settings.CONFIG)
+    yield settings.CONFIG
+    settings.CONFIG.clear()
+    settings.CONFIG.update(saved)
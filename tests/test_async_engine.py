@@ -0,0 +1,56 @@
+#-*- coding: utf-8 -*-
+# async_engine.py의 비동기 전송 엔진(AsyncOpcEngine) 동시 전송 파일 수 제한 테스트
+
+import asyncio
+
+import pytest
+
+import async_engine
+from async_engine import AsyncOpcEngine, get_async_engine
+
+
+@pytest.fixture
+def engine_factory():
+    if async_engine.asyncua is None:
+        pytest.skip('asyncua 미설치')
+    engines = []
+
+    def make(**kwargs):
+        engine = AsyncOpcEngine(**kwargs)
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.close()
+
+
+def test_write_workers_limits_concurrent_files(engine_factory):
+    engine = engine_factory(write_workers=2)
+    active = {'now': 0, 'max': 0}
+
+    async def fake_write_file_task(parsed, state):
+        active['now'] += 1
+        active['max'] = max(active['max'], active['now'])
+        await asyncio.sleep(0.05)
+        active['now'] -= 1
+        return [(parsed['filepath'], '2025-09-15 10:00:00')]
+
+    engine.write_file_task = fake_write_file_task
+    futures = [engine.submit({'filepath': f'f{i}'}, None) for i in range(6)]
+
+    results = [future.result(timeout=5) for future in futures]
+
+    assert results == [[(f'f{i}', '2025-09-15 10:00:00')] for i in range(6)]
+    assert active['max'] == 2
+
+
+def test_get_async_engine_uses_write_workers(engine_factory, worker_config, monkeypatch):
+    monkeypatch.setattr(async_engine, 'ASYNC_ENGINE', None)
+    worker_config.update({'opc_engine': 'async', 'write_workers': 7})
+
+    engine = get_async_engine()
+    try:
+        assert engine.write_workers == 7
+    finally:
+        engine.close()
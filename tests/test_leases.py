@@ -0,0 +1,129 @@
+#-*- coding: utf-8 -*-
+# LeaseManager의 lease 획득/만료 테스트
+
+import os
+import time
+import threading
+
+import pytest
+
+from leases import LeaseManager
+from state_store import StateStore
+
+
+@pytest.fixture
+def lease_env(tmp_path, monkeypatch):
+    # StateStore가 현재 폴더의 이전 버전 JSON 파일을 이관하지 않도록 빈 임시 폴더에서 실행
+    monkeypatch.chdir(tmp_path)
+    lease_dir = str(tmp_path / 'leases')
+    save_path = str(tmp_path / 'save')
+    os.makedirs(save_path)
+    managers = []
+    stores = []
+
+    def make(worker_id, ttl=30):
+        manager = LeaseManager(lease_dir, save_path, worker_id, ttl=ttl)
+        store = StateStore(str(tmp_path / f'{worker_id}.db'))
+        managers.append(manager)
+        stores.append(store)
+        return manager, store
+
+    yield make
+    for manager, store in zip(managers, stores):
+        manager.close(store)
+        store.close()
+
+
+def expire(path, ttl):
+    old = time.time() - ttl - 1
+    os.utime(path, (old, old))
+
+
+def test_acquire_creates_lease_and_blocks_other_worker(lease_env):
+    first, _ = lease_env('w1')
+    second, _ = lease_env('w2')
+
+    assert first._try_acquire('DEV')
+    assert first._read_lease(first._lease_path('DEV'))[0] == 'w1'
+    assert not second._try_acquire('DEV')
+    # 자신의 lease는 다시 얻을 수 있음 (갱신)
+    assert first._try_acquire('DEV')
+
+
+def test_expired_lease_is_taken_over(lease_env):
+    first, _ = lease_env('w1', ttl=30)
+    second, _ = lease_env('w2', ttl=30)
+    assert first._try_acquire('DEV')
+
+    expire(first._lease_path('DEV'), 30)
+
+    assert second._try_acquire('DEV')
+    assert second._read_lease(second._lease_path('DEV'))[0] == 'w2'
+    assert not os.path.exists(second._lease_path('DEV') + '.w2.stale')
+
+
+def test_only_one_worker_takes_over_expired_lease(lease_env):
+    old, _ = lease_env('old', ttl=30)
+    assert old._try_acquire('DEV')
+    expire(old._lease_path('DEV'), 30)
+    contenders = [lease_env(f'w{i}', ttl=30)[0] for i in range(8)]
+
+    barrier = threading.Barrier(len(contenders))
+    results = {}
+
+    def run(manager):
+        barrier.wait()
+        results[manager.worker_id] = manager._try_acquire('DEV')
+
+    threads = [threading.Thread(target=run, args=(manager,)) for manager in contenders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = [worker_id for worker_id, acquired in results.items() if acquired]
+    assert len(winners) == 1
+    assert old._read_lease(old._lease_path('DEV'))[0] == winners[0]
+
+
+def test_refresh_releases_lease_and_hands_over_state(lease_env, tmp_path):
+    first, first_store = lease_env('w1')
+    filepath = os.path.join(first.save_path, 'DEV', 'D1', 'log.csv')
+    assert first.refresh({'DEV'}, first_store) == {'DEV'}
+    first_store.commit(last_times={f'{filepath}|Sheet1': '2025-09-15 10:00:00'})
+
+    first._release(first_store, 'DEV')
+    assert not os.path.exists(first._lease_path('DEV'))
+
+    second, second_store = lease_env('w2')
+    assert second._try_acquire('DEV')
+    second._load_state(second_store, 'DEV')
+    assert second_store.get_last_time(f'{filepath}|Sheet1') == '2025-09-15 10:00:00'
+
+
+def test_renew_drops_lease_removed_by_another_worker(lease_env):
+    manager, store = lease_env('w1')
+    assert manager.refresh({'DEV'}, store) == {'DEV'}
+
+    os.remove(manager._lease_path('DEV'))
+    manager._renew('DEV')
+
+    assert manager.owned == set()
+
+
+def test_renew_thread_survives_errors(lease_env, monkeypatch):
+    manager, store = lease_env('w1', ttl=3)
+    assert manager.refresh({'DEV', 'DEV2'}, store) == {'DEV', 'DEV2'}
+
+    def broken_read(path):
+        if path.endswith('DEV.lease'):
+            raise RuntimeError('broken')
+        return ('w1', time.time())
+
+    monkeypatch.setattr(manager, '_read_lease', broken_read)
+    deadline = time.time() + 5
+    while 'DEV' in manager.owned and time.time() < deadline:
+        time.sleep(0.1)
+
+    assert manager.owned == {'DEV2'}
+    assert manager._renew_thread.is_alive()
@@ -0,0 +1,279 @@
+#-*- coding: utf-8 -*-
+# 에이전트(lmagent.py)의 파일 인덱스(FileIndex) 초기 기준과 전송 대상 스캔, 내용 해시 계산, blocks 방식 델타, 묶음 업로드 테스트
+
+import io
+import os
+import json
+import time
+import random
+import hashlib
+import tarfile
+
+import pytest
+
+import lmagent
+from lmagent import FileIndex, get_files_to_send, upload_file
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def write_file(path, data, mtime=None):
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def scan(directory, file_index, last_check_time=0, hash_files=True):
+    return get_files_to_send(str(directory), 'D1', '1', '1', '.csv', file_index, last_check_time, hash_files)
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """
+    수신 서버 대신 /opcFileSignature 조회에 signature를 돌려주고, 나머지 요청은 기록 후 200을 돌려주는 requests.Session 대용.
+    """
+
+    def __init__(self, signature):
+        self.signature = signature
+        self.posts = []
+
+    def post(self, url, timeout=None, data=None, files=None, **kwargs):
+        if url.endswith('/opcFileSignature'):
+            return FakeResponse(200, self.signature)
+        self.posts.append((url, data, files))
+        return FakeResponse(200)
+
+
+def upload_options(**overrides):
+    options = {'timeout': 5, 'delta': True, 'delta_formats': {'.csv': 'append'}, 'block_size': 64, 'min_size': 0,
+               'block_max_size': 1 << 20, 'max_literal': 0.9, 'compress': False, 'chunk_size': 0}
+    options.update(overrides)
+    return options
+
+
+# --- 파일 인덱스 초기 기준 (seed_time) ---
+
+def test_index_saves_and_loads_seed_time(tmp_path):
+    index_file = str(tmp_path / 'file_index.json')
+    file_index = FileIndex(index_file)
+    file_index.update('C:/data', 'a.csv', [1, 2, 3, None])
+
+    file_index.save(seed_time=1000.0)
+
+    loaded = FileIndex(index_file)
+    assert loaded.seed_time == 1000.0
+    assert loaded.get('C:/data', 'a.csv') == [1, 2, 3, None]
+
+
+def test_legacy_index_is_loaded_without_seed_time(tmp_path):
+    index_file = tmp_path / 'file_index.json'
+    index_file.write_text(json.dumps({'C:/data': {'a.csv': [1, 2, 3, None]}}), encoding='utf-8')
+
+    loaded = FileIndex(str(index_file))
+
+    assert loaded.seed_time is None
+    assert loaded.get('C:/data', 'a.csv') == [1, 2, 3, None]
+
+
+def test_new_scan_path_is_seeded_from_index_seed_time(tmp_path):
+    known_dir = tmp_path / 'known'
+    new_dir = tmp_path / 'new'
+    known_dir.mkdir()
+    new_dir.mkdir()
+    now = time.time()
+    write_file(new_dir / 'old.csv', b'a\n', mtime=now - 3600)
+    write_file(new_dir / 'recent.csv', b'b\n', mtime=now - 60)
+    file_index = FileIndex(str(tmp_path / 'file_index.json'))
+    file_index.update(str(known_dir), 'x.csv', [1, 2, 3, None])
+    file_index.save(seed_time=now - 600)
+
+    # lastchktime(0)이 오래전이어도, 인덱스에 기록된 seed_time 이전 파일은 전송된 것으로 기록
+    slist = scan(new_dir, file_index)
+
+    assert [f_info['name'] for f_info in slist] == ['recent.csv']
+    assert file_index.get(str(new_dir), 'old.csv') is not None
+
+
+# --- 내용 해시 계산 ---
+
+def test_new_files_are_not_hashed_during_scan(tmp_path):
+    write_file(tmp_path / 'a.csv', b'TIME,A\n')
+    file_index = FileIndex(str(tmp_path / 'file_index.json'))
+
+    [f_info] = scan(tmp_path, file_index)
+
+    assert f_info['fingerprint'][3] is None
+    assert f_info['prefix_hash'] is None
+
+
+def test_identical_content_is_not_sent(tmp_path):
+    path = tmp_path / 'a.csv'
+    write_file(path, b'TIME,A\n1,2\n')
+    file_index = FileIndex(str(tmp_path / 'file_index.json'))
+    file_index.update(str(tmp_path), 'a.csv', [path.stat().st_size, 1, path.stat().st_ino, sha1(b'TIME,A\n1,2\n')])
+
+    assert scan(tmp_path, file_index) == []
+    assert file_index.get(str(tmp_path), 'a.csv')[1] == path.stat().st_mtime_ns
+
+
+def test_changed_file_is_hashed_once_for_scan_and_append_delta(tmp_path, monkeypatch):
+    base = b'TIME,A\n' + b'2025-09-15 10:00:00,1\n' * 20
+    added = b'2025-09-15 10:00:01,2\n' * 5
+    path = tmp_path / 'a.csv'
+    write_file(path, base + added)
+    file_index = FileIndex(str(tmp_path / 'file_index.json'))
+    file_index.update(str(tmp_path), 'a.csv', [len(base), 1, path.stat().st_ino, sha1(base)])
+
+    calls = []
+    digests = lmagent.FileRanges.digests
+
+    def counting_digests(self, prefix_size=None):
+        calls.append(prefix_size)
+        return digests(self, prefix_size)
+
+    monkeypatch.setattr(lmagent.FileRanges, 'digests', counting_digests)
+
+    [f_info] = scan(tmp_path, file_index)
+    assert f_info['fingerprint'][3] == sha1(base + added)
+    assert f_info['prefix_hash'] == sha1(base)
+
+    session = FakeSession({'exists': True, 'match': True, 'size': len(base), 'sha1': sha1(base)})
+    assert upload_file(session, 'http://gateway/opcFile', 'DEV', f_info, upload_options())
+
+    # 스캔할 때 한 번만 읽어 전체 해시와 앞부분 해시를 함께 계산하고, 전송할 때는 다시 계산하지 않음
+    assert calls == [len(base)]
+    [(_, params, files)] = session.posts
+    assert params['delta'] == '1' and params['sha1'] == sha1(base + added)
+    assert files['filename'][1] == added
+
+
+def test_file_changed_after_scan_is_hashed_again(tmp_path):
+    path = tmp_path / 'a.csv'
+    write_file(path, b'TIME,A\n1,2\n')
+    file_index = FileIndex(str(tmp_path / 'file_index.json'))
+    file_index.update(str(tmp_path), 'a.csv', [1, 1, path.stat().st_ino, sha1(b'old')])
+    [f_info] = scan(tmp_path, file_index)
+
+    write_file(path, b'TIME,A\n1,2\n3,4\n')
+    session = FakeSession({'exists': False})
+    assert upload_file(session, 'http://gateway/opcFile', 'DEV', f_info, upload_options(delta=False))
+
+    [(_, params, _)] = session.posts
+    assert params['sha1'] == sha1(b'TIME,A\n1,2\n3,4\n')
+    assert f_info['fingerprint'][3] == params['sha1']
+
+
+# --- blocks 방식 델타 ---
+
+def block_signatures(data, block_size):
+    signatures = []
+    for offset in range(0, len(data), block_size):
+        a, b = lmagent.rolling_checksum(data[offset:offset + block_size])
+        signatures.append(((b << 16) | a, hashlib.md5(data[offset:offset + block_size]).hexdigest()))
+    return signatures
+
+
+def test_weak_checksum_search_matches_rolling_checksum():
+    if lmagent.np is None:
+        pytest.skip('numpy 미설치')
+    data = bytes(random.Random(1).getrandbits(8) for _ in range(3000))
+    block_size = 64
+    weaks = {}
+    for pos in range(0, len(data) - block_size + 1, 7):
+        a, b = lmagent.rolling_checksum(data[pos:pos + block_size])
+        weaks.setdefault((b << 16) | a, pos)
+
+    search = lmagent.WeakChecksumSearch(data, block_size, weaks, chunk_positions=500)
+
+    found = []
+    pos = 0
+    while True:
+        result = search.next_from(pos)
+        if result is None:
+            break
+        found.append(result)
+        pos = result[0] + 1
+    assert {weak: pos for pos, weak in reversed(found)} == weaks
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_vectorized_block_delta_matches_pure_python(seed, monkeypatch):
+    if lmagent.np is None:
+        pytest.skip('numpy 미설치')
+    rng = random.Random(seed)
+    base = bytes(rng.getrandbits(8) for _ in range(rng.randint(500, 4000)))
+    data = bytearray(base)
+    for _ in range(rng.randint(1, 4)):
+        pos = rng.randint(0, len(data))
+        if rng.random() < 0.5:
+            data[pos:pos] = bytes(rng.getrandbits(8) for _ in range(rng.randint(1, 80)))
+        else:
+            del data[pos:pos + rng.randint(1, 80)]
+    data = bytes(data)
+    blocks = block_signatures(base, 64)
+
+    vectorized = lmagent.block_delta(data, blocks, len(base), 64, len(data))
+    monkeypatch.setattr(lmagent, 'np', None)
+    pure = lmagent.block_delta(data, blocks, len(base), 64, len(data))
+
+    assert vectorized == pure
+    ops, pieces = vectorized
+    # 명령대로 다시 만들면 새 파일과 같아야 함
+    rebuilt = b''
+    literals = iter(pieces)
+    for op in ops:
+        if op[0] == 'copy':
+            rebuilt += base[op[1]:op[1] + op[2]]
+        else:
+            start, length = next(literals)
+            rebuilt += data[start:start + length]
+    assert rebuilt == data
+
+
+# --- 묶음 업로드 ---
+
+class BatchSession(FakeSession):
+    """
+    /opcFileBatch 요청의 tar 본문과 파일별 전송(/opcFile)을 기록하는 requests.Session 대용.
+    """
+
+    def __init__(self):
+        super().__init__({'exists': False})
+        self.batches = []
+
+    def post(self, url, timeout=None, data=None, files=None, **kwargs):
+        if url.endswith('/opcFileBatch'):
+            self.batches.append(data)
+            return FakeResponse(200)
+        return super().post(url, timeout=timeout, data=data, files=files, **kwargs)
+
+
+def test_batch_is_capped_at_batch_max_bytes(tmp_path):
+    file_index = FileIndex(str(tmp_path / 'file_index.json'))
+    for i, size in enumerate([300, 300, 300]):
+        write_file(tmp_path / f'{i}.csv', bytes([65 + i]) * size, mtime=time.time() - 100 + i)
+    batch = scan(tmp_path, file_index)
+    # 스캔 이후 커진 파일은 묶음에서 빼고 파일별로 전송
+    write_file(tmp_path / '1.csv', b'B' * 900)
+
+    session = BatchSession()
+    results = lmagent.upload_batch_with_retry(session, 'http://gateway/opcFile', 'DEV', batch,
+                                              upload_options(delta=False, batch_max_bytes=700), 0, 0)
+
+    assert results == [True, True, True]
+    [payload] = session.batches
+    with tarfile.open(fileobj=io.BytesIO(payload)) as archive:
+        assert [member.name for member in archive.getmembers()] == ['0/0.csv', '2/2.csv']
+    [(_, params, files)] = session.posts
+    assert params['orgfilename'] == '1.csv' and files['filename'][1] == b'B' * 900
@@ -0,0 +1,260 @@
+#-*- coding: utf-8 -*-
+# CSV/DBF 이어 읽기 위치와 TimeColumnParser, 파싱 결과 캐시(load_excel_cached) 테스트
+
+import os
+import struct
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import loaders
+from loaders import TimeColumnParser, parse_flexible_time, load_csv_data, load_dbf_data
+
+
+@pytest.fixture(autouse=True)
+def clear_time_parsers():
+    loaders.TIME_PARSER_CACHE.clear()
+    yield
+    loaders.TIME_PARSER_CACHE.clear()
+
+
+def write_csv(path, text):
+    with open(path, 'wb') as f:
+        f.write(text.encode('utf-8'))
+
+
+def append_csv(path, text):
+    with open(path, 'ab') as f:
+        f.write(text.encode('utf-8'))
+
+
+def write_dbf(path, rows):
+    """
+    TIME(문자 19), A(숫자 6) 필드를 가진 dBase III 파일을 생성.
+    """
+    fields = [(b'TIME', b'C', 19), (b'A', b'N', 6)]
+    record_length = 1 + sum(size for _, _, size in fields)
+    header_length = 32 + 32 * len(fields) + 1
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<B3BLHH20x', 3, 125, 9, 15, len(rows), header_length, record_length))
+        for name, field_type, size in fields:
+            f.write(struct.pack('<11scxxxxB15x', name, field_type, size))
+        f.write(b'\r')
+        for time_str, value in rows:
+            f.write(b' ' + time_str.ljust(19).encode() + str(value).rjust(6).encode())
+        f.write(b'\x1a')
+    return header_length, record_length
+
+
+# --- CSV 이어 읽기 ---
+
+def test_csv_resume_skips_incomplete_last_line(tmp_path):
+    path = str(tmp_path / 'log_2025-09-15.csv')
+    complete = 'TIME,A\n2025-09-15 10:00:00,1\n2025-09-15 10:00:01,2\n'
+    write_csv(path, complete + '2025-09-15 10:0')
+    resume = {}
+
+    sheets = load_csv_data(path, 'CSV1', '1', '2', resume)
+
+    assert sheets['Sheet1']['A'].tolist() == [1, 2]
+    assert resume['kind'] == 'csv'
+    assert resume['offset'] == len(complete.encode('utf-8'))
+
+
+def test_csv_resume_reads_only_appended_rows(tmp_path):
+    path = str(tmp_path / 'log_2025-09-15.csv')
+    write_csv(path, 'TIME,A\n2025-09-15 10:00:00,1\n2025-09-15 10:0')
+    resume = {}
+    load_csv_data(path, 'CSV1', '1', '2', resume)
+
+    append_csv(path, '0:01,2\n2025-09-15 10:00:02,3\n')
+    sheets = load_csv_data(path, 'CSV1', '1', '2', resume)
+
+    df = sheets['Sheet1']
+    assert df['A'].tolist() == [2, 3]
+    assert df['TIME'].tolist() == [datetime(2025, 9, 15, 10, 0, 1), datetime(2025, 9, 15, 10, 0, 2)]
+    with open(path, 'rb') as f:
+        assert resume['offset'] == len(f.read())
+
+
+def test_csv_resume_without_new_rows_returns_empty(tmp_path):
+    path = str(tmp_path / 'log_2025-09-15.csv')
+    write_csv(path, 'TIME,A\n2025-09-15 10:00:00,1\n')
+    resume = {}
+    load_csv_data(path, 'CSV1', '1', '2', resume)
+    offset = resume['offset']
+
+    assert load_csv_data(path, 'CSV1', '1', '2', resume) == {}
+    assert resume['offset'] == offset
+
+
+def test_csv_resume_restarts_when_file_replaced(tmp_path):
+    path = str(tmp_path / 'log_2025-09-15.csv')
+    write_csv(path, 'TIME,A\n2025-09-15 10:00:00,1\n2025-09-15 10:00:01,2\n')
+    resume = {}
+    load_csv_data(path, 'CSV1', '1', '2', resume)
+
+    # 같은 길이 이상이지만 앞부분 내용이 다른 파일로 교체
+    write_csv(path, 'TIME,A\n2025-09-15 11:00:00,7\n2025-09-15 11:00:01,8\n2025-09-15 11:00:02,9\n')
+    sheets = load_csv_data(path, 'CSV1', '1', '2', resume)
+
+    assert sheets['Sheet1']['A'].tolist() == [7, 8, 9]
+
+
+def test_csv_resume_with_small_read_buffer(tmp_path, monkeypatch):
+    monkeypatch.setattr(loaders, 'CSV_READ_BYTES', 7)
+    path = str(tmp_path / 'log_2025-09-15.csv')
+    write_csv(path, 'TIME,A\n' + ''.join(f'2025-09-15 10:00:{i:02d},{i}\n' for i in range(20)) + '2025-09-15 10:00:2')
+    resume = {}
+
+    sheets = load_csv_data(path, 'CSV1', '1', '2', resume)
+    assert sheets['Sheet1']['A'].tolist() == list(range(20))
+
+    append_csv(path, '0,20\n')
+    sheets = load_csv_data(path, 'CSV1', '1', '2', resume)
+    assert sheets['Sheet1']['A'].tolist() == [20]
+
+
+# --- DBF 이어 읽기 ---
+
+def test_dbf_resume_reads_only_new_records(tmp_path):
+    path = str(tmp_path / 'db_2025-09-15.dbf')
+    rows = [(f'2025-09-15 11:00:{i:02d}', i) for i in range(5)]
+    header_length, record_length = write_dbf(path, rows)
+    resume = {}
+
+    sheets = load_dbf_data(path, 'DBF1', resume)
+    assert sheets['Sheet1']['A'].tolist() == [0, 1, 2, 3, 4]
+    assert resume['kind'] == 'dbf'
+    assert resume['offset'] == header_length + 5 * record_length
+
+    rows += [(f'2025-09-15 11:00:{i:02d}', i) for i in range(5, 7)]
+    write_dbf(path, rows)
+    sheets = load_dbf_data(path, 'DBF1', resume)
+    assert sheets['Sheet1']['A'].tolist() == [5, 6]
+    assert resume['offset'] == header_length + 7 * record_length
+
+    assert load_dbf_data(path, 'DBF1', resume) == {}
+
+
+def test_dbf_resume_restarts_when_records_changed(tmp_path):
+    path = str(tmp_path / 'db_2025-09-15.dbf')
+    write_dbf(path, [(f'2025-09-15 11:00:{i:02d}', i) for i in range(3)])
+    resume = {}
+    load_dbf_data(path, 'DBF1', resume)
+
+    write_dbf(path, [(f'2025-09-15 12:00:{i:02d}', 10 + i) for i in range(4)])
+    sheets = load_dbf_data(path, 'DBF1', resume)
+
+    assert sheets['Sheet1']['A'].tolist() == [10, 11, 12, 13]
+
+
+# --- TimeColumnParser ---
+
+def per_cell(values, fdate=None):
+    return [parse_flexible_time(value, fdate) for value in values]
+
+
+def assert_same_times(parsed, expected):
+    assert len(parsed) == len(expected)
+    for actual, wanted in zip(parsed, expected):
+        if pd.isna(wanted):
+            assert pd.isna(actual)
+        else:
+            assert actual == wanted
+
+
+def test_time_parser_uniform_column_is_vectorized():
+    values = [f'2025-09-15 10:00:{i:02d}' for i in range(30)]
+    parser = TimeColumnParser()
+
+    parsed = parser.parse(pd.Series(values))
+
+    assert_same_times(parsed, per_cell(values))
+    assert parser.strategy == 1
+    assert parser.stats == {'rows': 30, 'vectorized': 30, 'fallback': 0, 'failed': 0}
+
+
+def test_time_parser_mixed_column_matches_per_cell_parsing():
+    values = [f'2025/09/15 10:{i:02d}' for i in range(25)]
+    values[3] = '25년9월15일 10시03분00초'
+    values[10] = '2025.09.15 10:10:00'
+    values[17] = 'not a time'
+    parser = TimeColumnParser()
+
+    parsed = parser.parse(pd.Series(values))
+
+    assert_same_times(parsed, per_cell(values))
+    assert parser.strategy == 1
+    assert parser.stats['vectorized'] == 22
+    assert parser.stats['fallback'] == 3
+    assert parser.stats['failed'] == 1
+
+
+def test_time_parser_uses_file_date_and_keeps_missing_rows():
+    values = ['10:00:00', None, '10:00:02']
+    parser = TimeColumnParser()
+
+    parsed = parser.parse(pd.Series(values, dtype=object), fdate='2025-09-15')
+
+    assert parsed[0] == datetime(2025, 9, 15, 10, 0, 0)
+    assert pd.isna(parsed[1])
+    assert parsed[2] == datetime(2025, 9, 15, 10, 0, 2)
+    assert parser.stats['failed'] == 1
+
+
+def test_time_parser_resniffs_after_format_change():
+    parser = TimeColumnParser()
+    parser.parse(pd.Series([f'2025-09-15 10:00:{i:02d}' for i in range(5)]))
+    assert parser.strategy == 1
+
+    korean = [f'25년9월15일 10시00분{i:02d}초' for i in range(5)]
+    parsed = parser.parse(pd.Series(korean))
+    assert_same_times(parsed, per_cell(korean))
+    assert parser.strategy is None
+
+    parser.parse(pd.Series(korean))
+    assert parser.strategy == 0
+
+
+def test_time_parser_floors_datetime_column():
+    values = pd.Series(pd.to_datetime(['2025-09-15 10:00:00.700', '2025-09-15 10:00:01.200']))
+
+    parsed = TimeColumnParser().parse(values)
+
+    assert parsed.tolist() == [pd.Timestamp('2025-09-15 10:00:00'), pd.Timestamp('2025-09-15 10:00:01')]
+
+
+@pytest.mark.parametrize('fdate', [None, '2025-09-15'])
+def test_column_preprocessing_matches_per_cell_preprocessing(fdate):
+    values = ['25년9월15일 10시03분00초', '2025/09/15 10:03', '10:03:00', '2025.09.15 10:10:00', '25.09.15 10:10:00',
+              '2025-09-15 10:00:00.500', 'not a time', '']
+    strings = pd.Series(values)
+
+    for preprocess, _, preprocess_column in loaders.TIME_PARSING_STRATEGIES:
+        assert preprocess_column(strings, fdate).tolist() == [preprocess(value, fdate) for value in values]
+
+
+# --- 파싱 결과 캐시 ---
+
+def test_frame_cache_stores_all_rows_and_filters_since(tmp_path, monkeypatch, worker_config):
+    if loaders.pyarrow is None:
+        pytest.skip('pyarrow 미설치')
+    monkeypatch.setattr(loaders, 'FRAME_CACHE', None)
+    worker_config['frame_cache_dir'] = str(tmp_path / 'cache')
+    path = str(tmp_path / 'log.xlsx')
+    pd.DataFrame({'TIME': [f'2025-09-15 10:00:0{i}' for i in range(4)], 'A': range(4)}).to_excel(path, index=False)
+    since = lambda sheet_name: datetime(2025, 9, 15, 10, 0, 1)
+
+    first = loaders.load_excel_cached(path, 'D1', '1', '2', since)
+    # 일부 행이 처리된 상태로 처음 읽어도 모든 행을 캐시하고, 캐시에서 읽을 때도 처리된 행은 제외
+    cached = loaders.FRAME_CACHE.load(loaders.FRAME_CACHE.make_key(path, os.stat(path), ['1', '2', 'streaming']))
+    second = loaders.load_excel_cached(path, 'D1', '1', '2', since)
+    unfiltered = loaders.load_excel_cached(path, 'D1', '1', '2')
+
+    assert first['Sheet1']['A'].tolist() == [2, 3]
+    assert cached['Sheet1']['A'].tolist() == [0, 1, 2, 3]
+    assert second['Sheet1']['A'].tolist() == [2, 3]
+    assert unfiltered['Sheet1']['A'].tolist() == [0, 1, 2, 3]
+    assert loaders.load_excel_cached(path, 'D1', '1', '2', lambda sheet_name: datetime(2025, 9, 15, 10, 0, 3)) == {}
@@ -0,0 +1,274 @@
+#-*- coding: utf-8 -*-
+# opc_writer.py의 배치 전송(write_values_batched/WriteBatcher)와 마지막 전송 값 캐시(LastValueCache), 태그 맵(TagRegistry) 테스트
+
+import pandas as pd
+import pytest
+from opcua import ua
+
+import opc_writer
+from opc_writer import TagRegistry, LastValueCache, write_values_batched
+from encoders import encode_dataframe, iter_row_writes
+
+
+class FakeUaClient:
+    """
+    Write/Read 요청을 기록하고, NodeId 문자열별로 지정한 StatusCode(기본 Good)를 돌려주는 client.uaclient 대용.
+    """
+
+    def __init__(self, statuses=None, error=None):
+        self.statuses = statuses or {}
+        self.error = error
+        self.requests = []
+
+    def write(self, params):
+        nodeids = [wv.NodeId.to_string() for wv in params.NodesToWrite]
+        self.requests.append([(nodeid, wv.Value.Value.Value) for nodeid, wv in zip(nodeids, params.NodesToWrite)])
+        if self.error is not None:
+            raise self.error
+        return [ua.StatusCode(self.statuses.get(nodeid, ua.StatusCodes.Good)) for nodeid in nodeids]
+
+    def read(self, params):
+        nodeids = [rv.NodeId.to_string() for rv in params.NodesToRead]
+        self.requests.append(nodeids)
+        return [ua.DataValue(status=ua.StatusCode(self.statuses.get(nodeid, ua.StatusCodes.Good)))
+                for nodeid in nodeids]
+
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        self.uaclient = FakeUaClient(**kwargs)
+
+
+@pytest.fixture(autouse=True)
+def tag_registry(monkeypatch):
+    registry = TagRegistry(missing_ttl=600)
+    monkeypatch.setattr(opc_writer, 'TAG_REGISTRY', registry)
+    return registry
+
+
+def sheet_rows(row_count):
+    df = pd.DataFrame({
+        'TIME': pd.date_range('2025-09-15 10:00:00', periods=row_count, freq='s'),
+        'A': range(row_count),
+        'B': [i * 0.5 for i in range(row_count)],
+    })
+    return list(iter_row_writes(encode_dataframe('D1', 'Sheet1', df), 0, row_count))
+
+
+# --- 배치 전송 ---
+
+def test_time_is_written_last_in_each_row():
+    client = FakeClient()
+
+    write_values_batched(client, sheet_rows(4), batch_size=1000)
+
+    [request] = client.uaclient.requests
+    nodeids = [nodeid for nodeid, _ in request]
+    assert nodeids == ['ns=2;s=D1.A', 'ns=2;s=D1.B', 'ns=2;s=D1.TIME'] * 4
+    assert request[2][1] == '2025-09-15 10:00:00'
+
+
+def test_rows_are_never_split_across_batches():
+    client = FakeClient()
+
+    ok, fail = write_values_batched(client, sheet_rows(5), batch_size=7)
+
+    assert (ok, fail) == (15, 0)
+    # 행당 3개 값이므로 7개 한도에서는 두 행(6개)씩 전송
+    assert [len(request) for request in client.uaclient.requests] == [6, 6, 3]
+    for request in client.uaclient.requests:
+        assert [nodeid for nodeid, _ in request][2::3] == ['ns=2;s=D1.TIME'] * (len(request) // 3)
+
+
+def test_write_batch_size_is_respected():
+    client = FakeClient()
+
+    write_values_batched(client, sheet_rows(10), batch_size=3)
+
+    assert [len(request) for request in client.uaclient.requests] == [3] * 10
+
+
+def test_row_larger_than_batch_size_is_split_in_order():
+    client = FakeClient()
+    row = [(f'ns=2;s=D1.C{i}', str(i)) for i in range(5)] + [('ns=2;s=D1.TIME', '2025-09-15 10:00:00')]
+
+    write_values_batched(client, [row], batch_size=4)
+
+    assert [len(request) for request in client.uaclient.requests] == [4, 2]
+    assert [value for request in client.uaclient.requests for _, value in request] == [value for _, value in row]
+
+
+def test_bad_status_codes_are_counted_and_reported(capsys, tag_registry):
+    statuses = {'ns=2;s=D1.A': ua.StatusCodes.BadTypeMismatch, 'ns=2;s=D1.B': ua.StatusCodes.BadNodeIdUnknown}
+    client = FakeClient(statuses=statuses)
+
+    ok, fail = write_values_batched(client, sheet_rows(2), batch_size=1000)
+
+    assert (ok, fail) == (2, 4)
+    output = capsys.readouterr().out
+    assert 'NodeId ns=2;s=D1.A 처리 중 오류' in output
+    assert output.count('태그 ns=2;s=D1.B가 서버에 없습니다') == 1
+    # 서버에 없는 태그는 이후 전송에서 생략
+    client.uaclient.requests.clear()
+    write_values_batched(client, sheet_rows(1), batch_size=1000)
+    assert [nodeid for nodeid, _ in client.uaclient.requests[0]] == ['ns=2;s=D1.A', 'ns=2;s=D1.TIME']
+
+
+def test_service_error_fails_batch_and_continues(capsys):
+    client = FakeClient(error=ua.UaStatusCodeError(ua.StatusCodes.BadTooManyOperations))
+
+    ok, fail = write_values_batched(client, sheet_rows(4), batch_size=6)
+
+    assert (ok, fail) == (0, 12)
+    assert len(client.uaclient.requests) == 2
+    assert capsys.readouterr().out.count('Write 요청(6개 태그) 처리 중 오류') == 2
+
+
+# --- 마지막 전송 값 캐시 (report_by_exception) ---
+
+def test_first_write_is_always_sent():
+    cache = LastValueCache()
+    client = FakeClient()
+
+    ok, _ = write_values_batched(client, sheet_rows(1), batch_size=1000, value_cache=cache)
+
+    assert ok == 3
+    assert cache.get('ns=2;s=D1.A') == '0'
+
+
+def test_unchanged_values_are_skipped_but_time_is_sent():
+    cache = LastValueCache()
+    client = FakeClient()
+    row = [('ns=2;s=D1.A', '1'), ('ns=2;s=D1.TIME', '2025-09-15 10:00:00')]
+    write_values_batched(client, [row], batch_size=1000, value_cache=cache)
+    client.uaclient.requests.clear()
+
+    ok, _ = write_values_batched(client, [row, row], batch_size=1000, value_cache=cache)
+
+    assert ok == 2
+    assert [nodeid for nodeid, _ in client.uaclient.requests[0]] == ['ns=2;s=D1.TIME', 'ns=2;s=D1.TIME']
+    assert cache.stats == {'written': 4, 'skipped': 2}
+
+
+def test_deadband_applies_only_to_float_columns():
+    cache = LastValueCache(deadband=0.5)
+
+    assert cache.is_unchanged('ns=2;s=D1.B', '10.4', '10', is_float=True)
+    assert not cache.is_unchanged('ns=2;s=D1.B', '10.6', '10', is_float=True)
+    assert not cache.is_unchanged('ns=2;s=D1.A', '10.4', '10', is_float=False)
+    assert not cache.is_unchanged('ns=2;s=D1.B', '10.4', None, is_float=True)
+
+
+def test_deadband_percent_is_relative_to_previous_value():
+    cache = LastValueCache(deadband_percent=1)
+
+    assert cache.is_unchanged('ns=2;s=D1.B', '100.9', '100', is_float=True)
+    assert not cache.is_unchanged('ns=2;s=D1.B', '101.5', '100', is_float=True)
+
+
+def test_failed_write_is_not_remembered():
+    cache = LastValueCache()
+    client = FakeClient(statuses={'ns=2;s=D1.A': ua.StatusCodes.BadTypeMismatch})
+    row = [('ns=2;s=D1.A', '1'), ('ns=2;s=D1.TIME', '2025-09-15 10:00:00')]
+    write_values_batched(client, [row], batch_size=1000, value_cache=cache)
+    client.uaclient.statuses.clear()
+    client.uaclient.requests.clear()
+
+    write_values_batched(client, [row], batch_size=1000, value_cache=cache)
+
+    assert [nodeid for nodeid, _ in client.uaclient.requests[0]] == ['ns=2;s=D1.A', 'ns=2;s=D1.TIME']
+
+
+def test_value_cache_forgets_least_recently_used():
+    cache = LastValueCache(max_size=2)
+    cache.update('a', '1')
+    cache.update('b', '2')
+    cache.get('a')
+    cache.update('c', '3')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.get('c') == '3'
+
+
+def test_backfill_bypasses_value_cache(worker_config):
+    worker_config.update({'backfill_age': 3600, 'backfill_method': 'write'})
+    now = pd.Timestamp.now().floor('s')
+    times = [pd.Timestamp('2025-09-15 10:00:00') + pd.Timedelta(seconds=i) for i in range(3)] + [now, now + pd.Timedelta(seconds=1)]
+    df = pd.DataFrame({'TIME': times, 'A': [1] * 5})
+    sheet = {'sheet_name': 'Sheet1', 'columns': encode_dataframe('D1', 'Sheet1', df), 'times': df['TIME'].to_numpy(),
+             'float_nodeids': set()}
+    cache = LastValueCache()
+    cache.update('ns=2;s=D1.A', '1')
+    client = FakeClient()
+
+    opc_writer.send_sheet(client, 'opc.tcp://server', sheet, 1000, value_cache=cache)
+
+    backfill, live = client.uaclient.requests
+    # 이력 값은 같은 값이 반복되어도 모두 전송하고, 이어지는 실시간 행은 캐시를 비운 뒤 처음 값부터 다시 비교
+    assert [nodeid for nodeid, _ in backfill] == ['ns=2;s=D1.A', 'ns=2;s=D1.TIME'] * 3
+    assert [nodeid for nodeid, _ in live] == ['ns=2;s=D1.A', 'ns=2;s=D1.TIME', 'ns=2;s=D1.TIME']
+
+
+# --- 태그 맵 (없는 태그 캐시) ---
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(opc_writer.time, 'time', fake.time)
+    return fake
+
+
+def test_missing_tag_is_skipped_until_ttl_expires(clock, capsys):
+    registry = TagRegistry(missing_ttl=60)
+    assert registry.resolve('ns=2;s=D1.A') is not None
+
+    registry.mark_missing('ns=2;s=D1.A', 'BadNodeIdUnknown')
+    clock.now += 59
+    assert registry.resolve('ns=2;s=D1.A') is None
+    assert registry.resolve('ns=2;s=D1.A') is None
+
+    clock.now += 2
+    assert registry.resolve('ns=2;s=D1.A') == ua.NodeId.from_string('ns=2;s=D1.A')
+    registry.report()
+    output = capsys.readouterr().out
+    assert 'ns=2;s=D1.A(2)' in output
+
+
+def test_missing_tag_warning_is_printed_once(clock, capsys):
+    registry = TagRegistry(missing_ttl=60)
+
+    registry.mark_missing('ns=2;s=D1.A', 'BadNodeIdUnknown')
+    clock.now += 61
+    registry.mark_missing('ns=2;s=D1.A', 'BadNodeIdUnknown')
+
+    assert capsys.readouterr().out.count('태그 ns=2;s=D1.A가 서버에 없습니다') == 1
+
+
+def test_invalid_nodeid_is_never_retried(clock):
+    registry = TagRegistry(missing_ttl=60)
+
+    assert registry.resolve('not a nodeid') is None
+    clock.now += 10 ** 6
+    assert registry.resolve('not a nodeid') is None
+
+
+def test_compile_validates_each_tag_map_once(clock):
+    registry = TagRegistry(missing_ttl=60)
+    client = FakeClient(statuses={'ns=2;s=D1.B': ua.StatusCodes.BadNodeIdUnknown})
+    nodeids = ['ns=2;s=D1.A', 'ns=2;s=D1.B', 'ns=2;s=D1.TIME']
+
+    registry.compile(client, 'D1', 'Sheet1', nodeids, validate=True, batch_size=2)
+    registry.compile(client, 'D1', 'Sheet1', nodeids, validate=True, batch_size=2)
+
+    assert client.uaclient.requests == [nodeids[:2], nodeids[2:]]
+    assert registry.resolve('ns=2;s=D1.B') is None
+    assert registry.resolve('ns=2;s=D1.A') is not None
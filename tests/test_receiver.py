@@ -0,0 +1,222 @@
+#-*- coding: utf-8 -*-
+# 수신 서버(lmfilerecv.py)의 묶음 업로드(/opcFileBatch)와 분할 업로드(/opcUpload), 시작 시 임시 파일 정리 테스트
+
+import io
+import os
+import json
+import gzip
+import hashlib
+import tarfile
+
+import pytest
+
+import lmfilerecv
+
+
+@pytest.fixture
+def client(tmp_path):
+    saved = dict(lmfilerecv.CONFIG)
+    lmfilerecv.CONFIG.clear()
+    lmfilerecv.CONFIG['save_path'] = str(tmp_path)
+    yield lmfilerecv.app.test_client()
+    lmfilerecv.CONFIG.clear()
+    lmfilerecv.CONFIG.update(saved)
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def make_batch(files, compress=False):
+    """
+    (파라미터 dict, 내용) 목록을 lmagent와 같은 형식(pax 헤더 LM.params)의 tar 본문으로 만듦.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=tarfile.PAX_FORMAT) as archive:
+        for params, data in files:
+            info = tarfile.TarInfo(params['orgfilename'])
+            info.size = len(data)
+            info.pax_headers = {'LM.params': json.dumps(params)}
+            archive.addfile(info, io.BytesIO(data))
+    body = buffer.getvalue()
+    return gzip.compress(body) if compress else body
+
+
+def saved_path(tmp_path, params):
+    return os.path.join(str(tmp_path), params['deviceid'], params['dataid'], params['orgfilename'])
+
+
+def leftover_temp_files(tmp_path):
+    return [name for _, _, names in os.walk(str(tmp_path)) for name in names if name.endswith(('.tmp', '.bak'))]
+
+
+# --- 묶음 업로드 ---
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_batch_saves_all_files_with_params(client, tmp_path, compress):
+    files = [({'deviceid': 'DEV', 'dataid': 'D1', 'orgfilename': f'log{i}.csv', 'headerline': '1'}, f'TIME,A\n{i}\n'.encode())
+             for i in range(3)]
+    for params, data in files:
+        params['sha1'] = sha1(data)
+
+    response = client.post('/opcFileBatch' + ('?encoding=gzip' if compress else ''), data=make_batch(files, compress))
+
+    assert response.status_code == 200
+    assert response.get_json() == {'success': True, 'saved': 3}
+    for params, data in files:
+        path = saved_path(tmp_path, params)
+        with open(path, 'rb') as f:
+            assert f.read() == data
+        with open(path + '.json', 'r', encoding='utf-8') as f:
+            # 전송용 필드(sha1)는 파라미터 .json에 저장하지 않음
+            assert json.load(f) == {key: value for key, value in params.items() if key != 'sha1'}
+    assert leftover_temp_files(tmp_path) == []
+
+
+def test_batch_with_bad_file_replaces_nothing(client, tmp_path):
+    good = ({'deviceid': 'DEV', 'dataid': 'D1', 'orgfilename': 'a.csv'}, b'new a\n')
+    bad = ({'deviceid': 'DEV', 'dataid': 'D1', 'orgfilename': 'b.csv'}, b'new b\n')
+    good[0]['sha1'] = sha1(good[1])
+    bad[0]['sha1'] = sha1(b'something else')
+    existing = saved_path(tmp_path, good[0])
+    os.makedirs(os.path.dirname(existing))
+    with open(existing, 'wb') as f:
+        f.write(b'old a\n')
+
+    response = client.post('/opcFileBatch', data=make_batch([good, bad]))
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    with open(existing, 'rb') as f:
+        assert f.read() == b'old a\n'
+    assert not os.path.exists(saved_path(tmp_path, bad[0]))
+    assert leftover_temp_files(tmp_path) == []
+
+
+def test_batch_rejects_missing_params(client, tmp_path):
+    files = [({'deviceid': 'DEV', 'orgfilename': 'a.csv'}, b'data\n')]
+
+    response = client.post('/opcFileBatch', data=make_batch(files))
+
+    assert response.status_code == 400
+    assert leftover_temp_files(tmp_path) == []
+
+
+# --- 분할 업로드 ---
+
+PARAMS = {'deviceid': 'DEV', 'dataid': 'D1', 'orgfilename': 'big.csv'}
+PAYLOAD = b''.join(f'2025-09-15 10:00:{i % 60:02d},{i}\n'.encode() for i in range(200))
+
+
+def open_upload(client, payload=PAYLOAD):
+    response = client.post('/opcUpload', data=dict(PARAMS, size=str(len(payload)), payload_sha1=sha1(payload)))
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def put_chunk(client, upload_id, offset, chunk, chunk_sha1=None):
+    headers = {'X-Chunk-SHA1': chunk_sha1 or sha1(chunk)}
+    return client.put(f'/opcUpload/{upload_id}?offset={offset}', data=chunk, headers=headers)
+
+
+def test_chunked_upload_resumes_and_commits(client, tmp_path):
+    opened = open_upload(client)
+    upload_id = opened['upload_id']
+    assert opened['offset'] == 0
+    half = len(PAYLOAD) // 2
+
+    response = put_chunk(client, upload_id, 0, PAYLOAD[:half])
+    assert response.get_json()['offset'] == half
+
+    # 다시 열면(연결 끊김, 재시작) 같은 업로드 ID와 확인된 위치를 돌려받음
+    reopened = open_upload(client)
+    assert reopened['upload_id'] == upload_id
+    assert reopened['offset'] == half
+    assert client.get(f'/opcUpload/{upload_id}').get_json()['offset'] == half
+
+    response = put_chunk(client, upload_id, half, PAYLOAD[half:])
+    assert response.get_json()['offset'] == len(PAYLOAD)
+
+    response = client.post(f'/opcUpload/{upload_id}/commit')
+    assert response.status_code == 200
+    with open(saved_path(tmp_path, PARAMS), 'rb') as f:
+        assert f.read() == PAYLOAD
+    with open(saved_path(tmp_path, PARAMS) + '.json', 'r', encoding='utf-8') as f:
+        assert json.load(f) == PARAMS
+    assert client.get(f'/opcUpload/{upload_id}').status_code == 404
+
+
+def test_chunk_at_wrong_offset_returns_current_offset(client):
+    upload_id = open_upload(client)['upload_id']
+    put_chunk(client, upload_id, 0, PAYLOAD[:100])
+
+    response = put_chunk(client, upload_id, 50, PAYLOAD[50:150])
+
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 100
+
+
+def test_corrupt_chunk_is_discarded(client):
+    upload_id = open_upload(client)['upload_id']
+    put_chunk(client, upload_id, 0, PAYLOAD[:100])
+
+    response = put_chunk(client, upload_id, 100, PAYLOAD[100:200], chunk_sha1=sha1(b'other'))
+
+    assert response.status_code == 400
+    assert response.get_json()['offset'] == 100
+    assert client.get(f'/opcUpload/{upload_id}').get_json()['offset'] == 100
+
+
+def test_chunk_beyond_declared_size_is_rejected(client):
+    upload_id = open_upload(client)['upload_id']
+
+    response = put_chunk(client, upload_id, 0, PAYLOAD + b'extra')
+
+    assert response.status_code == 400
+    assert client.get(f'/opcUpload/{upload_id}').get_json()['offset'] == 0
+
+
+def test_commit_before_all_chunks_received(client, tmp_path):
+    upload_id = open_upload(client)['upload_id']
+    put_chunk(client, upload_id, 0, PAYLOAD[:100])
+
+    response = client.post(f'/opcUpload/{upload_id}/commit')
+
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 100
+    assert not os.path.exists(saved_path(tmp_path, PARAMS))
+
+
+def test_commit_with_payload_mismatch_drops_upload(client, tmp_path):
+    payload = b'x' * len(PAYLOAD)
+    response = client.post('/opcUpload', data=dict(PARAMS, size=str(len(payload)), payload_sha1=sha1(PAYLOAD)))
+    upload_id = response.get_json()['upload_id']
+    put_chunk(client, upload_id, 0, payload)
+
+    response = client.post(f'/opcUpload/{upload_id}/commit')
+
+    assert response.status_code == 409
+    assert not os.path.exists(saved_path(tmp_path, PARAMS))
+    assert client.get(f'/opcUpload/{upload_id}').status_code == 404
+
+
+# --- 시작 시 임시 파일 정리 ---
+
+def test_cleanup_removes_stale_staged_files(tmp_path, monkeypatch):
+    folder = tmp_path / 'DEV' / 'D1'
+    folder.mkdir(parents=True)
+    (folder / 'log.csv').write_bytes(b'new')
+    (folder / 'log.csv.99999.1.0.tmp.bak').write_bytes(b'old')
+    (folder / 'log.csv.json.99999.1.1.tmp').write_bytes(b'{}')
+    own = folder / f'run.csv.{os.getpid()}.1.tmp'
+    own.write_bytes(b'writing')
+    uploads = tmp_path / '.uploads'
+    uploads.mkdir()
+    (uploads / 'x.99999.1.tmp').write_bytes(b'')
+    monkeypatch.setattr(lmfilerecv, 'is_process_alive', lambda pid: pid == os.getpid())
+
+    assert lmfilerecv.cleanup_staged_files(str(tmp_path)) == 2
+
+    assert sorted(os.listdir(folder)) == sorted(['log.csv', own.name])
+    # .으로 시작하는 폴더(분할 업로드 등)는 건드리지 않음
+    assert os.listdir(uploads) == ['x.99999.1.tmp']
@@ -0,0 +1,110 @@
+#-*- coding: utf-8 -*-
+# scheduler.py의 공정 스케줄러(FairScheduler)와 전송 속도 제한(RateLimiter) 테스트
+
+import os
+
+import pytest
+
+import scheduler
+from scheduler import FairScheduler, RateLimiter, get_source, lookup_source_setting, get_rate_limiter
+
+
+def make_tasks(source, count, start_mtime=0):
+    return [{'source': source, 'mtime_ns': start_mtime + i, 'name': f'{source[1]}-{i}'} for i in range(count)]
+
+
+def drain(fair, release=True):
+    order = []
+    while True:
+        task = fair.next_task()
+        if task is None:
+            return order
+        order.append(task['name'])
+        if release:
+            fair.task_done(task)
+
+
+def test_get_source_and_setting_lookup():
+    path = os.path.join('save', 'DEV', 'D1', 'log.csv')
+    assert get_source(path) == ('DEV', 'D1')
+
+    settings = {'D1': 2, 'DEV/D1': 5, 'D2': 3}
+    assert lookup_source_setting(settings, ('DEV', 'D1')) == 5
+    assert lookup_source_setting(settings, ('OTHER', 'D1')) == 2
+    assert lookup_source_setting(settings, ('DEV', 'D9'), 1) == 1
+    assert lookup_source_setting(None, ('DEV', 'D1'), 1) == 1
+
+
+def test_sources_are_interleaved_oldest_first():
+    backlog = make_tasks(('DEV', 'BIG'), 5)
+    live = make_tasks(('DEV', 'LIVE'), 2, start_mtime=100)
+    fair = FairScheduler(list(reversed(backlog)) + live)
+
+    order = drain(fair)
+
+    # 대량 파일이 밀린 소스가 있어도 다른 소스의 파일이 번갈아 처리되며, 소스 안에서는 오래된 파일부터
+    assert order[:4] == ['BIG-0', 'LIVE-0', 'BIG-1', 'LIVE-1']
+    assert order[4:] == ['BIG-2', 'BIG-3', 'BIG-4']
+    assert len(fair) == 0
+
+
+def test_weights_change_selection_ratio():
+    heavy = make_tasks(('DEV', 'HEAVY'), 6)
+    light = make_tasks(('DEV', 'LIGHT'), 6)
+    fair = FairScheduler(heavy + light, weights={'HEAVY': 2})
+
+    first_six = drain(fair)[:6]
+
+    assert sum(name.startswith('HEAVY') for name in first_six) == 4
+    assert sum(name.startswith('LIGHT') for name in first_six) == 2
+
+
+def test_max_inflight_caps_each_source():
+    fair = FairScheduler(make_tasks(('DEV', 'A'), 3) + make_tasks(('DEV', 'B'), 1), max_inflight=1)
+
+    started = drain(fair, release=False)
+    assert sorted(started) == ['A-0', 'B-0']
+    assert fair.next_task() is None
+
+    fair.task_done({'source': ('DEV', 'A')})
+    assert fair.next_task()['name'] == 'A-1'
+    assert fair.next_task() is None
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(scheduler.time, 'time', fake.time)
+    return fake
+
+
+def test_rate_limiter_allows_burst_then_waits(clock):
+    limiter = RateLimiter(100)
+
+    assert limiter.reserve(100) == 0
+    assert limiter.reserve(50) == pytest.approx(0.5)
+    clock.now += 1.5
+    # 1.5초 동안 150개가 채워져 앞선 부족분(50)을 갚고 100개(최대)까지 회복
+    assert limiter.reserve(100) == 0
+
+
+def test_rate_limiter_is_shared_per_source(worker_config):
+    worker_config['rate_limits'] = {'D1': 10}
+    scheduler.RATE_LIMITERS.clear()
+
+    first = get_rate_limiter(('DEV', 'D1'))
+    assert first is get_rate_limiter(('DEV', 'D1'))
+    assert first.rate == 10
+    assert get_rate_limiter(('DEV', 'D2')) is None
+
+    worker_config['rate_limits'] = {'D1': 20}
+    assert get_rate_limiter(('DEV', 'D1')).rate == 20
+    scheduler.RATE_LIMITERS.clear()
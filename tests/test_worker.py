@@ -0,0 +1,72 @@
+#-*- coding: utf-8 -*-
+# worker.py의 이벤트 기반 깨우기(SavePathEventHandler) 테스트
+
+import os
+import time
+
+import pytest
+
+import worker
+from leases import LeaseManager
+from state_store import StateStore
+
+
+@pytest.fixture
+def pending():
+    worker.take_pending_paths()
+    yield
+    worker.take_pending_paths()
+
+
+def wait_for_wakeup(timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if worker.WAKEUP_EVENT.is_set():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_is_hidden_path(tmp_path):
+    save_path = str(tmp_path)
+
+    assert not worker.is_hidden_path(os.path.join(save_path, 'DEV', 'D1', 'log.csv'), save_path)
+    assert worker.is_hidden_path(os.path.join(save_path, '.leases', 'workers', 'w1'), save_path)
+    assert worker.is_hidden_path(os.path.join(save_path, '.leases', 'DEV.state.json'), save_path)
+    assert worker.is_hidden_path(os.path.join(save_path, '.uploads', 'abc.part'), save_path)
+    assert worker.is_hidden_path(os.path.join(str(tmp_path.parent), 'elsewhere.lease'), save_path)
+
+
+def test_lease_activity_does_not_wake_event_loop(tmp_path, monkeypatch, pending):
+    if worker.Observer is None:
+        pytest.skip('watchdog 미설치')
+    monkeypatch.chdir(tmp_path)
+    save_path = str(tmp_path / 'save')
+    data_dir = os.path.join(save_path, 'DEV', 'D1')
+    os.makedirs(data_dir)
+    observer = worker.start_fs_watcher(save_path)
+    manager = None
+    store = StateStore(str(tmp_path / 'state.db'))
+    try:
+        # lease_dir 기본값(save_path/.leases)에서 한 사이클 동안 일어나는 기록: heartbeat, lease 생성/갱신, 상태 내보내기
+        manager = LeaseManager(os.path.join(save_path, '.leases'), save_path, 'w1', ttl=30)
+        assert manager.refresh({'DEV'}, store) == {'DEV'}
+        os.utime(manager._lease_path('DEV'))
+        manager.save_state(store, {'DEV'})
+        os.makedirs(os.path.join(save_path, '.uploads'))
+        with open(os.path.join(save_path, '.uploads', 'abc.part'), 'wb') as f:
+            f.write(b'chunk')
+
+        assert not wait_for_wakeup(1.0)
+
+        data_path = os.path.join(data_dir, 'log.csv')
+        with open(data_path, 'w', encoding='utf-8') as f:
+            f.write('TIME,A\n')
+        assert wait_for_wakeup(5.0)
+        assert data_path in worker.take_pending_paths()
+    finally:
+        observer.stop()
+        observer.join()
+        if manager is not None:
+            manager.close(store)
+        store.close()